@@ -1,38 +1,68 @@
-import os
+import numpy as np
 import pandas as pd
 import streamlit as st
+from price_store import get_index, load_indexes, source_path
 
-# 动态获取当前脚本（api.py）所在目录作为数据目录
-BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+def _report_load_error(code, e):
+    if isinstance(e, FileNotFoundError):
+        st.error(f"文件不存在：{source_path(code)}")
+    else:
+        st.error(f"读取失败（{code}）：{e}")
 
-@st.cache_data
-def get_price_data(codes, start_date, end_date):
-    result = {}
-    sd = pd.to_datetime(start_date).date()
-    ed = pd.to_datetime(end_date).date()
+def get_price_series(code, start_date, end_date):
+    """
+    返回标的在 [start_date, end_date] 内的 PriceSeries(dates, close, ret, log_ret)。
+    各字段为 NumPy 只读视图（dates 为 datetime64[D]），收益率已预先算好，
+    调用方无需再格式化/解析日期或重算 pct_change。
+    读取失败时在页面上提示并返回 None。
+    """
+    # 不按 (code, start_date, end_date) 缓存结果：每个标的在进程内只保留一份索引，
+    # 任意日期区间都从同一份数据上切片，内存不随会话数和区间数增长
+    try:
+        # 读取进程级价格索引（源文件变化时自动重建），不再逐次解析 xlsx
+        index = get_index(code)
+    except Exception as e:
+        _report_load_error(code, e)
+        return None
+    # 日期已升序，二分定位区间，得到的是索引数据的视图
+    return index.series(start_date, end_date)
 
-    for code in codes:
-        base = code.split('.')[0]
-        # 相对路径拼接
-        path = os.path.join(BASE_PATH, f"{base}_daily.xlsx")
+def get_price_frame(code, start_date, end_date):
+    """
+    返回以 DatetimeIndex 为索引、包含 close / ret / log_ret 列的 DataFrame。
+    读取失败时返回 None。
+    """
+    series = get_price_series(code, start_date, end_date)
+    if series is None:
+        return None
+    return pd.DataFrame(
+        {"close": series.close, "ret": series.ret, "log_ret": series.log_ret},
+        index=pd.DatetimeIndex(series.dates, name="date"),
+    )
 
-        if not os.path.exists(path):
-            st.error(f"文件不存在：{path}")
-            result[code] = []
-            continue
+def get_price_series_many(codes, start_date, end_date):
+    """
+    并发加载多个标的，返回 {code: PriceSeries}。
+    加载失败的标的不会中断其他标的，错误在全部加载结束后逐个提示，对应值为 None。
+    """
+    indexes, errors = load_indexes(codes)
+    for code, e in errors.items():
+        _report_load_error(code, e)
+    return {
+        code: indexes[code].series(start_date, end_date) if code in indexes else None
+        for code in codes
+    }
 
-        try:
-            df = pd.read_excel(path, usecols=['date', 'close'], engine="openpyxl")
-        except Exception as e:
-            st.error(f"读取失败：{e}")
+def get_price_data(codes, start_date, end_date):
+    """兼容旧接口：返回 {code: [{'date': 'YYYY-MM-DD', 'close': float}, ...]}"""
+    result = {}
+
+    for code, series in get_price_series_many(codes, start_date, end_date).items():
+        if series is None:
             result[code] = []
             continue
-
-        df['date'] = pd.to_datetime(df['date']).dt.date
-        df = df[(df['date']>=sd)&(df['date']<=ed)].sort_values('date')
         result[code] = [
-            {'date':d.strftime('%Y-%m-%d'),'close':float(c) if pd.notna(c) else None}
-            for d,c in zip(df['date'],df['close'])
+            {'date':str(d),'close':float(c) if not np.isnan(c) else None}
+            for d,c in zip(series.dates,series.close)
         ]
     return result
-
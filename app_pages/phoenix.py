@@ -1,72 +1,30 @@
 import datetime
+import os
+import time
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-from api import get_price_data
-
-def calculate_phoenix_payoff(
-    final_price_level, start_price, notional_principal,
-    knock_in_pct, knock_in_strike_pct, participation_rate, max_loss_ratio,
-    dividend_barrier_pct, obs_dividend_dates, obs_dividend_rates,
-    obs_barriers, # 敲出障碍用于判断敲出区
-    product_term_in_years # 新增参数：产品总期限（年）
-):
-    """
-    计算凤凰结构产品在期末价格为 final_price_level 时的理论年化收益率。
-    注意：这里的计算是基于产品运行到期末（或敲出）的情况，并假设期间派息条件均满足。
-    实际派息是分期进行的，此处为理论汇总。
-    """
-    relative_price = final_price_level / start_price
-    
-    # 计算在理论曲线中，所有可能获得的派息总额（如果条件满足）
-    total_potential_dividend_amount = 0
-    for rate in obs_dividend_rates:
-        total_potential_dividend_amount += notional_principal * rate
-
-    final_total_cash_payoff = 0 # 最终的总收益金额
-
-    # 1. 敲出区：如果期末价格达到或超过最后一个敲出障碍
-    last_obs_barrier_pct = obs_barriers[-1] if obs_barriers else 1.0 # 使用最晚敲出障碍
-    if relative_price >= last_obs_barrier_pct:
-        # 凤凰产品敲出通常是返还本金，收益为已收到的派息总和
-        # 理论曲线上，如果达到敲出障碍，视为已获得所有派息
-        final_total_cash_payoff = total_potential_dividend_amount
-    
-    # 2. 敲入区：如果期末价格低于或等于敲入障碍
-    elif relative_price <= knock_in_pct:
-        raw_loss_pct = max(0.0, knock_in_strike_pct - relative_price)
-        capped_loss_pct = min(raw_loss_pct, max_loss_ratio)
-        total_loss_amount = capped_loss_pct * notional_principal * participation_rate
-        # 敲入后，派息停止。总收益为负值 (本金损失)
-        # 这里假设一旦敲入，即使之前有派息，也忽略其对最终收益的贡献，只看本金损失
-        # 这是理论曲线的简化，实际中已派息不会收回
-        final_total_cash_payoff = -total_loss_amount
-        
-    # 3. 无敲出，无敲入区 (中间区域)
-    else: # knock_in_pct < relative_price < last_obs_barrier_pct
-        if relative_price >= dividend_barrier_pct:
-            # 如果最终价格高于派息障碍，假设所有派息都收到了
-            final_total_cash_payoff = total_potential_dividend_amount
-        else:
-            # 如果最终价格低于派息障碍但高于敲入障碍，未敲入也未派息，收益为0 (收回本金)
-            final_total_cash_payoff = 0.0
-
-    # 将总收益金额转换为年化收益率
-    # 避免除以零的情况
-    if notional_principal == 0 or product_term_in_years == 0:
-        return 0.0
-    
-    annualized_return_pct = (final_total_cash_payoff / notional_principal) / product_term_in_years * 100
-    return annualized_return_pct
-
+from api import get_price_series
+from trading_calendar import get_calendar
+from engine.snowball import price_path
+from engine.phoenix import evaluate_phoenix
+from engine.backtest import backtest_phoenix
+from engine.bootstrap import MEAN_BLOCK, BootstrapModel, extend_returns, history_log_returns
+from engine.montecarlo import MEMORY_BUDGET_MB, GBMModel, phoenix_product, price_phoenix_mc
+from engine.coupon_solver import simulate_phoenix, solve_fair_coupon
+from engine.greeks import GREEKS_PATHS, greeks_surface
+from engine.payoff import phoenix_coupons, phoenix_payoff
+from engine.pde import N_SPACE, price_phoenix_pde
+from engine.products import PhoenixSpec
+from engine.schedule import FREQUENCIES, ROLLS, observation_schedule, parse_dates, parse_percents, step_down_barriers
+from engine.qmc import SobolGBMModel, convergence_report
 
 def plot_phoenix_payoff(params):
     """
     绘制凤凰结构产品理论年化收益率曲线。
     params: 包含所有必要参数的字典
     """
-    notional_principal = params["notional_principal"]
     start_price = params["start_price"]
     knock_in_pct = params["knock_in_pct"]
     knock_in_strike_pct = params["knock_in_strike_pct"]
@@ -79,57 +37,40 @@ def plot_phoenix_payoff(params):
     obs_barriers = params["obs_barriers"]
     product_term_in_years = params["product_term_in_years"] # 新增参数
 
-    if not obs_dates or not obs_dividend_dates:
+    if not len(obs_dates) or not len(obs_dividend_dates):
         st.warning("缺少敲出观察日或派息观察日列表，无法绘制理论收益曲线。")
         return
 
     # 获取最晚敲出障碍百分比，用于定义敲出区边界
-    last_obs_barrier_pct = obs_barriers[-1] if obs_barriers else 1.0
+    last_obs_barrier_pct = obs_barriers[-1] if len(obs_barriers) else 1.0
 
     # 确定价格范围，确保覆盖所有关键障碍点
     min_price_factor = min(knock_in_pct * 0.8, dividend_barrier_pct * 0.8, 0.5)
     max_price_factor = max(last_obs_barrier_pct * 1.2, 1.5)
     price_range = np.linspace(start_price * min_price_factor, start_price * max_price_factor, 500)
 
-    # 初始化用于不同区域的列表
-    knock_in_region_x, knock_in_region_y = [], []
-    no_event_paid_region_x, no_event_paid_region_y = [], []
-    no_event_unpaid_region_x, no_event_unpaid_region_y = [], []
-    knock_out_region_x, knock_out_region_y = [], []
-
-    for p in price_range:
-        annualized_payoff_pct = calculate_phoenix_payoff(
-            p, start_price, notional_principal,
-            knock_in_pct, knock_in_strike_pct, participation_rate, max_loss_ratio,
-            dividend_barrier_pct, obs_dividend_dates, obs_dividend_rates,
-            obs_barriers, product_term_in_years
-        )
-
-        relative_price = p / start_price # 再次计算相对价格用于判断区域
-        if relative_price >= last_obs_barrier_pct:
-            knock_out_region_x.append(p)
-            knock_out_region_y.append(annualized_payoff_pct)
-        elif relative_price <= knock_in_pct:
-            knock_in_region_x.append(p)
-            knock_in_region_y.append(annualized_payoff_pct)
-        else: # knock_in_pct < relative_price < last_obs_barrier_pct
-            if relative_price >= dividend_barrier_pct:
-                no_event_paid_region_x.append(p)
-                no_event_paid_region_y.append(annualized_payoff_pct)
-            else:
-                no_event_unpaid_region_x.append(p)
-                no_event_unpaid_region_y.append(annualized_payoff_pct)
+    # 派息汇总量只计算一次，整条价格轴的收益与区域一次求值
+    relative_price = price_range / start_price
+    payoff, region = phoenix_payoff(
+        relative_price, phoenix_coupons(obs_dividend_rates), knock_in_pct, knock_in_strike_pct,
+        participation_rate, max_loss_ratio, dividend_barrier_pct, last_obs_barrier_pct, product_term_in_years
+    )
+    payoff = payoff * 100
+    knock_in_region_x, knock_in_region_y = price_range[region == 0], payoff[region == 0]
+    no_event_unpaid_region_x, no_event_unpaid_region_y = price_range[region == 1], payoff[region == 1]
+    no_event_paid_region_x, no_event_paid_region_y = price_range[region == 2], payoff[region == 2]
+    knock_out_region_x, knock_out_region_y = price_range[region == 3], payoff[region == 3]
 
     fig = go.Figure()
 
     # 绘制各区域曲线
-    if knock_in_region_x:
+    if len(knock_in_region_x):
         fig.add_trace(go.Scatter(x=knock_in_region_x, y=knock_in_region_y, mode='lines', name='敲入区 (亏损)', line=dict(width=3, color='red')))
-    if no_event_unpaid_region_x:
+    if len(no_event_unpaid_region_x):
         fig.add_trace(go.Scatter(x=no_event_unpaid_region_x, y=no_event_unpaid_region_y, mode='lines', name='无事件区 (无收益)', line=dict(width=3, color='gray')))
-    if no_event_paid_region_x:
+    if len(no_event_paid_region_x):
         fig.add_trace(go.Scatter(x=no_event_paid_region_x, y=no_event_paid_region_y, mode='lines', name='无事件区 (派息)', line=dict(width=3, color='blue')))
-    if knock_out_region_x:
+    if len(knock_out_region_x):
         fig.add_trace(go.Scatter(x=knock_out_region_x, y=knock_out_region_y, mode='lines', name='敲出区 (派息)', line=dict(width=3, color='green')))
 
     # 添加关键的垂直和水平线
@@ -148,9 +89,8 @@ def plot_phoenix_payoff(params):
     fig.add_hline(y=0, line_dash="solid", line_color="black", line_width=1, annotation_text="0% 年化收益率 (盈亏平衡)", annotation_position="top right")
 
     # 获取所有有效的收益值来调整注释Y轴位置
-    all_payoffs = [val for sublist in [knock_in_region_y, no_event_paid_region_y, no_event_unpaid_region_y, knock_out_region_y] for val in sublist if val is not None]
-    if all_payoffs:
-        min_y, max_y = min(all_payoffs), max(all_payoffs)
+    if len(payoff):
+        min_y, max_y = payoff.min(), payoff.max()
     else:
         min_y, max_y = -50, 50 # 默认值以防列表为空
 
@@ -162,8 +102,8 @@ def plot_phoenix_payoff(params):
 
     # 添加区域注释和收益率
     # 敲出区注释
-    if knock_out_region_x:
-        avg_payoff = np.mean(knock_out_region_y) if knock_out_region_y else 0
+    if len(knock_out_region_x):
+        avg_payoff = np.mean(knock_out_region_y)
         fig.add_annotation(
             x=knock_out_region_x[0] + (knock_out_region_x[-1] - knock_out_region_x[0]) / 2,
             y=avg_payoff, # 取该区域的收益值
@@ -174,8 +114,8 @@ def plot_phoenix_payoff(params):
         )
     
     # 无事件区（已派息）注释
-    if no_event_paid_region_x:
-        avg_payoff = np.mean(no_event_paid_region_y) if no_event_paid_region_y else 0
+    if len(no_event_paid_region_x):
+        avg_payoff = np.mean(no_event_paid_region_y)
         fig.add_annotation(
             x=no_event_paid_region_x[0] + (no_event_paid_region_x[-1] - no_event_paid_region_x[0]) / 2,
             y=avg_payoff, # 取该区域的收益值
@@ -186,8 +126,8 @@ def plot_phoenix_payoff(params):
         )
     
     # 无事件区（未派息）注释
-    if no_event_unpaid_region_x:
-        avg_payoff = np.mean(no_event_unpaid_region_y) if no_event_unpaid_region_y else 0
+    if len(no_event_unpaid_region_x):
+        avg_payoff = np.mean(no_event_unpaid_region_y)
         fig.add_annotation(
             x=no_event_unpaid_region_x[0] + (no_event_unpaid_region_x[-1] - no_event_unpaid_region_x[0]) / 2,
             y=avg_payoff, # 通常为0
@@ -198,7 +138,7 @@ def plot_phoenix_payoff(params):
         )
     
     # 敲入区注释
-    if knock_in_region_x:
+    if len(knock_in_region_x):
         fig.add_annotation(
             x=knock_in_region_x[0] + (knock_in_region_x[-1] - knock_in_region_x[0]) / 2,
             y=annotation_y_pos_low, # 动态调整位置
@@ -217,6 +157,178 @@ def plot_phoenix_payoff(params):
     st.plotly_chart(fig, use_container_width=True)
 
 
+def plot_payoff_heatmap(params, axis, resolution):
+    """
+    在 期末价格 × 参数 的二维网格上绘制理论年化收益热力图（整个网格一次向量化求值）。
+    axis: "敲入障碍"、"每期派息率"（按各期派息率相同计）或 "敲入前派息期数"（路径相关口径：
+          敲入区计入敲入前已派发的各期派息）；resolution: 价格方向的格点数（参数方向同，派息期数除外）
+    """
+    start_price = params["start_price"]
+    knock_in_pct = params["knock_in_pct"]
+    dividend_barrier_pct = params["dividend_barrier_pct"]
+    obs_dividend_rates = np.asarray(params["obs_dividend_rates"], dtype=np.float64)
+    obs_barriers = params["obs_barriers"]
+    last_obs_barrier_pct = obs_barriers[-1] if len(obs_barriers) else 1.0
+    coupons = phoenix_coupons(obs_dividend_rates)
+
+    min_price_factor = min(knock_in_pct * 0.8, dividend_barrier_pct * 0.8, 0.5)
+    max_price_factor = max(last_obs_barrier_pct * 1.2, 1.5)
+    price_range = np.linspace(start_price * min_price_factor, start_price * max_price_factor, resolution)
+    relative_price = (price_range / start_price)[None, :]
+
+    knock_in_grid, paid_periods, scale = knock_in_pct, None, 1.0
+    if axis == "敲入障碍":
+        axis_values = np.linspace(0.4, last_obs_barrier_pct, resolution)
+        current = knock_in_pct
+        knock_in_grid = axis_values[:, None]
+    elif axis == "每期派息率":
+        current = obs_dividend_rates.mean() if len(obs_dividend_rates) else 0.0
+        axis_values = np.linspace(0.0, max(2 * current, 0.03), resolution)
+        coupons = phoenix_coupons(np.ones(len(obs_dividend_rates)))
+        scale = axis_values[:, None]
+    else:
+        axis_values = np.arange(len(obs_dividend_rates) + 1)
+        current = None
+        paid_periods = axis_values[:, None]
+
+    payoff, _ = phoenix_payoff(
+        relative_price, coupons, knock_in_grid, params["knock_in_strike_pct"], params["participation_rate"],
+        params["max_loss_ratio"], dividend_barrier_pct, last_obs_barrier_pct, params["product_term_in_years"],
+        paid_periods, scale
+    )
+    # 派息期数轴不是百分比
+    axis_scale, axis_unit, axis_format = (1, "期", ".0f") if paid_periods is not None else (100, "%", ".2f")
+    payoff = np.broadcast_to(payoff * 100, (len(axis_values), resolution)).astype(np.float32)
+
+    fig = go.Figure(go.Heatmap(
+        x=price_range, y=axis_values * axis_scale, z=payoff,
+        colorscale="RdYlGn", zmid=0, colorbar=dict(title="年化收益率 (%)"),
+        hovertemplate="期末价格: %{x:.2f}<br>" + axis + ": %{y:" + axis_format + "}" + axis_unit + "<br>年化收益率: %{z:.2f}%<extra></extra>",
+    ))
+    if current is not None:
+        fig.add_hline(y=current * 100, line_dash="dash", line_color="black",
+                      annotation_text=f"当前{axis}({current * 100:.2f}%)", annotation_position="top left")
+    fig.add_vline(x=start_price, line_dash="dot", line_color="grey")
+    fig.update_layout(
+        title=f"理论年化收益率热力图：期末价格 × {axis}（{len(axis_values)} × {resolution}）",
+        xaxis_title="期末价格 (点位)",
+        yaxis_title=f"{axis} ({axis_unit})",
+        template="plotly_white",
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def plot_rolling_backtest(params):
+    """
+    以标的历史上每一个交易日为起始日回测同一款凤凰产品，展示派息收入与本金亏损的分布。
+    params: 包含产品日程（交易日下标）与收益参数的字典
+    """
+    notional_principal = params["notional_principal"]
+    product = params["product"]
+    # 存续期按最后一个交易日计（观察日落在非交易日时顺延）
+    result, stats = backtest_phoenix(
+        params["underlying_code"], **product.args,
+        term_in_years=product.day_years[-1], day_years=product.day_years,
+        first_start=params["first_start"], last_start=params["last_start"],
+    )
+    if stats["windows"] == 0:
+        st.warning("所选区间内没有完整覆盖产品期限的历史窗口，无法回测。")
+        return
+
+    def fmt_quantiles(q, scale, unit):
+        return " / ".join(f"{q[k]*scale:.2f}{unit}" for k in sorted(q))
+
+    st.write(
+        f"- 回测起始日数量：{stats['windows']} 个（{result.start_dates[0]} 至 {result.start_dates[-1]}）  \n"
+        f"- 敲出比例：{stats['knock_out_rate']*100:.2f}%  \n"
+        f"- 敲入比例（未敲出且敲入）：{stats['knock_in_rate']*100:.2f}%  \n"
+        f"- 到期未敲入未敲出比例：{stats['hold_rate']*100:.2f}%  \n"
+        f"- 平均已派息期数：{stats['mean_coupons_paid']:.2f} 期，平均未派息期数：{stats['mean_coupons_missed']:.2f} 期  \n"
+        f"- 平均派息收入：{stats['mean_coupon_income']*notional_principal:.2f} 万元，"
+        f"分位数 (5%/25%/50%/75%/95%)：{fmt_quantiles(stats['coupon_income_quantiles'], notional_principal, ' 万元')}  \n"
+        f"- 本金亏损比例：{stats['principal_loss_rate']*100:.2f}%，平均本金亏损：{stats['mean_principal_loss']*notional_principal:.2f} 万元，"
+        f"分位数 (5%/25%/50%/75%/95%)：{fmt_quantiles(stats['principal_loss_quantiles'], notional_principal, ' 万元')}  \n"
+        f"- 平均年化收益率：{stats['mean_annual_return']*100:.2f}%，"
+        f"分位数 (5%/25%/50%/75%/95%)：{fmt_quantiles(stats['annual_return_quantiles'], 100, '%')}  \n"
+        f"- 平均存续期：{stats['mean_life_years']:.2f} 年"
+    )
+
+    start_dates = pd.DatetimeIndex(result.start_dates)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=start_dates, y=result.coupon_income * notional_principal,
+                             mode="lines", name="派息收入", line=dict(color="blue")))
+    fig.add_trace(go.Scatter(x=start_dates, y=-result.principal_loss * notional_principal,
+                             mode="lines", name="本金亏损", line=dict(color="red")))
+    fig.add_trace(go.Scatter(x=start_dates, y=result.payoff * notional_principal,
+                             mode="lines", name="总收益", line=dict(color="black", width=1)))
+    fig.add_hline(y=0, line_dash="solid", line_color="black", line_width=1)
+    fig.update_layout(title="各起始日的派息收入与本金亏损", xaxis_title="起始日",
+                      yaxis_title="金额 (万元)", template="plotly_white", hovermode="x unified")
+    st.plotly_chart(fig, use_container_width=True)
+
+    fig_hist = go.Figure()
+    fig_hist.add_trace(go.Histogram(x=result.coupon_income * notional_principal, name="派息收入",
+                                    marker_color="blue", opacity=0.6, nbinsx=40))
+    lost = result.principal_loss > 0
+    if lost.any():
+        fig_hist.add_trace(go.Histogram(x=-result.principal_loss[lost] * notional_principal, name="本金亏损",
+                                        marker_color="red", opacity=0.6, nbinsx=40))
+    fig_hist.update_layout(title="派息收入与本金亏损分布", xaxis_title="金额 (万元)",
+                           yaxis_title="起始日数量", barmode="overlay", template="plotly_white")
+    st.plotly_chart(fig_hist, use_container_width=True)
+
+
+def plot_convergence(report, notional_principal):
+    """
+    展示不同路径生成方式的标准误随路径数的变化（对数坐标）。
+    report: engine.qmc.convergence_report 返回的 DataFrame
+    """
+    table = report.copy()
+    table["价格 (万元)"] = table.pop("价格") * notional_principal
+    table["标准误 (bp)"] = table.pop("标准误") * 1e4
+    st.dataframe(table, hide_index=True)
+
+    fig = go.Figure()
+    for name, rows in report.groupby("模型", sort=False):
+        fig.add_trace(go.Scatter(x=rows["路径数"], y=rows["标准误"] * 1e4, mode="lines+markers", name=name))
+    fig.update_layout(title="标准误 vs 路径数", xaxis_title="路径数", yaxis_title="标准误 (bp 名义本金)",
+                      xaxis_type="log", yaxis_type="log", template="plotly_white")
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def plot_greeks_surface(surface, product_dates, notional_principal):
+    """展示 标的价格 × 估值日 的价值与希腊字母曲面（每个指标一个标签页）"""
+    dates = [pd.Timestamp(product_dates[d]).strftime("%Y-%m-%d") for d in surface.days]
+    views = [
+        ("价值", surface.value * notional_principal, "万元"),
+        ("Delta", surface.delta * notional_principal / 100, "万元 / 标的涨 1%"),
+        ("Gamma", surface.gamma * notional_principal / 1e4, "万元 / (1%)²"),
+        ("Vega", surface.vega * notional_principal / 100, "万元 / 波动率 +1%"),
+        ("Theta", surface.theta * notional_principal, "万元 / 交易日"),
+    ]
+    for tab, (name, z, unit) in zip(st.tabs([name for name, _, _ in views]), views):
+        with tab:
+            fig = go.Figure(go.Surface(x=surface.spots * 100, y=dates, z=z, colorscale="RdBu", reversescale=True))
+            fig.update_layout(title=f"{name} 曲面 ({unit})", template="plotly_white", height=600,
+                              scene=dict(xaxis_title="标的价格 (% 期初价)", yaxis_title="估值日", zaxis_title=unit))
+            st.plotly_chart(fig, use_container_width=True)
+
+
+def plot_pde_profile(result, notional_principal):
+    """展示 PDE 第 0 天价值随期初价格的变化（未敲入 / 已敲入两层）"""
+    keep = (result.spots >= 0.4) & (result.spots <= 1.6)
+    fig = go.Figure()
+    for col, name in enumerate(["未敲入", "已敲入"]):
+        fig.add_trace(go.Scatter(
+            x=result.spots[keep] * 100, y=result.values[keep, col] * notional_principal,
+            mode="lines", name=name,
+        ))
+    fig.add_vline(x=100, line_dash="dash", line_color="gray")
+    fig.update_layout(title="收益现值 vs 标的价格 (PDE)", xaxis_title="标的价格 (% 期初价)",
+                      yaxis_title="收益现值 (万元)", template="plotly_white")
+    st.plotly_chart(fig, use_container_width=True)
+
+
 def render():
     st.title("👑凤凰结构产品收益模拟👑")
 
@@ -237,79 +349,128 @@ def render():
     knock_in_style      = st.selectbox("敲入观察方式", ["每日观察","到期观察"], index=0)
     
     
-    # 派息观察日列表
-    obs_dividend_dates_input = st.text_area(
-        "派息观察日列表 (YYYY/MM/DD，用逗号或换行分隔)",
-        "2025/06/20,2025/07/21,2025/08/20,2025/09/22,2025/10/20\n"
-        "2025/11/20,2025/12/22,2026/01/20,2026/02/24,2026/03/20\n"
-        "2026/04/20,2026/05/20,2026/06/22,2026/07/20,2026/08/20\n"
-        "2026/09/21,2026/10/20,2026/11/20,2026/12/21,2027/01/20\n"
-        "2027/02/22,2027/03/22,2027/04/20,2027/05/20"
-    )
-    # 每月绝对派息率输入
-    obs_dividend_rates_input = st.text_area(
-        "每月绝对派息率 (%) 列表 (与派息观察日一一对应)",
-        "\n".join(["1.16%"]*24)
-    )
-    # 敲出观察日列表
-    obs_dates_input         = st.text_area(
-        "敲出观察日列表 (YYYY/MM/DD，用逗号或换行分隔)",
-        "2025/08/20,2025/09/22,2025/10/20,2025/11/20,2025/12/22\n"
-        "2026/01/20,2026/02/24,2026/03/20,2026/04/20,2026/05/20\n"
-        "2026/06/22,2026/07/20,2026/08/20,2026/09/21,2026/10/20\n"
-        "2026/11/20,2026/12/21,2027/01/20,2027/02/22,2027/03/22\n"
-        "2027/04/20,2027/05/20"
-    )
-    # 敲出障碍价格列表
-    obs_barriers_input      = st.text_area(
-        "敲出障碍价格 (%) 列表 (与观察日一一对应)",
-        "\n".join([
-            "100.00%","99.50%","99.00%","98.50%","98.00%","97.50%","97.00%","96.50%","96.00%","95.50%",
-            "95.00%","94.50%","94.00%","93.50%","93.00%","92.50%","92.00%","91.50%","91.00%","90.50%",
-            "90.00%","89.50%"
-        ])
-    )
+    schedule_mode           = st.selectbox("派息与敲出日程", ["手动输入", "按规则生成"], index=0)
+    if schedule_mode == "按规则生成":
+        # 派息日与敲出观察日按同一频率平移产品开始日，敲出另有锁定期；非交易日按交易日历调整
+        schedule_term       = int(st.number_input("产品期限 (月)", value=24, min_value=1, max_value=120))
+        schedule_freq       = st.selectbox("观察频率", list(FREQUENCIES), index=0)
+        schedule_roll       = st.selectbox("非交易日调整", list(ROLLS), index=0)
+        schedule_rate       = st.number_input("每期派息率 (%)", value=1.16, min_value=0.0) / 100.0
+        schedule_lockout    = int(st.number_input("敲出锁定期 (月，之前不观察敲出)", value=3, min_value=0, max_value=120))
+        barrier_initial     = st.number_input("首期敲出障碍价格 (%)", value=100.0, min_value=0.0, max_value=200.0) / 100.0
+        barrier_step        = st.number_input("每期障碍下调 (%)", value=0.5, min_value=0.0, max_value=10.0, step=0.5) / 100.0
+        barrier_floor       = st.number_input("最低敲出障碍价格 (%)", value=0.0, min_value=0.0, max_value=200.0) / 100.0
+    else:
+        # 派息观察日列表
+        obs_dividend_dates_input = st.text_area(
+            "派息观察日列表 (YYYY/MM/DD，用逗号或换行分隔)",
+            "2025/06/20,2025/07/21,2025/08/20,2025/09/22,2025/10/20\n"
+            "2025/11/20,2025/12/22,2026/01/20,2026/02/24,2026/03/20\n"
+            "2026/04/20,2026/05/20,2026/06/22,2026/07/20,2026/08/20\n"
+            "2026/09/21,2026/10/20,2026/11/20,2026/12/21,2027/01/20\n"
+            "2027/02/22,2027/03/22,2027/04/20,2027/05/20"
+        )
+        # 每月绝对派息率输入
+        obs_dividend_rates_input = st.text_area(
+            "每月绝对派息率 (%) 列表 (与派息观察日一一对应)",
+            "\n".join(["1.16%"]*24)
+        )
+        # 敲出观察日列表
+        obs_dates_input         = st.text_area(
+            "敲出观察日列表 (YYYY/MM/DD，用逗号或换行分隔)",
+            "2025/08/20,2025/09/22,2025/10/20,2025/11/20,2025/12/22\n"
+            "2026/01/20,2026/02/24,2026/03/20,2026/04/20,2026/05/20\n"
+            "2026/06/22,2026/07/20,2026/08/20,2026/09/21,2026/10/20\n"
+            "2026/11/20,2026/12/21,2027/01/20,2027/02/22,2027/03/22\n"
+            "2027/04/20,2027/05/20"
+        )
+        # 敲出障碍价格列表
+        obs_barriers_input      = st.text_area(
+            "敲出障碍价格 (%) 列表 (与观察日一一对应)",
+            "\n".join([
+                "100.00%","99.50%","99.00%","98.50%","98.00%","97.50%","97.00%","96.50%","96.00%","95.50%",
+                "95.00%","94.50%","94.00%","93.50%","93.00%","92.50%","92.00%","91.50%","91.00%","90.50%",
+                "90.00%","89.50%"
+            ])
+        )
 
     start_price             = st.number_input("产品期初价格 (点位/%)", value=100.0, min_value=0.0)
     sim_start_date          = st.date_input(
         "模拟数据开始日期 (用于历史模拟)",
         value=pd.to_datetime("2022-03-01").date()
     )
+    show_heatmap            = st.checkbox("收益热力图：期末价格 × 参数", value=False)
+    if show_heatmap:
+        heatmap_axis        = st.selectbox("热力图纵轴", ["敲入障碍", "每期派息率", "敲入前派息期数"], index=0)
+        heatmap_resolution  = int(st.number_input("热力图分辨率 (每个方向的格点数)", value=1000, min_value=50, max_value=2000, step=50))
+    run_backtest            = st.checkbox("滚动回测：以历史上每一个交易日为起始日评估本产品", value=False)
+    if run_backtest:
+        backtest_first      = st.date_input("回测起始日 (最早)", value=pd.to_datetime("2015-01-05").date())
+        backtest_last       = st.date_input("回测起始日 (最晚)", value=pd.to_datetime("2025-05-19").date())
+    run_mc                  = st.checkbox("蒙特卡洛定价", value=False)
+    if run_mc:
+        mc_model            = st.selectbox("路径生成方式", ["几何布朗运动", "拟蒙特卡洛 (Sobol + 布朗桥)", "历史区块自助法"], index=0)
+        if mc_model == "历史区块自助法":
+            mc_mean_block   = st.number_input("平均块长 (交易日)", value=MEAN_BLOCK, min_value=1, max_value=250)
+        mc_control_variate = False
+        if mc_model != "历史区块自助法":
+            mc_control_variate = st.checkbox("控制变量法 (敲入亏损 ↔ 欧式看跌价差)", value=False)
+        mc_vol              = st.number_input("年化波动率 (%)", value=20.0, min_value=0.1, max_value=200.0) / 100.0
+        mc_rate             = st.number_input("无风险利率 (%)", value=2.0, min_value=-10.0, max_value=20.0) / 100.0
+        mc_div_yield        = st.number_input("标的分红率 (%)", value=0.0, min_value=-10.0, max_value=20.0) / 100.0
+        mc_paths            = int(st.number_input("模拟路径数", value=100000, min_value=1000, max_value=2000000, step=10000))
+        mc_target_bp        = st.number_input("目标标准误 (bp，0 为按路径数运行)", value=0.0, min_value=0.0, max_value=1000.0)
+        mc_time_budget      = st.number_input("时间预算 (秒，0 为不限)", value=0.0, min_value=0.0, max_value=600.0)
+        mc_seed             = int(st.number_input("随机数种子", value=2025, min_value=0))
+        mc_memory_mb        = st.number_input("模拟内存上限 (MB)", value=MEMORY_BUDGET_MB, min_value=16, max_value=8192)
+        mc_float32          = st.checkbox("单精度路径 (float32，节省内存)", value=False)
+        mc_workers          = int(st.number_input("并行进程数", value=1, min_value=1, max_value=os.cpu_count() or 1))
+        mc_convergence      = st.checkbox("收敛性报告 (标准误 vs 路径数)", value=False)
+        mc_fair_coupon      = st.checkbox("求解公允票息 (按面值)", value=False)
+
+    run_pde             = st.checkbox("有限差分 (PDE) 定价与希腊字母", value=False)
+    if run_pde:
+        pde_vol         = st.number_input("PDE 年化波动率 (%)", value=20.0, min_value=0.1, max_value=200.0) / 100.0
+        pde_rate        = st.number_input("PDE 无风险利率 (%)", value=2.0, min_value=-10.0, max_value=20.0) / 100.0
+        pde_div_yield   = st.number_input("PDE 标的分红率 (%)", value=0.0, min_value=-10.0, max_value=20.0) / 100.0
+        pde_nodes       = int(st.number_input("空间网格节点数", value=N_SPACE, min_value=101, max_value=6401, step=100))
+
+    run_greeks          = st.checkbox("希腊字母曲面 (共同随机数)", value=False)
+    if run_greeks:
+        greeks_vol      = st.number_input("曲面 年化波动率 (%)", value=20.0, min_value=0.1, max_value=200.0) / 100.0
+        greeks_rate     = st.number_input("曲面 无风险利率 (%)", value=2.0, min_value=-10.0, max_value=20.0) / 100.0
+        greeks_div_yield = st.number_input("曲面 标的分红率 (%)", value=0.0, min_value=-10.0, max_value=20.0) / 100.0
+        greeks_paths    = int(st.number_input("曲面 模拟路径数", value=GREEKS_PATHS, min_value=1000, max_value=200000, step=5000))
+        greeks_seed     = int(st.number_input("曲面 随机数种子", value=2025, min_value=0))
 
     # 等待按钮触发
     if not st.button("生成分析图表"):
         st.info("请填写完参数后，点击“生成分析图表”")
         return
 
-    # ---- 解析文本输入 ----
-    def parse_date_list(s: str):
-        out = []
-        for x in s.replace("\n",",").split(","):
-            x = x.strip()
-            if not x: continue
-            try:
-                out.append(pd.to_datetime(x).date())
-            except:
-                continue
-        return out
-
-    def parse_pct_list(s: str):
-        out = []
-        for x in s.replace("\n",",").split(","):
-            x = x.strip().rstrip("%")
-            if not x: continue
-            try:
-                out.append(float(x)/100.0)
-            except:
-                continue
-        return out
-
-    # 解析后的派息列表
-    obs_dividend_dates        = parse_date_list(obs_dividend_dates_input)
-    obs_dividend_rates        = parse_pct_list(obs_dividend_rates_input)
-    # 解析后的敲出列表
-    obs_dates                 = parse_date_list(obs_dates_input)
-    obs_barriers              = parse_pct_list(obs_barriers_input)
+    # ---- 派息与敲出日程：整体解析文本列表（非法项报告位置），或按规则生成 ----
+    try:
+        if schedule_mode == "按规则生成":
+            calendar                  = get_calendar()
+            every_months              = FREQUENCIES[schedule_freq]
+            obs_dividend_dates        = observation_schedule(
+                calendar, start_date, schedule_term, every_months, 0, ROLLS[schedule_roll]
+            )
+            obs_dividend_rates        = np.full(len(obs_dividend_dates), schedule_rate)
+            obs_dates                 = observation_schedule(
+                calendar, start_date, schedule_term, every_months, schedule_lockout, ROLLS[schedule_roll]
+            )
+            obs_barriers              = step_down_barriers(len(obs_dates), barrier_initial, barrier_step, barrier_floor)
+        else:
+            # 解析后的派息列表
+            obs_dividend_dates        = parse_dates(obs_dividend_dates_input)
+            obs_dividend_rates        = parse_percents(obs_dividend_rates_input)
+            # 解析后的敲出列表
+            obs_dates                 = parse_dates(obs_dates_input)
+            obs_barriers              = parse_percents(obs_barriers_input)
+    except ValueError as e:
+        st.error(f"派息与敲出日程有误：{e}")
+        return
 
     # 校验长度
     if len(obs_dividend_dates) != len(obs_dividend_rates):
@@ -320,7 +481,7 @@ def render():
         return
 
     # 计算产品总期限（年）
-    if obs_dates:
+    if len(obs_dates):
         product_term_in_years = (pd.to_datetime(obs_dates[-1]) - pd.to_datetime(start_date)).days / 365.0
         if product_term_in_years <= 0: # 避免除以零或负数期限
             st.error("产品总期限必须大于0年，请检查产品开始日期和敲出观察日列表。")
@@ -329,11 +490,25 @@ def render():
         st.error("请至少输入一个敲出观察日以确定产品期限。")
         return
 
+    # 产品条款只构造一次，后续各引擎共用其编译结果
+    spec = PhoenixSpec(
+        start_date, obs_dates, obs_barriers, obs_dividend_dates, obs_dividend_rates,
+        dividend_barrier_pct, knock_in_pct, knock_in_style == "每日观察",
+        knock_in_strike_pct, participation_rate, max_loss_ratio,
+    )
+    if schedule_mode == "按规则生成":
+        with st.expander(f"生成的日程（派息 {len(obs_dividend_dates)} 期，敲出观察 {len(obs_dates)} 期）"):
+            st.dataframe(pd.DataFrame({
+                "派息观察日": obs_dividend_dates,
+                "派息率 (%)": obs_dividend_rates * 100,
+            }), hide_index=True)
+            st.dataframe(pd.DataFrame({
+                "敲出观察日": obs_dates,
+                "敲出障碍价格 (%)": obs_barriers * 100,
+            }), hide_index=True)
+
 
     # 构造映射
-    dividend_dict             = dict(zip(obs_dividend_dates, obs_dividend_rates))
-    obs_barrier_levels        = [start_price * p for p in obs_barriers]
-    obs_dict                  = dict(zip(obs_dates, obs_barrier_levels))
     knock_in_level            = start_price * knock_in_pct
     dividend_barrier_level    = start_price * dividend_barrier_pct
 
@@ -376,6 +551,15 @@ def render():
     4.  **敲入区 (图左侧，红色曲线)**：当期末价格**低于敲入障碍线**时，产品触发敲入。年化收益表现为**已派息金额减去因敲入造成的亏损后的总金额进行年化**。曲线呈现**向下倾斜的趋势**，表示随着标的资产价格的下跌，亏损会逐渐扩大。
     """)
 
+    if show_heatmap:
+        plot_payoff_heatmap(params, heatmap_axis, heatmap_resolution)
+        st.markdown("""
+        **热力图**：横轴为期末价格，纵轴为所选参数，颜色为理论年化收益率（口径同上图）；
+        黑色虚线为当前参数，沿虚线的横截面即为上面的收益率曲线。
+        纵轴选“敲入前派息期数”时，敲入区计入敲入前已派发的各期派息（路径相关口径），
+        第 0 行即上图的全有或全无近似。
+        """)
+
     # -------------------------------
     # 3. 图2：历史模拟价格路径
     # -------------------------------
@@ -384,80 +568,57 @@ def render():
     period_days = (pd.to_datetime(final_obs) - pd.to_datetime(start_date)).days
     fetch_end   = sim_start_date + datetime.timedelta(days=period_days + 90)
 
-    raw  = get_price_data([underlying_code],
-                          sim_start_date.strftime("%Y-%m-%d"),
-                          fetch_end.strftime("%Y-%m-%d"))
-    hist = raw.get(underlying_code, [])
-    if not hist:
-        st.error("无法获取历史数据"); return
-
-    df = pd.DataFrame(hist)
-    df["date"]  = pd.to_datetime(df["date"])
-    price_col   = "close" if "close" in df else df.columns[1]
-    df["price"] = df[price_col].astype(float)
-    df.sort_values("date", inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    df["ret"]   = df["price"].pct_change().fillna(0)
-
-    sim_dates       = pd.bdate_range(start_date, final_obs)
-    rets            = df["ret"].values
-    # 确保 rets 的长度与模拟天数匹配
-    rets            = np.concatenate([rets, np.zeros(max(0, len(sim_dates)-1-len(rets)))])[:len(sim_dates)-1]
-
-    sim_prices      = [start_price]
-    knock_ined      = False
-    knock_out       = False
-    knock_in_date   = knock_out_date = None
-    dividend_events = [] # (日期, 是否派息, 派息率, 派息金额)
-
-    for i, r in enumerate(rets):
-        if knock_out: break # 如果已敲出，则停止模拟
-        new_price = sim_prices[-1] * (1 + r)
-        today     = sim_dates[i+1] # 当前模拟日期
-        sim_prices.append(new_price)
-
-        # 敲入检测 (每日观察)
-        if knock_in_style=="每日观察" and not knock_ined and new_price<knock_in_level:
-            knock_ined, knock_in_date = True, today
-            # 如果敲入，后续派息通常停止，但已派发的不会收回
-            # 为简化模拟，这里假设敲入后不再派息
-            # dividend_events = [d for d in dividend_events if d[0] < today.date()] # 移除敲入后的派息事件
-
-        # 敲出检测
-        if today.date() in obs_dict and new_price>=obs_dict[today.date()]:
-            knock_out, knock_out_date = True, today
-            break # 敲出后产品结束
-
-        # 派息检测 (如果未敲入，且未敲出)
-        if not knock_ined and today.date() in dividend_dict:
-            rate   = dividend_dict[today.date()]
-            # 派息条件：未敲入 且 价格高于派息障碍
-            paid   = new_price >= dividend_barrier_level
-            amount = notional_principal * rate
-            dividend_events.append((today.date(), paid, rate, amount))
-
-    # 到期敲入 (如果到期观察)
-    if not knock_out and knock_in_style=="到期观察" and sim_prices[-1]<knock_in_level:
-        knock_ined, knock_in_date = True, sim_dates[-1]
-
-    # 最后一次派息（如果到期观察并且未敲出未敲入）
-    # 检查最后一个派息日是否已经被处理过，如果没有，且满足条件，则添加
-    last_dividend_date = obs_dividend_dates[-1] if obs_dividend_dates else None
-    if not knock_out and not knock_ined and last_dividend_date and last_dividend_date == sim_dates[-1].date():
-        if last_dividend_date not in [d[0] for d in dividend_events]: # 避免重复添加
-            rate   = dividend_dict[last_dividend_date]
-            paid   = sim_prices[-1] >= dividend_barrier_level
-            amount = notional_principal * rate
-            dividend_events.append((last_dividend_date, paid, rate, amount))
+    hist = get_price_series(underlying_code, sim_start_date, fetch_end)
+    if hist is None or len(hist.close) == 0:
+        st.error("无法获取历史数据")
+        return
+
+    # 收益率已在价格索引中预先算好；窗口首日收益记为 0，与窗口内 pct_change().fillna(0) 一致
+    rets        = np.concatenate([[0.0], hist.ret[1:]])
 
+    # 模拟区间使用交易日历（实际交易日 + 推算的未来交易日），观察日编译成区间内的整数下标，
+    # 非交易日的观察日顺延到下一交易日
+    calendar = get_calendar()
+    try:
+        product     = spec.compile(calendar)
+    except ValueError as e:
+        st.error(f"交易日历无法覆盖产品期限：{e}")
+        return
+    div_day_idx     = product.div_idx
+    sim_dates       = pd.DatetimeIndex(product.dates)
+    N               = len(sim_dates)
+    # 历史数据不足以覆盖产品期限时，尾部由全部历史日收益率的区块自助法抽样补足（不补零）
+    rets, n_filled = extend_returns(rets, N-1, history_log_returns(underlying_code))
+    if n_filled:
+        st.info(f"所选历史区间只覆盖前 {N-1-n_filled} 个交易日，其余 {n_filled} 个交易日由历史区块自助法抽样补足")
+
+    # 整条路径一次性估值：敲入/敲出下标与逐期派息记录
+    ko_idx, ko_obs  = product.ko_idx, product.ko_obs
+    ko_levels       = start_price * product.ko_barriers
+    sim_prices      = price_path(start_price, rets)
+    outcome         = evaluate_phoenix(
+        sim_prices, ko_idx, ko_levels, ko_obs, knock_in_level,
+        div_day_idx, dividend_barrier_level, knock_in_style=="每日观察"
+    )
+    knock_out_idx   = int(outcome.knock_out_idx) if outcome.knock_out_idx >= 0 else None
+    knock_in_idx    = int(outcome.knock_in_idx) if outcome.knock_in_idx >= 0 else None
+    knock_ined      = knock_in_idx is not None
+    knock_in_date   = sim_dates[knock_in_idx] if knock_in_idx is not None else None
+    knock_out_date  = sim_dates[knock_out_idx] if knock_out_idx is not None else None
+
+    # 派息记录 (日期, 是否派息, 派息率, 派息金额)，按派息观察日先后排列
+    observed        = np.flatnonzero(outcome.coupon_observed)
+    observed        = observed[np.argsort(div_day_idx[observed], kind="stable")]
+    dividend_events = [
+        (sim_dates[div_day_idx[m]].date(), bool(outcome.coupon_paid[m]),
+         obs_dividend_rates[m], notional_principal * obs_dividend_rates[m])
+        for m in observed
+    ]
 
     # 提前敲出截断数据
     if knock_out_date:
-        idx = sim_dates.get_indexer([knock_out_date])[0]
-        sim_dates  = sim_dates[:idx+1]
-        sim_prices = sim_prices[:idx+1]
-        # 截断派息事件列表，只保留敲出日之前的派息
-        dividend_events = [d for d in dividend_events if d[0] <= knock_out_date.date()]
+        sim_dates  = sim_dates[:knock_out_idx+1]
+        sim_prices = sim_prices[:knock_out_idx+1]
 
     sim_df = pd.DataFrame({"price": sim_prices}, index=sim_dates)
 
@@ -482,12 +643,10 @@ def render():
     ))
 
     # 敲出障碍点
-    xs, ys = [], []
-    for d, lvl in obs_dict.items():
-        dt = pd.to_datetime(d)
-        if dt in sim_df.index: # 确保日期在模拟范围内
-            xs.append(dt); ys.append(lvl)
-    if xs:
+    ko_shown = ko_idx < len(sim_df) # 确保日期在模拟范围内
+    xs = sim_df.index[ko_idx[ko_shown]]
+    ys = ko_levels[ko_shown]
+    if len(xs):
         fig2.add_trace(go.Scatter(x=xs, y=ys, mode="markers", name="敲出障碍价",
                                     marker=dict(color="green", size=8)))
     # 派息事件
@@ -625,4 +784,106 @@ def render():
             f"- 已获得派息总额：**{total_paid_dividend_amount:.2f} 万元**\n"
             f"- 产品实际运行期限：{actual_product_days} 天 ({actual_product_years:.2f} 年)\n"
             f"- 最终年化收益率：**{annualized_return_at_maturity:.2f}%**"
-        )
\ No newline at end of file
+        )
+
+    # -------------------------------
+    # 5. 图3: 滚动起始日历史回测
+    # -------------------------------
+    if run_backtest:
+        st.header("👑图3：滚动起始日历史回测👑")
+        plot_rolling_backtest({
+            "underlying_code": underlying_code,
+            "notional_principal": notional_principal,
+            "product": product,
+            "first_start": backtest_first,
+            "last_start": backtest_last,
+        })
+
+    # -------------------------------
+    # 6. 蒙特卡洛定价
+    # -------------------------------
+    if run_mc:
+        st.header("👑蒙特卡洛定价👑")
+        mc_path_model = None # 缺省为几何布朗运动
+        if mc_model == "历史区块自助法":
+            # 全部历史日收益率按区块重抽样，历史测度下的分布；无风险利率仅用于贴现
+            mc_path_model = BootstrapModel(history_log_returns(underlying_code), mc_mean_block)
+        elif mc_model == "拟蒙特卡洛 (Sobol + 布朗桥)":
+            # 布朗桥优先生成观察日，Sobol 前几维落在对收益影响最大的日期上
+            mc_path_model = SobolGBMModel(mc_vol, mc_rate, mc_div_yield, np.concatenate([ko_idx, div_day_idx]))
+        def mc_price(model, n_paths, seed):
+            return price_phoenix_mc(
+                **product.args, times=product.times,
+                vol=mc_vol, rate=mc_rate, div_yield=mc_div_yield, n_paths=n_paths, seed=seed,
+                memory_mb=mc_memory_mb, dtype=np.float32 if mc_float32 else np.float64, workers=mc_workers,
+                model=model, control_variate=mc_control_variate,
+                # 给出目标标准误或时间预算时逐批运行，模拟路径数为上限
+                target_bp=mc_target_bp or None, time_budget=mc_time_budget or None,
+            )
+        mc_t0 = time.perf_counter()
+        mc = mc_price(mc_path_model, mc_paths, mc_seed)
+        mc_elapsed = time.perf_counter() - mc_t0
+        st.write(
+            f"- 路径生成方式：{mc_model}，模拟路径数：{mc.n_paths}，用时 {mc_elapsed:.2f} 秒  \n"
+            f"- 收益现值（派息现值 - 本金亏损现值）：**{mc.price * notional_principal:.2f} 万元**"
+            f"（{mc.price*100:.3f}% 名义本金，标准误 {mc.std_error*100:.3f}%）  \n"
+            f"- 敲出概率：{mc.ko_prob*100:.2f}%  \n"
+            f"- 敲入概率（未敲出且敲入）：{mc.ki_prob*100:.2f}%  \n"
+            f"- 期望存续期：{mc.expected_life:.2f} 年"
+        )
+        if mc_target_bp and mc.std_error * 1e4 > mc_target_bp:
+            st.warning(f"未达到目标标准误 {mc_target_bp:.1f} bp（实际 {mc.std_error*1e4:.1f} bp），可提高路径数上限或时间预算")
+        if mc_control_variate:
+            st.write(f"- 控制变量法方差缩减倍数：{mc.variance_reduction:.2f}（等效路径数 × {mc.variance_reduction:.2f}）")
+        if mc_fair_coupon:
+            st.subheader("公允票息")
+            # 路径只模拟一次并缓存逐路径事件；票息按比例缩放时收益是仿射的，闭式求解
+            cache = simulate_phoenix(
+                **product.args, times=product.times,
+                vol=mc_vol, rate=mc_rate, div_yield=mc_div_yield, n_paths=mc_paths, seed=mc_seed,
+                memory_mb=mc_memory_mb, dtype=np.float32 if mc_float32 else np.float64, model=mc_path_model,
+            )
+            fair = solve_fair_coupon(cache)
+            st.write(
+                f"- 派息率倍数：{fair.scale:.4f}（标准误 {fair.std_error:.4f}）  \n"
+                f"- 公允派息率（末期）：**{fair.rates[-1]*100:.3f}%**（当前 {obs_dividend_rates[-1]*100:.3f}%）"
+            )
+        if mc_convergence:
+            st.subheader("收敛性报告")
+            report = convergence_report(mc_price, {
+                "伪随机 (几何布朗运动)": GBMModel(mc_vol, mc_rate, mc_div_yield),
+                "拟蒙特卡洛 (Sobol + 布朗桥)": SobolGBMModel(mc_vol, mc_rate, mc_div_yield, np.concatenate([ko_idx, div_day_idx])),
+            }, sorted({max(1024, mc_paths // 16), max(1024, mc_paths // 4), mc_paths}), mc_seed)
+            plot_convergence(report, notional_principal)
+
+    # -------------------------------
+    # 7. 有限差分（PDE）定价
+    # -------------------------------
+    if run_pde:
+        st.header("👑有限差分定价👑")
+        pde_t0 = time.perf_counter()
+        pde = price_phoenix_pde(
+            **product.args, times=product.times,
+            vol=pde_vol, rate=pde_rate, div_yield=pde_div_yield, n_space=pde_nodes,
+        )
+        st.write(
+            f"- 收益现值：**{pde.price * notional_principal:.2f} 万元**（{pde.price*100:.3f}% 名义本金），"
+            f"用时 {(time.perf_counter() - pde_t0)*1000:.0f} 毫秒  \n"
+            f"- Delta：{pde.delta * notional_principal / 100:.2f} 万元 / 标的涨 1%  \n"
+            f"- Gamma：{pde.gamma * notional_principal / 1e4:.3f} 万元 / (1%)²"
+        )
+        plot_pde_profile(pde, notional_principal)
+
+    # -------------------------------
+    # 8. 希腊字母曲面
+    # -------------------------------
+    if run_greeks:
+        st.header("👑希腊字母曲面👑")
+        # 所有扰动共用同一组布朗路径（按路径数与种子缓存，重复运行时复用）
+        greeks_t0 = time.perf_counter()
+        surface = greeks_surface(
+            phoenix_product(**product.args), product.times,
+            greeks_vol, greeks_rate, greeks_div_yield, n_paths=greeks_paths, seed=greeks_seed,
+        )
+        st.write(f"- 共同随机数重定价，模拟路径数：{greeks_paths}，用时 {time.perf_counter() - greeks_t0:.2f} 秒")
+        plot_greeks_surface(surface, product.dates, notional_principal)
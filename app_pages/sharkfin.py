@@ -1,6 +1,111 @@
+import time
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
+from engine.backtest import backtest_sharkfin
+from engine.products import SharkfinSpec
+from engine.sharkfin import DAY, price_sharkfin_mc, sharkfin_greeks, sharkfin_value
+
+
+def show_pricing(product, spot_price, vol, rate, div_yield, daily_barrier, n_paths, seed):
+    """
+    解析（连续观察 / 每日观察修正）与蒙特卡洛（每日观察）定价、希腊字母，
+    以及 执行价 × 障碍价 的报价网格（整个网格一次向量化求值）。
+    product: SharkfinSpec 的编译结果；价格均为期初价倍数，收益以名义本金百分比显示。
+    """
+    args = product.args
+    direction, k, b = args["direction"], args["strike"], args["barrier"]
+    strike_price, barrier_price = k * spot_price, b * spot_price
+    monitoring_dt = DAY if daily_barrier else 0.0
+    greeks = sharkfin_greeks(**args, vol=vol, rate=rate, div_yield=div_yield, monitoring_dt=monitoring_dt)
+    continuous, continuous_hit = sharkfin_value(**args, vol=vol, rate=rate, div_yield=div_yield)
+    t0 = time.perf_counter()
+    mc = price_sharkfin_mc(**args, vol=vol, rate=rate, div_yield=div_yield, n_paths=n_paths, seed=seed)
+    mc_elapsed = time.perf_counter() - t0
+
+    lines = [f"- 解析价格（{'每日观察修正' if daily_barrier else '连续观察'}）：**{float(greeks.price) * 100:.4f}%**，"
+             f"触碰障碍概率 {float(greeks.hit_prob) * 100:.2f}%"]
+    if daily_barrier:
+        lines.append(f"- 解析价格（连续观察）：{float(continuous) * 100:.4f}%，触碰障碍概率 {float(continuous_hit) * 100:.2f}%")
+    lines.append(
+        f"- 蒙特卡洛（每日收盘观察，{mc.n_paths} 条路径，耗时 {mc_elapsed:.2f} 秒）："
+        f"{float(mc.price) * 100:.4f}% ± {float(mc.std_error) * 100:.4f}%，触碰障碍比例 {float(mc.hit_prob) * 100:.2f}%"
+    )
+    st.markdown("  \n".join(lines))
+    st.table(pd.DataFrame({
+        "希腊字母": ["Delta (标的涨 1%)", "Gamma (标的涨 1%，Delta 变化)", "Vega (波动率 +1%)", "Theta (每交易日)"],
+        "数值 (% 名义本金)": [
+            f"{float(greeks.delta):.4f}",
+            f"{float(greeks.gamma) * 0.01:.4f}",
+            f"{float(greeks.vega):.4f}",
+            f"{float(greeks.theta) * 100:.4f}",
+        ],
+    }).set_index("希腊字母"))
+
+    # 报价网格：执行价 × 障碍价
+    if direction == "看涨鲨鱼鳍":
+        strikes = np.linspace(0.9 * k, min(k * 1.1, b), 60)
+        barriers = np.linspace(max(b * 0.9, k * 1.01), b * 1.2, 60)
+    else:
+        strikes = np.linspace(max(k * 0.9, b), 1.1 * k, 60)
+        barriers = np.linspace(b * 0.8, min(b * 1.1, k * 0.99), 60)
+    t0 = time.perf_counter()
+    grid = sharkfin_greeks(**{**args, "strike": strikes[None, :], "barrier": barriers[:, None]},
+                           vol=vol, rate=rate, div_yield=div_yield, monitoring_dt=monitoring_dt)
+    grid_elapsed = time.perf_counter() - t0
+    fig = go.Figure(go.Heatmap(
+        x=strikes * spot_price, y=barriers * spot_price, z=grid.price * 100,
+        colorscale="Viridis", colorbar=dict(title="价格 (%)"),
+        hovertemplate="执行价: %{x:.2f}<br>障碍价: %{y:.2f}<br>价格: %{z:.4f}%<extra></extra>",
+    ))
+    fig.add_trace(go.Scatter(x=[strike_price], y=[barrier_price], mode="markers", name="当前参数",
+                             marker=dict(color="red", size=10, symbol="x")))
+    fig.update_layout(title="报价网格：执行价 × 障碍价 (解析价格，% 名义本金)",
+                      xaxis_title="执行价格 K", yaxis_title="障碍价格 B", template="plotly_white")
+    st.plotly_chart(fig, use_container_width=True)
+    n_combos = grid.price.size
+    st.caption(f"{n_combos} 个参数组合的价格与希腊字母耗时 {grid_elapsed * 1000:.1f} 毫秒"
+               f"（约 {n_combos / max(grid_elapsed, 1e-9):,.0f} 组合 / 秒）")
+
+
+def plot_rolling_backtest(code, product, first_start, last_start):
+    """以标的历史上每一个交易日为起始日回测同一款鲨鱼鳍（每日收盘观察障碍），展示收益分布与触碰障碍频率"""
+    result, stats = backtest_sharkfin(code, **product.args, first_start=first_start, last_start=last_start)
+    if stats["windows"] == 0:
+        st.warning("所选区间内没有完整覆盖产品期限的历史窗口，无法回测。")
+        return
+
+    q = stats["annual_return_quantiles"]
+    st.write(
+        f"- 回测起始日数量：{stats['windows']} 个（{result.start_dates[0]} 至 {result.start_dates[-1]}）  \n"
+        f"- 触碰障碍比例：{stats['hit_rate']*100:.2f}%  \n"
+        f"- 零收益比例：{stats['zero_return_rate']*100:.2f}%  \n"
+        f"- 平均年化收益率：{stats['mean_annual_return']*100:.2f}%，最高：{stats['max_annual_return']*100:.2f}%  \n"
+        f"- 年化收益率分位数 (5%/25%/50%/75%/95%)："
+        f"{' / '.join(f'{q[k]*100:.2f}%' for k in sorted(q))}"
+    )
+
+    start_dates = pd.DatetimeIndex(result.start_dates)
+    ann_pct = result.annual_return * 100
+    fig = go.Figure()
+    for mask, name, color in [
+        (result.hit, "触碰障碍", "darkorange"),
+        (~result.hit & (result.payoff > 0), "未触碰障碍 (实值)", "seagreen"),
+        (~result.hit & (result.payoff <= 0), "未触碰障碍 (零收益)", "royalblue"),
+    ]:
+        if mask.any():
+            fig.add_trace(go.Scatter(x=start_dates[mask], y=ann_pct[mask], mode="markers",
+                                     name=name, marker=dict(color=color, size=4)))
+    fig.update_layout(title="各起始日的年化收益率", xaxis_title="起始日",
+                      yaxis_title="年化收益率 (%)", template="plotly_white")
+    st.plotly_chart(fig, use_container_width=True)
+
+    fig_hist = go.Figure(go.Histogram(x=ann_pct, nbinsx=60, marker_color="steelblue"))
+    fig_hist.update_layout(title="年化收益率分布", xaxis_title="年化收益率 (%)",
+                           yaxis_title="起始日数量", template="plotly_white")
+    st.plotly_chart(fig_hist, use_container_width=True)
+
 
 def render():
     st.header("鲨鱼鳍期权情景分析")
@@ -21,6 +126,36 @@ def render():
 
         with col3:
             rebate_rate = st.number_input("越过障碍固定年化回报率 R (%)", min_value=0.0, max_value=50.0, value=5.0, step=0.1)
+            spot_price = st.number_input("期初价格 S0", min_value=1.0, max_value=10000.0, value=100.0, step=1.0)
+
+        st.write("定价参数:")
+        col4, col5, col6 = st.columns(3)
+
+        with col4:
+            run_pricing = st.checkbox("定价与希腊字母", value=True)
+            daily_barrier = st.selectbox("障碍观察方式", ["每日收盘观察", "连续观察"], index=0) == "每日收盘观察"
+
+        with col5:
+            vol = st.number_input("年化波动率 (%)", min_value=0.1, max_value=200.0, value=20.0, step=1.0) / 100
+            rate = st.number_input("无风险利率 (%)", min_value=-10.0, max_value=20.0, value=2.0, step=0.1) / 100
+
+        with col6:
+            div_yield = st.number_input("标的分红率 (%)", min_value=-10.0, max_value=20.0, value=0.0, step=0.1) / 100
+            mc_paths = int(st.number_input("蒙特卡洛路径数", min_value=1000, max_value=1000000, value=100000, step=10000))
+            mc_seed = int(st.number_input("随机数种子", min_value=0, value=2025))
+
+        st.write("历史回测:")
+        col7, col8, col9 = st.columns(3)
+
+        with col7:
+            run_backtest = st.checkbox("滚动回测：以历史上每一个交易日为起始日评估本产品", value=False)
+            underlying_code = st.selectbox("挂钩标的代码", ["000016.SH", "000300.SH", "000905.SH", "000852.SH", "513180.SH"], index=3)
+
+        with col8:
+            backtest_first = st.date_input("回测起始日 (最早)", value=pd.to_datetime("2015-01-05").date())
+
+        with col9:
+            backtest_last = st.date_input("回测起始日 (最晚)", value=pd.to_datetime("2025-05-19").date())
 
         submit_button = st.form_submit_button("生成分析图表")
 
@@ -28,16 +163,14 @@ def render():
         term_years = term_months / 12
         pr = participation_rate / 100
 
-        # 参数合法性检查
-        valid_inputs = True
-        if direction == "看涨鲨鱼鳍" and barrier_price <= strike_price:
-            st.error("看涨鲨鱼鳍要求 障碍价格 > 执行价格。")
-            valid_inputs = False
-        if direction == "看跌鲨鱼鳍" and barrier_price >= strike_price:
-            st.error("看跌鲨鱼鳍要求 障碍价格 < 执行价格。")
-            valid_inputs = False
-        if not valid_inputs:
+        # 产品条款只构造一次（同时检查参数合法性），定价与回测共用其编译结果
+        try:
+            spec = SharkfinSpec(direction, strike_price / spot_price, barrier_price / spot_price,
+                                pr, rebate_rate / 100, term_months)
+        except ValueError as e:
+            st.error(f"{e}。")
             st.stop()
+        product = spec.compile()
 
         st.subheader("输入参数概要")
         df_params = pd.DataFrame({
@@ -174,5 +307,13 @@ def render():
         - 绘制了完整的鲨鱼鳍结构变化
         """)
 
+        if run_pricing:
+            st.subheader("定价与希腊字母")
+            show_pricing(product, spot_price, vol, rate, div_yield, daily_barrier, mc_paths, mc_seed)
+
+        if run_backtest:
+            st.subheader("滚动起始日历史回测")
+            plot_rolling_backtest(underlying_code, product, backtest_first, backtest_last)
+
     else:
         st.info("请在上方输入参数，然后点击“生成鲨鱼鳍收益分析图”。")
@@ -1,48 +1,26 @@
 import datetime
+import os
+import time
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-# 假设 api.py 文件和 get_price_data 函数已正确导入
-from api import get_price_data # 假设这个导入在您的实际代码中存在
+# 假设 api.py 文件和 get_price_series 函数已正确导入
+from api import get_price_series # 假设这个导入在您的实际代码中存在
+from trading_calendar import get_calendar
+from engine.snowball import evaluate_snowball, price_path, snowball_payoff
+from engine.backtest import backtest_snowball
+from engine.bootstrap import MEAN_BLOCK, BootstrapModel, extend_returns, history_log_returns
+from engine.montecarlo import MEMORY_BUDGET_MB, GBMModel, price_snowball_mc, snowball_product
+from engine.coupon_solver import simulate_snowball, solve_fair_coupon
+from engine.greeks import GREEKS_PATHS, greeks_surface
+from engine.payoff import snowball_regions, snowball_theoretical_payoff
+from engine.pde import N_SPACE, price_snowball_pde
+from engine.products import SnowballSpec, TernarySnowballSpec
+from engine.schedule import FREQUENCIES, ROLLS, observation_schedule, parse_dates, parse_percents, step_down_barriers
+from engine.qmc import SobolGBMModel, convergence_report
 
 
-def calculate_theoretical_payoff(
-    current_price, snowball_type, start_price,
-    knock_in_pct, knock_in_strike_pct, participation_rate,
-    guaranteed_return, max_loss_ratio,
-    last_obs_barrier_pct, last_obs_coupon, dividend_rate, term_in_years
-):
-    """
-    计算给定期末价格下的理论年化收益百分比。
-    current_price: 标的资产在期末的价格
-    返回值：理论年化收益百分比 (例如，收益10%返回0.10)
-    """
-    relative_price = current_price / start_price
-    annualized_payoff_ratio = 0.0 # 默认值，如果未触发任何条件，可视为0
-
-    # 1. 敲出区：如果期末价格达到或超过最后一个敲出障碍
-    if relative_price >= last_obs_barrier_pct:
-        annualized_payoff_ratio = last_obs_coupon # 直接是年化票息
-    # 2. 无事件区：如果期末价格在敲入障碍和敲出障碍之间
-    elif relative_price > knock_in_pct: # 并且相对价格 < last_obs_barrier_pct (由上面的if语句隐式涵盖)
-        annualized_payoff_ratio = dividend_rate # 直接是年化红利票息
-    # 3. 敲入区：如果期末价格低于或等于敲入障碍
-    else: # relative_price <= knock_in_pct
-        if snowball_type == "雪球":
-            raw_loss_pct = max(0.0, knock_in_strike_pct - relative_price)
-            capped_loss_pct = min(raw_loss_pct, max_loss_ratio)
-            total_loss_ratio = capped_loss_pct * participation_rate
-            # 将总损失年化，如果期限为0则避免除以0
-            if term_in_years > 0:
-                annualized_payoff_ratio = -total_loss_ratio / term_in_years
-            else: # 理论上不应该出现term_in_years=0，但为健壮性考虑
-                annualized_payoff_ratio = -total_loss_ratio
-        else: # 三元雪球
-            annualized_payoff_ratio = guaranteed_return # 三元雪球的敲入收益率通常就是年化的
-
-    return annualized_payoff_ratio
-
 def plot_theoretical_payoff(params):
     """
     绘制雪球产品理论年化收益曲线。
@@ -62,13 +40,13 @@ def plot_theoretical_payoff(params):
     dividend_rate = params["dividend_rate"]
     start_date = params["start_date"]
 
-    if not obs_dates:
+    if not len(obs_dates):
         st.warning("缺少敲出观察日列表，无法绘制理论收益曲线。")
         return
 
     final_obs_date = obs_dates[-1]
-    last_obs_barrier_pct = obs_barriers[-1] if obs_barriers else 1.0
-    last_obs_coupon = obs_coupons[-1] if obs_coupons else 0.0
+    last_obs_barrier_pct = obs_barriers[-1] if len(obs_barriers) else 1.0
+    last_obs_coupon = obs_coupons[-1] if len(obs_coupons) else 0.0
 
     term_in_years = (pd.to_datetime(final_obs_date) - pd.to_datetime(start_date)).days / 365.0
     if term_in_years <= 0:
@@ -79,56 +57,27 @@ def plot_theoretical_payoff(params):
     max_price_factor = max(last_obs_barrier_pct * 1.2, 1.5)
     price_range = np.linspace(start_price * min_price_factor, start_price * max_price_factor, 500) # 增加点数使曲线更平滑
 
-    # 初始化三个独立的列表来绘制不同区域的曲线
-    knock_in_region_x, knock_in_region_y = [], []
-    no_event_region_x, no_event_region_y = [], []
-    knock_out_region_x, knock_out_region_y = [], []
-
-    for p in price_range:
-        relative_price = p / start_price
-        
-        # 判断当前价格点属于哪个区域，并添加到相应的列表中
-        if relative_price >= last_obs_barrier_pct:
-            # 敲出区
-            payoff = calculate_theoretical_payoff(
-                p, snowball_type, start_price,
-                knock_in_pct, knock_in_strike_pct, participation_rate,
-                guaranteed_return, max_loss_ratio,
-                last_obs_barrier_pct, last_obs_coupon, dividend_rate, term_in_years
-            ) * 100 # 转换为百分比显示
-            knock_out_region_x.append(p)
-            knock_out_region_y.append(payoff)
-        elif relative_price > knock_in_pct:
-            # 无事件区
-            payoff = calculate_theoretical_payoff(
-                p, snowball_type, start_price,
-                knock_in_pct, knock_in_strike_pct, participation_rate,
-                guaranteed_return, max_loss_ratio,
-                last_obs_barrier_pct, last_obs_coupon, dividend_rate, term_in_years
-            ) * 100 # 转换为百分比显示
-            no_event_region_x.append(p)
-            no_event_region_y.append(payoff)
-        else: # relative_price <= knock_in_pct
-            # 敲入区
-            payoff = calculate_theoretical_payoff(
-                p, snowball_type, start_price,
-                knock_in_pct, knock_in_strike_pct, participation_rate,
-                guaranteed_return, max_loss_ratio,
-                last_obs_barrier_pct, last_obs_coupon, dividend_rate, term_in_years
-            ) * 100 # 转换为百分比显示
-            knock_in_region_x.append(p)
-            knock_in_region_y.append(payoff)
+    relative_price = price_range / start_price
+    payoff = snowball_theoretical_payoff(
+        relative_price, snowball_type, knock_in_pct, knock_in_strike_pct, participation_rate,
+        guaranteed_return, max_loss_ratio, last_obs_barrier_pct, last_obs_coupon, dividend_rate, term_in_years
+    ) * 100 # 转换为百分比显示
+    # 按区域拆分成三段曲线
+    region = snowball_regions(relative_price, knock_in_pct, last_obs_barrier_pct)
+    knock_in_region_x, knock_in_region_y = price_range[region == 0], payoff[region == 0]
+    no_event_region_x, no_event_region_y = price_range[region == 1], payoff[region == 1]
+    knock_out_region_x, knock_out_region_y = price_range[region == 2], payoff[region == 2]
 
     fig = go.Figure()
 
     # 绘制敲入区曲线
-    if knock_in_region_x: # 只有当列表非空时才添加trace
+    if len(knock_in_region_x): # 只有当列表非空时才添加trace
         fig.add_trace(go.Scatter(x=knock_in_region_x, y=knock_in_region_y, mode='lines', name='敲入区', line=dict(width=3, color='red')))
     # 绘制无事件区曲线
-    if no_event_region_x: # 只有当列表非空时才添加trace
+    if len(no_event_region_x): # 只有当列表非空时才添加trace
         fig.add_trace(go.Scatter(x=no_event_region_x, y=no_event_region_y, mode='lines', name='无事件区', line=dict(width=3, color='blue')))
     # 绘制敲出区曲线
-    if knock_out_region_x: # 只有当列表非空时才添加trace
+    if len(knock_out_region_x): # 只有当列表非空时才添加trace
         fig.add_trace(go.Scatter(x=knock_out_region_x, y=knock_out_region_y, mode='lines', name='敲出区', line=dict(width=3, color='green')))
 
 
@@ -148,9 +97,8 @@ def plot_theoretical_payoff(params):
     no_event_yield = dividend_rate * 100 # 无事件区年化收益率
     
     # 获取当前Y轴显示范围，用于调整注释位置
-    all_payoffs = [val for sublist in [knock_in_region_y, no_event_region_y, knock_out_region_y] for val in sublist if val is not None]
-    if all_payoffs:
-        current_y_range = [min(all_payoffs), max(all_payoffs)]
+    if len(payoff):
+        current_y_range = [payoff.min(), payoff.max()]
     else:
         current_y_range = [0, 10] # 默认范围，以防万一
 
@@ -162,7 +110,7 @@ def plot_theoretical_payoff(params):
 
     # 添加区域注释和收益率
     # 敲出区注释
-    if knock_out_region_x: # 确保敲出区有数据才添加注释
+    if len(knock_out_region_x): # 确保敲出区有数据才添加注释
         fig.add_annotation(
             x=knock_out_region_x[0] + (knock_out_region_x[-1] - knock_out_region_x[0]) / 2, # 区域中心
             y=ko_yield, # 放置在固定收益线上
@@ -173,7 +121,7 @@ def plot_theoretical_payoff(params):
         )
     
     # 无事件区注释
-    if no_event_region_x: # 确保无事件区有数据才添加注释
+    if len(no_event_region_x): # 确保无事件区有数据才添加注释
         fig.add_annotation(
             x=no_event_region_x[0] + (no_event_region_x[-1] - no_event_region_x[0]) / 2, # 区域中心
             y=no_event_yield, # 放置在固定收益线上
@@ -184,7 +132,7 @@ def plot_theoretical_payoff(params):
         )
     
     # 敲入区注释
-    if knock_in_region_x: # 确保敲入区有数据才添加注释
+    if len(knock_in_region_x): # 确保敲入区有数据才添加注释
         if snowball_type == "雪球":
             fig.add_annotation(
                 x=knock_in_region_x[0] + (knock_in_region_x[-1] - knock_in_region_x[0]) / 2, # 区域中心
@@ -215,6 +163,162 @@ def plot_theoretical_payoff(params):
     st.plotly_chart(fig, use_container_width=True)
 
 
+def plot_payoff_heatmap(params, axis, resolution):
+    """
+    在 期末价格 × 参数 的二维网格上绘制理论年化收益热力图（整个网格一次向量化求值）。
+    axis: "敲入障碍" 或 "敲出票息"；resolution: 每个方向的格点数
+    """
+    start_price = params["start_price"]
+    knock_in_pct = params["knock_in_pct"]
+    obs_barriers = params["obs_barriers"]
+    obs_coupons = params["obs_coupons"]
+    last_obs_barrier_pct = obs_barriers[-1] if len(obs_barriers) else 1.0
+    last_obs_coupon = obs_coupons[-1] if len(obs_coupons) else 0.0
+    dividend_rate = params["dividend_rate"]
+    term_in_years = (pd.to_datetime(params["obs_dates"][-1]) - pd.to_datetime(params["start_date"])).days / 365.0
+
+    min_price_factor = min(knock_in_pct * 0.8, 0.5)
+    max_price_factor = max(last_obs_barrier_pct * 1.2, 1.5)
+    price_range = np.linspace(start_price * min_price_factor, start_price * max_price_factor, resolution)
+    relative_price = (price_range / start_price)[None, :]
+
+    if axis == "敲入障碍":
+        axis_values = np.linspace(0.4, last_obs_barrier_pct, resolution)
+        current = knock_in_pct
+        knock_in_grid, coupon_grid, dividend_grid = axis_values[:, None], last_obs_coupon, dividend_rate
+    else:
+        axis_values = np.linspace(0.0, max(2 * last_obs_coupon, 0.3), resolution)
+        current = last_obs_coupon
+        knock_in_grid, coupon_grid = knock_in_pct, axis_values[:, None]
+        # 红利票息同敲出票息时随之变化
+        dividend_grid = coupon_grid if params["dividend_follows_coupon"] else dividend_rate
+
+    payoff = snowball_theoretical_payoff(
+        relative_price, params["snowball_type"], knock_in_grid, params["knock_in_strike_pct"],
+        params["participation_rate"], params["guaranteed_return"], params["max_loss_ratio"],
+        last_obs_barrier_pct, coupon_grid, dividend_grid, term_in_years
+    )
+    payoff = np.broadcast_to(payoff * 100, (resolution, resolution)).astype(np.float32)
+
+    fig = go.Figure(go.Heatmap(
+        x=price_range, y=axis_values * 100, z=payoff,
+        colorscale="RdYlGn", zmid=0, colorbar=dict(title="年化收益 (%)"),
+        hovertemplate="期末价格: %{x:.2f}<br>" + axis + ": %{y:.2f}%<br>年化收益: %{z:.2f}%<extra></extra>",
+    ))
+    fig.add_hline(y=current * 100, line_dash="dash", line_color="black",
+                  annotation_text=f"当前{axis}({current * 100:.2f}%)", annotation_position="top left")
+    fig.add_vline(x=start_price, line_dash="dot", line_color="grey")
+    fig.update_layout(
+        title=f"理论年化收益热力图：期末价格 × {axis}（{resolution} × {resolution}）",
+        xaxis_title="期末价格 (点位)",
+        yaxis_title=f"{axis} (%)",
+        template="plotly_white",
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def plot_rolling_backtest(params):
+    """
+    以标的历史上每一个交易日为起始日回测同一款雪球产品，展示结果分布。
+    params: 包含产品日程（交易日下标）与收益参数的字典
+    """
+    notional_principal = params["notional_principal"]
+    product = params["product"]
+    result, stats = backtest_snowball(
+        params["underlying_code"], **product.args, day_years=product.day_years,
+        first_start=params["first_start"], last_start=params["last_start"],
+    )
+    if stats["windows"] == 0:
+        st.warning("所选区间内没有完整覆盖产品期限的历史窗口，无法回测。")
+        return
+
+    q = stats["annual_return_quantiles"]
+    st.write(
+        f"- 回测起始日数量：{stats['windows']} 个（{result.start_dates[0]} 至 {result.start_dates[-1]}）  \n"
+        f"- 敲出比例：{stats['knock_out_rate']*100:.2f}%  \n"
+        f"- 敲入比例（未敲出且敲入）：{stats['knock_in_rate']*100:.2f}%  \n"
+        f"- 到期未敲入未敲出比例：{stats['hold_rate']*100:.2f}%  \n"
+        f"- 亏损比例：{stats['loss_rate']*100:.2f}%  \n"
+        f"- 平均年化收益率：{stats['mean_annual_return']*100:.2f}%  \n"
+        f"- 年化收益率分位数 (5%/25%/50%/75%/95%)："
+        f"{' / '.join(f'{q[k]*100:.2f}%' for k in sorted(q))}  \n"
+        f"- 平均存续期：{stats['mean_life_years']:.2f} 年  \n"
+        f"- 平均收益金额：{result.payoff.mean() * notional_principal:.2f} 万元"
+    )
+
+    start_dates = pd.DatetimeIndex(result.start_dates)
+    ann_pct = result.annual_return * 100
+    fig = go.Figure()
+    for mask, name, color in [
+        (result.knocked_out, "敲出", "green"),
+        (result.knocked_in, "敲入", "red"),
+        (~result.knocked_out & ~result.knocked_in, "到期未敲入未敲出", "blue"),
+    ]:
+        if mask.any():
+            fig.add_trace(go.Scatter(x=start_dates[mask], y=ann_pct[mask], mode="markers",
+                                     name=name, marker=dict(color=color, size=4)))
+    fig.add_hline(y=0, line_dash="solid", line_color="black", line_width=1)
+    fig.update_layout(title="各起始日的年化收益率", xaxis_title="起始日",
+                      yaxis_title="年化收益率 (%)", template="plotly_white")
+    st.plotly_chart(fig, use_container_width=True)
+
+    fig_hist = go.Figure(go.Histogram(x=ann_pct, nbinsx=60, marker_color="steelblue"))
+    fig_hist.update_layout(title="年化收益率分布", xaxis_title="年化收益率 (%)",
+                           yaxis_title="起始日数量", template="plotly_white")
+    st.plotly_chart(fig_hist, use_container_width=True)
+
+
+def plot_convergence(report, notional_principal):
+    """
+    展示不同路径生成方式的标准误随路径数的变化（对数坐标）。
+    report: engine.qmc.convergence_report 返回的 DataFrame
+    """
+    table = report.copy()
+    table["价格 (万元)"] = table.pop("价格") * notional_principal
+    table["标准误 (bp)"] = table.pop("标准误") * 1e4
+    st.dataframe(table, hide_index=True)
+
+    fig = go.Figure()
+    for name, rows in report.groupby("模型", sort=False):
+        fig.add_trace(go.Scatter(x=rows["路径数"], y=rows["标准误"] * 1e4, mode="lines+markers", name=name))
+    fig.update_layout(title="标准误 vs 路径数", xaxis_title="路径数", yaxis_title="标准误 (bp 名义本金)",
+                      xaxis_type="log", yaxis_type="log", template="plotly_white")
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def plot_greeks_surface(surface, product_dates, notional_principal):
+    """展示 标的价格 × 估值日 的价值与希腊字母曲面（每个指标一个标签页）"""
+    dates = [pd.Timestamp(product_dates[d]).strftime("%Y-%m-%d") for d in surface.days]
+    views = [
+        ("价值", surface.value * notional_principal, "万元"),
+        ("Delta", surface.delta * notional_principal / 100, "万元 / 标的涨 1%"),
+        ("Gamma", surface.gamma * notional_principal / 1e4, "万元 / (1%)²"),
+        ("Vega", surface.vega * notional_principal / 100, "万元 / 波动率 +1%"),
+        ("Theta", surface.theta * notional_principal, "万元 / 交易日"),
+    ]
+    for tab, (name, z, unit) in zip(st.tabs([name for name, _, _ in views]), views):
+        with tab:
+            fig = go.Figure(go.Surface(x=surface.spots * 100, y=dates, z=z, colorscale="RdBu", reversescale=True))
+            fig.update_layout(title=f"{name} 曲面 ({unit})", template="plotly_white", height=600,
+                              scene=dict(xaxis_title="标的价格 (% 期初价)", yaxis_title="估值日", zaxis_title=unit))
+            st.plotly_chart(fig, use_container_width=True)
+
+
+def plot_pde_profile(result, notional_principal):
+    """展示 PDE 第 0 天价值随期初价格的变化（未敲入 / 已敲入两层）"""
+    keep = (result.spots >= 0.4) & (result.spots <= 1.6)
+    fig = go.Figure()
+    for col, name in enumerate(["未敲入", "已敲入"]):
+        fig.add_trace(go.Scatter(
+            x=result.spots[keep] * 100, y=result.values[keep, col] * notional_principal,
+            mode="lines", name=name,
+        ))
+    fig.add_vline(x=100, line_dash="dash", line_color="gray")
+    fig.update_layout(title="收益现值 vs 标的价格 (PDE)", xaxis_title="标的价格 (% 期初价)",
+                      yaxis_title="收益现值 (万元)", template="plotly_white")
+    st.plotly_chart(fig, use_container_width=True)
+
+
 # -------------------------------
 # render() 函数保持不变，因为理论绘图函数的调用方式没有变
 # -------------------------------
@@ -248,60 +352,144 @@ def render():
 
     max_loss_ratio       = st.number_input("最大亏损比例 (%)", value=100.0, min_value=0.0, max_value=100.0) / 100.0
     
-    obs_dates_input    = st.text_area(
-        "敲出观察日列表 (YYYY/MM/DD，用逗号或换行分隔)",
-        "2025/06/09,2025/07/08,2025/08/08,2025/09/08,2025/10/09\n"
-        "2025/11/10,2025/12/08,2026/01/08,2026/02/09,2026/03/09\n"
-        "2026/04/08,2026/05/08,2026/06/08,2026/07/08,2026/08/10\n"
-        "2026/09/08,2026/10/08,2026/11/09,2026/12/08,2027/01/08\n"
-        "2027/02/12,2027/03/08,2027/04/08,2027/05/10"
-    )
-    obs_barriers_input  = st.text_area(
-        "对应敲出障碍价格 (%) 列表 (与观察日一一对应)",
-        "\n".join(["100.00%"]*24)
-    )
-    
-    obs_coupons_input    = st.text_area(
-        "对应敲出票息 (%) 列表 (与观察日一一对应)",
-        "\n".join(["2.34%"]*24)
-    )
+    schedule_mode        = st.selectbox("敲出观察日程", ["手动输入", "按规则生成"], index=0)
+    if schedule_mode == "按规则生成":
+        # 按月平移产品开始日，锁定期内不观察，非交易日按交易日历调整；障碍逐期阶梯下调
+        schedule_term    = int(st.number_input("产品期限 (月)", value=24, min_value=1, max_value=120))
+        schedule_freq    = st.selectbox("观察频率", list(FREQUENCIES), index=0)
+        schedule_lockout = int(st.number_input("锁定期 (月，之前不观察敲出)", value=0, min_value=0, max_value=120))
+        schedule_roll    = st.selectbox("非交易日调整", list(ROLLS), index=0)
+        barrier_initial  = st.number_input("首期敲出障碍价格 (%)", value=100.0, min_value=0.0, max_value=200.0) / 100.0
+        barrier_step     = st.number_input("每期障碍下调 (%)", value=0.0, min_value=0.0, max_value=10.0, step=0.5) / 100.0
+        barrier_floor    = st.number_input("最低敲出障碍价格 (%)", value=0.0, min_value=0.0, max_value=200.0) / 100.0
+        schedule_coupon  = st.number_input("敲出票息 (%)", value=2.34, min_value=0.0) / 100.0
+    else:
+        obs_dates_input    = st.text_area(
+            "敲出观察日列表 (YYYY/MM/DD，用逗号或换行分隔)",
+            "2025/06/09,2025/07/08,2025/08/08,2025/09/08,2025/10/09\n"
+            "2025/11/10,2025/12/08,2026/01/08,2026/02/09,2026/03/09\n"
+            "2026/04/08,2026/05/08,2026/06/08,2026/07/08,2026/08/10\n"
+            "2026/09/08,2026/10/08,2026/11/09,2026/12/08,2027/01/08\n"
+            "2027/02/12,2027/03/08,2027/04/08,2027/05/10"
+        )
+        obs_barriers_input  = st.text_area(
+            "对应敲出障碍价格 (%) 列表 (与观察日一一对应)",
+            "\n".join(["100.00%"]*24)
+        )
+
+        obs_coupons_input    = st.text_area(
+            "对应敲出票息 (%) 列表 (与观察日一一对应)",
+            "\n".join(["2.34%"]*24)
+        )
     
     dividend_mode        = st.selectbox("红利票息来源", ["同敲出票息", "自行输入"], index=0)
     dividend_rate = 0.0 # 默认值
     if dividend_mode == "同敲出票息":
-        tmp = [float(p.rstrip("%"))/100.0 for p in obs_coupons_input.replace("\n",",").split(",") if p.strip()]
-        dividend_rate = tmp[-1] if tmp else 0.0
+        if schedule_mode == "按规则生成":
+            dividend_rate = schedule_coupon
+        else:
+            try:
+                tmp = parse_percents(obs_coupons_input)
+            except ValueError:
+                tmp = () # 票息列表有误时在解析阶段报告
+            dividend_rate = tmp[-1] if len(tmp) else 0.0
     else:
         dividend_rate = st.number_input("红利票息 (%)", value=2.34, min_value=0.0) / 100.0
     
     start_price            = st.number_input("产品期初价格 (点位)", value=100.0, min_value=0.0)
     sim_start_date       = st.date_input("模拟数据开始日期 (用于历史模拟)",
                                           value=pd.to_datetime("2022-03-01").date())
+    show_heatmap         = st.checkbox("收益热力图：期末价格 × 参数", value=False)
+    if show_heatmap:
+        heatmap_axis     = st.selectbox("热力图纵轴", ["敲入障碍", "敲出票息"], index=0)
+        heatmap_resolution = int(st.number_input("热力图分辨率 (每个方向的格点数)", value=1000, min_value=50, max_value=2000, step=50))
+    run_backtest         = st.checkbox("滚动回测：以历史上每一个交易日为起始日评估本产品", value=False)
+    if run_backtest:
+        backtest_first   = st.date_input("回测起始日 (最早)", value=pd.to_datetime("2015-01-05").date())
+        backtest_last    = st.date_input("回测起始日 (最晚)", value=pd.to_datetime("2025-05-19").date())
+    run_mc               = st.checkbox("蒙特卡洛定价", value=False)
+    if run_mc:
+        mc_model         = st.selectbox("路径生成方式", ["几何布朗运动", "拟蒙特卡洛 (Sobol + 布朗桥)", "历史区块自助法"], index=0)
+        if mc_model == "历史区块自助法":
+            mc_mean_block    = st.number_input("平均块长 (交易日)", value=MEAN_BLOCK, min_value=1, max_value=250)
+        mc_control_variate = False
+        if mc_model != "历史区块自助法":
+            mc_control_variate = st.checkbox("控制变量法 (敲入亏损 ↔ 欧式看跌价差)", value=False)
+        mc_vol           = st.number_input("年化波动率 (%)", value=20.0, min_value=0.1, max_value=200.0) / 100.0
+        mc_rate          = st.number_input("无风险利率 (%)", value=2.0, min_value=-10.0, max_value=20.0) / 100.0
+        mc_div_yield     = st.number_input("标的分红率 (%)", value=0.0, min_value=-10.0, max_value=20.0) / 100.0
+        mc_paths         = int(st.number_input("模拟路径数", value=100000, min_value=1000, max_value=2000000, step=10000))
+        mc_target_bp     = st.number_input("目标标准误 (bp，0 为按路径数运行)", value=0.0, min_value=0.0, max_value=1000.0)
+        mc_time_budget   = st.number_input("时间预算 (秒，0 为不限)", value=0.0, min_value=0.0, max_value=600.0)
+        mc_seed          = int(st.number_input("随机数种子", value=2025, min_value=0))
+        mc_memory_mb     = st.number_input("模拟内存上限 (MB)", value=MEMORY_BUDGET_MB, min_value=16, max_value=8192)
+        mc_float32       = st.checkbox("单精度路径 (float32，节省内存)", value=False)
+        mc_workers       = int(st.number_input("并行进程数", value=1, min_value=1, max_value=os.cpu_count() or 1))
+        mc_convergence   = st.checkbox("收敛性报告 (标准误 vs 路径数)", value=False)
+        mc_fair_coupon   = st.checkbox("求解公允票息 (按面值)", value=False)
+
+    run_pde          = st.checkbox("有限差分 (PDE) 定价与希腊字母", value=False)
+    if run_pde:
+        pde_vol      = st.number_input("PDE 年化波动率 (%)", value=20.0, min_value=0.1, max_value=200.0) / 100.0
+        pde_rate     = st.number_input("PDE 无风险利率 (%)", value=2.0, min_value=-10.0, max_value=20.0) / 100.0
+        pde_div_yield = st.number_input("PDE 标的分红率 (%)", value=0.0, min_value=-10.0, max_value=20.0) / 100.0
+        pde_nodes    = int(st.number_input("空间网格节点数", value=N_SPACE, min_value=101, max_value=6401, step=100))
+
+    run_greeks       = st.checkbox("希腊字母曲面 (共同随机数)", value=False)
+    if run_greeks:
+        greeks_vol   = st.number_input("曲面 年化波动率 (%)", value=20.0, min_value=0.1, max_value=200.0) / 100.0
+        greeks_rate  = st.number_input("曲面 无风险利率 (%)", value=2.0, min_value=-10.0, max_value=20.0) / 100.0
+        greeks_div_yield = st.number_input("曲面 标的分红率 (%)", value=0.0, min_value=-10.0, max_value=20.0) / 100.0
+        greeks_paths = int(st.number_input("曲面 模拟路径数", value=GREEKS_PATHS, min_value=1000, max_value=200000, step=5000))
+        greeks_seed  = int(st.number_input("曲面 随机数种子", value=2025, min_value=0))
 
     # 等待按钮触发
     if not st.button("生成分析图表"):
         st.info("请填写完参数后，点击“生成分析图表”")
         return
 
-    # ---- 解析敲出列表 ----
-    def parse_date_list(s: str):
-        return [pd.to_datetime(x).date() for x in s.replace("\n",",").split(",") if x.strip()]
-
-    def parse_pct_list(s: str):
-        return [float(x.rstrip("%"))/100.0 for x in s.replace("\n",",").split(",") if x.strip()]
-
-    obs_dates    = parse_date_list(obs_dates_input)
-    obs_barriers = parse_pct_list(obs_barriers_input)
-    obs_coupons  = parse_pct_list(obs_coupons_input)
+    # ---- 敲出日程：整体解析文本列表，或按规则生成 ----
+    try:
+        if schedule_mode == "按规则生成":
+            obs_dates    = observation_schedule(
+                get_calendar(), start_date, schedule_term, FREQUENCIES[schedule_freq],
+                schedule_lockout, ROLLS[schedule_roll],
+            )
+            obs_barriers = step_down_barriers(len(obs_dates), barrier_initial, barrier_step, barrier_floor)
+            obs_coupons  = np.full(len(obs_dates), schedule_coupon)
+        else:
+            obs_dates    = parse_dates(obs_dates_input)
+            obs_barriers = parse_percents(obs_barriers_input)
+            obs_coupons  = parse_percents(obs_coupons_input)
+    except ValueError as e:
+        st.error(f"敲出日程有误：{e}")
+        return
 
     if not (len(obs_dates)==len(obs_barriers)==len(obs_coupons)):
         st.error("观察日、障碍价、票息 列表长度必须一致")
         return
 
+    # 产品条款只构造一次，后续各引擎共用其编译结果
+    spec_class = TernarySnowballSpec if snowball_type == TernarySnowballSpec.kind else SnowballSpec
+    try:
+        spec = spec_class(
+            start_date, obs_dates, obs_barriers, obs_coupons, knock_in_pct, knock_in_style == "每日观察",
+            knock_in_strike_pct=knock_in_strike_pct, participation_rate=participation_rate,
+            guaranteed_return=guaranteed_return, max_loss_ratio=max_loss_ratio, dividend_rate=dividend_rate,
+        )
+    except ValueError as e:
+        st.error(str(e))
+        return
+    if schedule_mode == "按规则生成":
+        with st.expander(f"生成的敲出日程（{len(obs_dates)} 期）"):
+            st.dataframe(pd.DataFrame({
+                "敲出观察日": obs_dates,
+                "敲出障碍价格 (%)": obs_barriers * 100,
+                "敲出票息 (%)": obs_coupons * 100,
+            }), hide_index=True)
+
     # 映射
     knock_in_level   = start_price * knock_in_pct
-    obs_barrier_lvls = [start_price * p for p in obs_barriers]
-    obs_dict         = dict(zip(obs_dates, obs_barrier_lvls))
 
     # -------------------------------
     # 2. 图1: 理论年化收益曲线
@@ -322,6 +510,7 @@ def render():
         "obs_barriers": obs_barriers,
         "obs_coupons": obs_coupons,
         "dividend_rate": dividend_rate,
+        "dividend_follows_coupon": dividend_mode == "同敲出票息",
         "start_date": start_date
     }
     plot_theoretical_payoff(params)
@@ -342,6 +531,13 @@ def render():
         * **三元雪球产品**：曲线在此区域表现为一条**水平线**，表示即使触发敲入，您仍能获得一个**固定的保底年化收益率**。
     """)
 
+    if show_heatmap:
+        plot_payoff_heatmap(params, heatmap_axis, heatmap_resolution)
+        st.markdown("""
+        **热力图**：横轴为期末价格，纵轴为所选参数，颜色为理论年化收益（口径同上图）；
+        黑色虚线为当前参数，沿虚线的横截面即为上面的收益曲线。
+        """)
+
 
     # -------------------------------
     # 3. 图2: 历史模拟价格路径
@@ -351,55 +547,52 @@ def render():
     period_days  = (pd.to_datetime(final_obs) - pd.to_datetime(start_date)).days
     fetch_end    = sim_start_date + datetime.timedelta(days=period_days+90)
 
-    raw  = get_price_data([underlying_code],
-                          sim_start_date.strftime("%Y-%m-%d"),
-                          fetch_end.strftime("%Y-%m-%d"))
-    hist = raw.get(underlying_code, [])
-    if not hist:
+    hist = get_price_series(underlying_code, sim_start_date, fetch_end)
+    if hist is None or len(hist.close) == 0:
         st.error("无法获取历史数据")
         return
 
-    df = pd.DataFrame(hist)
-    df["date"]  = pd.to_datetime(df["date"])
-    price_col   = "close" if "close" in df else df.columns[1]
-    df["price"] = df[price_col].astype(float)
-    df.sort_values("date", inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    df["ret"]   = df["price"].pct_change().fillna(0)
-    rets        = df["ret"].values
+    # 收益率已在价格索引中预先算好；窗口首日收益记为 0，与窗口内 pct_change().fillna(0) 一致
+    rets        = np.concatenate([[0.0], hist.ret[1:]])
 
-    sim_dates = pd.bdate_range(start_date, final_obs)
+    # 模拟区间使用交易日历（实际交易日 + 推算的未来交易日），观察日编译成区间内的整数下标，
+    # 非交易日的观察日顺延到下一交易日
+    calendar = get_calendar()
+    try:
+        product = spec.compile(calendar)
+    except ValueError as e:
+        st.error(f"交易日历无法覆盖产品期限：{e}")
+        return
+    sim_dates = pd.DatetimeIndex(product.dates)
     N         = len(sim_dates)
-    # 确保retes的长度足够，或截断
-    rets      = np.concatenate([rets, np.zeros(max(0,(N-1)-len(rets)))])[:N-1]
-
-    sim_prices    = [start_price]
-    knock_ined    = False
-    knock_out     = False
-    knock_in_date = knock_out_date = None
-
-    for i, r in enumerate(rets):
-        if knock_out: break
-        new_p = sim_prices[-1] * (1 + r)
-        today = sim_dates[i+1]
-        sim_prices.append(new_p)
-
-        if knock_in_style == "每日观察" and not knock_ined and new_p < knock_in_level:
-            knock_ined, knock_in_date = True, today
-
-        if today.date() in obs_dict and new_p >= obs_dict[today.date()]:
-            knock_out, knock_out_date = True, today
-            break
-
-    if not knock_out and knock_in_style == "到期观察":
-        final_p = sim_prices[-1]
-        if final_p < knock_in_level:
-            knock_ined, knock_in_date = True, sim_dates[-1]
+    # 历史数据不足以覆盖产品期限时，尾部由全部历史日收益率的区块自助法抽样补足（不补零）
+    rets, n_filled = extend_returns(rets, N-1, history_log_returns(underlying_code))
+    if n_filled:
+        st.info(f"所选历史区间只覆盖前 {N-1-n_filled} 个交易日，其余 {n_filled} 个交易日由历史区块自助法抽样补足")
+
+    # 整条路径一次性估值：累乘得到价格，首次命中掩码得到敲入/敲出下标
+    ko_idx, ko_obs = product.ko_idx, product.ko_obs
+    ko_levels      = start_price * product.ko_barriers
+    sim_prices     = price_path(start_price, rets)
+    outcome        = evaluate_snowball(sim_prices, ko_idx, ko_levels, ko_obs,
+                                       knock_in_level, knock_in_style == "每日观察")
+    payoff         = float(snowball_payoff(
+        outcome, snowball_type, start_price, notional_principal,
+        obs_coupons, knock_in_strike_pct, participation_rate,
+        guaranteed_return, max_loss_ratio, dividend_rate, product.term_in_years
+    ))
+
+    knock_out_idx = int(outcome.knock_out_idx) if outcome.knock_out_idx >= 0 else None
+    knock_in_idx  = int(outcome.knock_in_idx) if outcome.knock_in_idx >= 0 else None
+    knock_out     = knock_out_idx is not None
+    knock_ined    = knock_in_idx is not None
+
+    knock_in_date  = sim_dates[knock_in_idx] if knock_in_idx is not None else None
+    knock_out_date = sim_dates[knock_out_idx] if knock_out_idx is not None else None
 
     if knock_out:
-        idx = list(sim_dates).index(knock_out_date)
-        sim_dates    = sim_dates[:idx+1]
-        sim_prices = sim_prices[:idx+1]
+        sim_dates  = sim_dates[:knock_out_idx+1]
+        sim_prices = sim_prices[:knock_out_idx+1]
 
     sim_df = pd.DataFrame({"price": sim_prices}, index=sim_dates)
 
@@ -410,12 +603,10 @@ def render():
                               y=[knock_in_level]*2,
                               mode="lines", name="敲入线",
                               line=dict(color="red", dash="dash")))
-    xs, ys = [], []
-    for d, lvl in obs_dict.items():
-        dt = pd.to_datetime(d)
-        if dt in sim_df.index:
-            xs.append(dt); ys.append(lvl)
-    if xs:
+    ko_shown = ko_idx < len(sim_df)
+    xs = sim_df.index[ko_idx[ko_shown]]
+    ys = ko_levels[ko_shown]
+    if len(xs):
         fig2.add_trace(go.Scatter(x=xs, y=ys, mode="markers",
                                   name="敲出障碍价",
                                   marker=dict(color="green", size=8)))
@@ -438,10 +629,8 @@ def render():
     # -------------------------------
     st.header("事件结果")
     if knock_out_date:
-        idx         = obs_dates.index(knock_out_date.date())
-        coupon      = obs_coupons[idx]
-        active_days = sim_df.index.get_loc(knock_out_date) + 1
-        payoff      = notional_principal  * coupon * active_days / 365
+        coupon      = obs_coupons[int(outcome.ko_obs)]
+        active_days = knock_out_idx + 1
         st.write(
             f"- 敲出日期：{knock_out_date.date()}  \n"
             f"- 存续交易日：{active_days} 天  \n"
@@ -450,11 +639,11 @@ def render():
         )
     elif knock_ined:
         if snowball_type == "雪球":
-            final_price     = sim_prices[-1]
+            final_price     = float(outcome.final_price)
             final_pct       = final_price / start_price
             raw_loss_pct    = max(0.0, knock_in_strike_pct - final_pct)
             capped_loss_pct = min(raw_loss_pct, max_loss_ratio)
-            loss_amt        = capped_loss_pct * notional_principal * participation_rate
+            loss_amt        = -payoff
 
             st.write(
                 f"- 敲入发生日期：{knock_in_date.date()}  \n"
@@ -468,9 +657,110 @@ def render():
         else:
             st.write(
                 f"- 敲入发生日期：{knock_in_date.date()}  \n"
-                f"- 获得敲入收益：{guaranteed_return * notional_principal:.2f}万元 "
+                f"- 获得敲入收益：{payoff:.2f}万元 "
             )
     else:
-        term_in_years_final = (pd.to_datetime(obs_dates[-1]) - pd.to_datetime(start_date)).days / 365.0
-        payoff = notional_principal * dividend_rate * term_in_years_final
-        st.write(f"- 产品到期，未触发敲出或敲入事件，获得红利票息收益：{payoff:.2f} 万元")
\ No newline at end of file
+        st.write(f"- 产品到期，未触发敲出或敲入事件，获得红利票息收益：{payoff:.2f} 万元")
+
+    # -------------------------------
+    # 5. 图3: 滚动起始日历史回测
+    # -------------------------------
+    if run_backtest:
+        st.header("👑图3：滚动起始日历史回测👑")
+        plot_rolling_backtest({
+            "underlying_code": underlying_code,
+            "notional_principal": notional_principal,
+            "product": product,
+            "first_start": backtest_first,
+            "last_start": backtest_last,
+        })
+
+    # -------------------------------
+    # 6. 蒙特卡洛定价
+    # -------------------------------
+    if run_mc:
+        st.header("👑蒙特卡洛定价👑")
+        mc_path_model = None # 缺省为几何布朗运动
+        if mc_model == "历史区块自助法":
+            # 全部历史日收益率按区块重抽样，历史测度下的分布；无风险利率仅用于贴现
+            mc_path_model = BootstrapModel(history_log_returns(underlying_code), mc_mean_block)
+        elif mc_model == "拟蒙特卡洛 (Sobol + 布朗桥)":
+            # 布朗桥优先生成观察日，Sobol 前几维落在对收益影响最大的日期上
+            mc_path_model = SobolGBMModel(mc_vol, mc_rate, mc_div_yield, ko_idx)
+        def mc_price(model, n_paths, seed):
+            return price_snowball_mc(
+                **product.args, times=product.times,
+                vol=mc_vol, rate=mc_rate, div_yield=mc_div_yield, n_paths=n_paths, seed=seed,
+                memory_mb=mc_memory_mb, dtype=np.float32 if mc_float32 else np.float64, workers=mc_workers,
+                model=model, control_variate=mc_control_variate,
+                # 给出目标标准误或时间预算时逐批运行，模拟路径数为上限
+                target_bp=mc_target_bp or None, time_budget=mc_time_budget or None,
+            )
+        mc_t0 = time.perf_counter()
+        mc = mc_price(mc_path_model, mc_paths, mc_seed)
+        mc_elapsed = time.perf_counter() - mc_t0
+        st.write(
+            f"- 路径生成方式：{mc_model}，模拟路径数：{mc.n_paths}，用时 {mc_elapsed:.2f} 秒  \n"
+            f"- 收益现值：**{mc.price * notional_principal:.2f} 万元**"
+            f"（{mc.price*100:.3f}% 名义本金，标准误 {mc.std_error*100:.3f}%）  \n"
+            f"- 敲出概率：{mc.ko_prob*100:.2f}%  \n"
+            f"- 敲入概率（未敲出且敲入）：{mc.ki_prob*100:.2f}%  \n"
+            f"- 期望存续期：{mc.expected_life:.2f} 年"
+        )
+        if mc_target_bp and mc.std_error * 1e4 > mc_target_bp:
+            st.warning(f"未达到目标标准误 {mc_target_bp:.1f} bp（实际 {mc.std_error*1e4:.1f} bp），可提高路径数上限或时间预算")
+        if mc_control_variate:
+            st.write(f"- 控制变量法方差缩减倍数：{mc.variance_reduction:.2f}（等效路径数 × {mc.variance_reduction:.2f}）")
+        if mc_fair_coupon:
+            st.subheader("公允票息")
+            # 路径只模拟一次并缓存逐路径事件；票息按比例缩放时收益是仿射的，闭式求解
+            cache = simulate_snowball(
+                **product.args, times=product.times,
+                vol=mc_vol, rate=mc_rate, div_yield=mc_div_yield, n_paths=mc_paths, seed=mc_seed,
+                memory_mb=mc_memory_mb, dtype=np.float32 if mc_float32 else np.float64, model=mc_path_model,
+            )
+            fair = solve_fair_coupon(cache, scale_dividend=dividend_mode == "同敲出票息")
+            st.write(
+                f"- 票息倍数：{fair.scale:.4f}（标准误 {fair.std_error:.4f}）  \n"
+                f"- 公允敲出票息（末期，年化）：**{fair.rates[-1]*100:.2f}%**（当前 {obs_coupons[-1]*100:.2f}%）  \n"
+                f"- 公允红利票息：{fair.dividend_rate*100:.2f}%"
+            )
+        if mc_convergence:
+            st.subheader("收敛性报告")
+            report = convergence_report(mc_price, {
+                "伪随机 (几何布朗运动)": GBMModel(mc_vol, mc_rate, mc_div_yield),
+                "拟蒙特卡洛 (Sobol + 布朗桥)": SobolGBMModel(mc_vol, mc_rate, mc_div_yield, ko_idx),
+            }, sorted({max(1024, mc_paths // 16), max(1024, mc_paths // 4), mc_paths}), mc_seed)
+            plot_convergence(report, notional_principal)
+
+    # -------------------------------
+    # 7. 有限差分（PDE）定价
+    # -------------------------------
+    if run_pde:
+        st.header("👑有限差分定价👑")
+        pde_t0 = time.perf_counter()
+        pde = price_snowball_pde(
+            **product.args, times=product.times,
+            vol=pde_vol, rate=pde_rate, div_yield=pde_div_yield, n_space=pde_nodes,
+        )
+        st.write(
+            f"- 收益现值：**{pde.price * notional_principal:.2f} 万元**（{pde.price*100:.3f}% 名义本金），"
+            f"用时 {(time.perf_counter() - pde_t0)*1000:.0f} 毫秒  \n"
+            f"- Delta：{pde.delta * notional_principal / 100:.2f} 万元 / 标的涨 1%  \n"
+            f"- Gamma：{pde.gamma * notional_principal / 1e4:.3f} 万元 / (1%)²"
+        )
+        plot_pde_profile(pde, notional_principal)
+
+    # -------------------------------
+    # 8. 希腊字母曲面
+    # -------------------------------
+    if run_greeks:
+        st.header("👑希腊字母曲面👑")
+        # 所有扰动共用同一组布朗路径（按路径数与种子缓存，重复运行时复用）
+        greeks_t0 = time.perf_counter()
+        surface = greeks_surface(
+            snowball_product(**product.args), product.times,
+            greeks_vol, greeks_rate, greeks_div_yield, n_paths=greeks_paths, seed=greeks_seed,
+        )
+        st.write(f"- 共同随机数重定价，模拟路径数：{greeks_paths}，用时 {time.perf_counter() - greeks_t0:.2f} 秒")
+        plot_greeks_surface(surface, product.dates, notional_principal)
@@ -0,0 +1,311 @@
+"""
+滚动起始日历史回测。
+
+把标的整段历史收盘价按每一个可能的起始日切成 (起始日 × 交易日) 的二维窗口
+（滑动视图，归一化时才生成一份拷贝），交给各产品的向量化内核一次性估值，
+得到所有历史起始日的结果分布。结果按产品定义 + 行情数据版本缓存。
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from engine.phoenix import evaluate_phoenix, phoenix_cashflows
+from engine.sharkfin import CALL, sharkfin_payoff
+from engine.snowball import evaluate_snowball, snowball_payoff
+from price_store import TRADING_DAYS_PER_YEAR, get_index, to_day
+
+# 回测明细，除 quantiles 外均为长度 = 窗口数 的数组
+# payoff / annual_return 以名义本金为 1 计；life_years 为产品存续年数
+BacktestResult = namedtuple(
+    "BacktestResult",
+    ["start_dates", "payoff", "annual_return", "life_years", "knocked_out", "knocked_in"],
+)
+
+# 凤凰产品回测明细：在 BacktestResult 字段之外拆分派息收入与本金亏损，
+# 并记录每个窗口已派息 / 未派息的期数
+PhoenixBacktestResult = namedtuple(
+    "PhoenixBacktestResult",
+    BacktestResult._fields + ("coupon_income", "principal_loss", "coupons_paid", "coupons_missed"),
+)
+
+# 鲨鱼鳍回测明细，均为长度 = 窗口数 的数组：payoff / annual_return 以名义本金为 1 计；
+# hit 为存续期内是否触碰障碍；extreme / final_price 为观察日极值（看涨为最高价，看跌为最低价）与期末价格，
+# 均为期初价倍数
+SharkfinBacktestResult = namedtuple(
+    "SharkfinBacktestResult", ["start_dates", "payoff", "annual_return", "hit", "extreme", "final_price"]
+)
+
+# 汇总统计的分位点
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def rolling_paths(close, n_days, lo=0, hi=None):
+    """
+    返回 close[lo:hi] 范围内每个起始日 s 的相对价格路径 close[s:s+n_days] / close[s]，
+    形状 (窗口数, n_days)。只包含完整窗口，不做任何补零。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    if len(close) < n_days:
+        return np.empty((0, n_days))
+    windows = sliding_window_view(close, n_days)[lo:hi]
+    return windows / windows[:, :1]
+
+
+def sliding_extreme(x, window, largest=True):
+    """
+    长度为 window 的滑动窗口最大值（largest=False 时为最小值），返回长度 len(x) - window + 1。
+    van Herk / Gil-Werman 算法：按 window 分块求块内前缀与后缀累积极值，
+    每个窗口恰好跨越一个块边界，其极值 = 左块后缀极值 与 右块前缀极值 中的较大（小）者，
+    总计算量 O(len(x))，与窗口长度无关。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    if window < 1 or n < window:
+        return np.empty(0)
+    ufunc = np.maximum if largest else np.minimum
+    fill = -np.inf if largest else np.inf
+    n_blocks = -(-n // window)
+    blocks = np.full(n_blocks * window, fill)
+    blocks[:n] = x
+    blocks = blocks.reshape(n_blocks, window)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    starts = np.arange(n - window + 1)
+    return ufunc(suffix[starts], prefix[starts + window - 1])
+
+
+def start_range(dates, n_days, first_start=None, last_start=None):
+    """起始日落在 [first_start, last_start] 且窗口完整的起始下标范围 (lo, hi)"""
+    n_windows = max(0, len(dates) - n_days + 1)
+    lo = 0 if first_start is None else int(np.searchsorted(dates, to_day(first_start), side="left"))
+    hi = n_windows if last_start is None else int(np.searchsorted(dates, to_day(last_start), side="right"))
+    hi = min(hi, n_windows)
+    return min(lo, hi), hi
+
+
+def summarize(result):
+    """回测结果的汇总统计（BacktestResult 与 PhoenixBacktestResult 通用）"""
+    n = len(result.payoff)
+    if n == 0:
+        return {"windows": 0}
+    ann = result.annual_return
+    return {
+        "windows": n,
+        "knock_out_rate": float(result.knocked_out.mean()),
+        "knock_in_rate": float(result.knocked_in.mean()),
+        "hold_rate": float((~result.knocked_out & ~result.knocked_in).mean()),
+        "mean_annual_return": float(ann.mean()),
+        "annual_return_quantiles": dict(zip(QUANTILES, np.quantile(ann, QUANTILES).tolist())),
+        "mean_life_years": float(result.life_years.mean()),
+        "loss_rate": float((result.payoff < 0).mean()),
+    }
+
+
+def summarize_phoenix(result):
+    """凤凰产品回测的汇总统计：通用统计 + 派息收入与本金亏损的分布"""
+    stats = summarize(result)
+    if stats["windows"] == 0:
+        return stats
+    loss = result.principal_loss
+    stats.update({
+        "mean_coupon_income": float(result.coupon_income.mean()),
+        "coupon_income_quantiles": dict(zip(QUANTILES, np.quantile(result.coupon_income, QUANTILES).tolist())),
+        "mean_coupons_paid": float(result.coupons_paid.mean()),
+        "mean_coupons_missed": float(result.coupons_missed.mean()),
+        "mean_principal_loss": float(loss.mean()),
+        "principal_loss_quantiles": dict(zip(QUANTILES, np.quantile(loss, QUANTILES).tolist())),
+        "principal_loss_rate": float((loss > 0).mean()),
+    })
+    return stats
+
+
+def backtest_snowball(
+    code, ko_idx, ko_barriers, ko_obs, obs_coupons, knock_in_pct, daily_knock_in,
+    snowball_type, knock_in_strike_pct, participation_rate, guaranteed_return,
+    max_loss_ratio, dividend_rate, term_in_years, day_years,
+    first_start=None, last_start=None
+):
+    """
+    对标的历史上每一个起始日回测同一款雪球产品。
+    产品日程以交易日下标表示（与页面编译结果一致）：
+      ko_idx / ko_barriers / ko_obs: 敲出观察日下标、障碍（期初价百分比）、观察日原始序号
+      day_years: 长度 N 的数组，第 j 个交易日距起始日的自然年数，N 即产品交易日数
+    其余参数与 engine.snowball.snowball_payoff 相同。收益以名义本金为 1 计。
+    返回 (BacktestResult, 汇总统计 dict)。
+    """
+    index = get_index(code)
+    return _backtest_snowball(
+        code, index.version,
+        tuple(int(i) for i in ko_idx), tuple(float(b) for b in ko_barriers),
+        tuple(int(o) for o in ko_obs), tuple(float(c) for c in obs_coupons),
+        float(knock_in_pct), bool(daily_knock_in), snowball_type,
+        float(knock_in_strike_pct), float(participation_rate), float(guaranteed_return),
+        float(max_loss_ratio), float(dividend_rate), float(term_in_years),
+        tuple(float(y) for y in day_years),
+        None if first_start is None else str(to_day(first_start)),
+        None if last_start is None else str(to_day(last_start)),
+    )
+
+
+@lru_cache(maxsize=32)
+def _backtest_snowball(
+    code, version, ko_idx, ko_barriers, ko_obs, obs_coupons, knock_in_pct, daily_knock_in,
+    snowball_type, knock_in_strike_pct, participation_rate, guaranteed_return,
+    max_loss_ratio, dividend_rate, term_in_years, day_years, first_start, last_start
+):
+    index = get_index(code)
+    day_years = np.asarray(day_years)
+    n_days = len(day_years)
+    lo, hi = start_range(index.dates, n_days, first_start, last_start)
+    paths = rolling_paths(index.close, n_days, lo, hi)
+
+    ko_idx = np.asarray(ko_idx, dtype=np.int64)
+    outcome = evaluate_snowball(paths, ko_idx, np.asarray(ko_barriers), ko_obs, knock_in_pct, daily_knock_in)
+    payoff = snowball_payoff(
+        outcome, snowball_type, 1.0, 1.0,
+        obs_coupons, knock_in_strike_pct, participation_rate,
+        guaranteed_return, max_loss_ratio, dividend_rate, term_in_years,
+    )
+
+    knocked_out = outcome.knock_out_idx >= 0
+    knocked_in = ~knocked_out & (outcome.knock_in_idx >= 0)
+    life_years = np.where(knocked_out, day_years[np.maximum(outcome.knock_out_idx, 0)], term_in_years)
+    # 敲出收益按 存续交易日 / 365 计息（snowball_payoff），年化用同一口径，敲出窗口的年化收益即当期票息；
+    # 起始日当天敲出不会发生：第 0 天不观察
+    accrual_years = np.where(knocked_out, (outcome.knock_out_idx + 1) / 365, term_in_years)
+    annual_return = payoff / np.maximum(accrual_years, 1.0 / 365)
+
+    result = BacktestResult(index.dates[lo:hi], payoff, annual_return, life_years, knocked_out, knocked_in)
+    for arr in result:
+        arr.flags.writeable = False
+    return result, summarize(result)
+
+
+def backtest_phoenix(
+    code, ko_idx, ko_barriers, ko_obs, knock_in_pct, daily_knock_in,
+    div_idx, dividend_barrier_pct, obs_dividend_rates,
+    knock_in_strike_pct, participation_rate, max_loss_ratio, term_in_years, day_years,
+    first_start=None, last_start=None
+):
+    """
+    对标的历史上每一个起始日回测同一款凤凰产品。
+    ko_idx / ko_barriers / ko_obs / day_years: 同 backtest_snowball
+    div_idx: 每期派息观察日的交易日下标；dividend_barrier_pct: 派息障碍（期初价百分比）
+    其余参数与 engine.phoenix.phoenix_cashflows 相同。收益以名义本金为 1 计。
+    返回 (PhoenixBacktestResult, 汇总统计 dict)。
+    """
+    index = get_index(code)
+    return _backtest_phoenix(
+        code, index.version,
+        tuple(int(i) for i in ko_idx), tuple(float(b) for b in ko_barriers),
+        tuple(int(o) for o in ko_obs), float(knock_in_pct), bool(daily_knock_in),
+        tuple(int(i) for i in div_idx), float(dividend_barrier_pct),
+        tuple(float(r) for r in obs_dividend_rates),
+        float(knock_in_strike_pct), float(participation_rate), float(max_loss_ratio),
+        float(term_in_years), tuple(float(y) for y in day_years),
+        None if first_start is None else str(to_day(first_start)),
+        None if last_start is None else str(to_day(last_start)),
+    )
+
+
+@lru_cache(maxsize=32)
+def _backtest_phoenix(
+    code, version, ko_idx, ko_barriers, ko_obs, knock_in_pct, daily_knock_in,
+    div_idx, dividend_barrier_pct, obs_dividend_rates,
+    knock_in_strike_pct, participation_rate, max_loss_ratio, term_in_years, day_years,
+    first_start, last_start
+):
+    index = get_index(code)
+    day_years = np.asarray(day_years)
+    n_days = len(day_years)
+    lo, hi = start_range(index.dates, n_days, first_start, last_start)
+    paths = rolling_paths(index.close, n_days, lo, hi)
+
+    outcome = evaluate_phoenix(
+        paths, np.asarray(ko_idx, dtype=np.int64), np.asarray(ko_barriers), ko_obs,
+        knock_in_pct, div_idx, dividend_barrier_pct, daily_knock_in,
+    )
+    coupon_income, principal_loss = phoenix_cashflows(
+        outcome, 1.0, 1.0, obs_dividend_rates,
+        knock_in_strike_pct, participation_rate, max_loss_ratio,
+    )
+    payoff = coupon_income - principal_loss
+
+    knocked_out = outcome.knock_out_idx >= 0
+    knocked_in = ~knocked_out & (outcome.knock_in_idx >= 0)
+    life_years = np.where(knocked_out, day_years[np.maximum(outcome.knock_out_idx, 0)], term_in_years)
+    annual_return = payoff / np.maximum(life_years, 1.0 / 365)
+    coupons_paid = outcome.coupon_paid.sum(axis=-1)
+    coupons_missed = outcome.coupon_observed.sum(axis=-1) - coupons_paid
+
+    result = PhoenixBacktestResult(
+        index.dates[lo:hi], payoff, annual_return, life_years, knocked_out, knocked_in,
+        coupon_income, principal_loss, coupons_paid, coupons_missed,
+    )
+    for arr in result:
+        arr.flags.writeable = False
+    return result, summarize_phoenix(result)
+
+
+def backtest_sharkfin(
+    code, direction, strike, barrier, participation, rebate_rate, term_years,
+    n_days=None, first_start=None, last_start=None
+):
+    """
+    对标的历史上每一个起始日回测同一款鲨鱼鳍（每日收盘观察障碍，第 0 天不观察）。
+    产品参数同 engine.sharkfin.price_sharkfin_mc（即 engine.products.SharkfinSpec 编译结果的 args）：
+    strike / barrier: 执行价、障碍价（期初价倍数）；participation: 参与率；rebate_rate: 越过障碍的固定年化回报；
+    term_years: 产品期限（年）；n_days: 产品交易日数（含起始日），缺省按 term_years × 252 取整 + 1。
+    收益规则同 engine.sharkfin.sharkfin_payoff，以名义本金为 1 计。
+    返回 (SharkfinBacktestResult, 汇总统计 dict)。
+    """
+    index = get_index(code)
+    if n_days is None:
+        n_days = int(round(term_years * TRADING_DAYS_PER_YEAR)) + 1
+    return _backtest_sharkfin(
+        code, index.version, direction, float(strike), float(barrier),
+        float(participation), float(rebate_rate), float(term_years), int(n_days),
+        None if first_start is None else str(to_day(first_start)),
+        None if last_start is None else str(to_day(last_start)),
+    )
+
+
+@lru_cache(maxsize=32)
+def _backtest_sharkfin(
+    code, version, direction, strike_pct, barrier_pct, participation_rate, rebate_rate, term_years,
+    n_days, first_start, last_start
+):
+    index = get_index(code)
+    close = np.asarray(index.close, dtype=np.float64)
+    lo, hi = start_range(index.dates, n_days, first_start, last_start)
+    start = close[lo:hi]
+    # 起始日 s 的观察日为 s+1 .. s+n_days-1：对 close[1:] 做长度 n_days-1 的滑动极值
+    extreme = sliding_extreme(close[1:], n_days - 1, largest=direction == CALL)[lo:hi] / start
+    final_price = close[lo + n_days - 1:hi + n_days - 1] / start
+    payoff, hit = sharkfin_payoff(
+        direction, extreme, final_price, strike_pct, barrier_pct, participation_rate, rebate_rate, term_years
+    )
+    annual_return = payoff / term_years
+
+    result = SharkfinBacktestResult(index.dates[lo:hi], payoff, annual_return, hit, extreme, final_price)
+    for arr in result:
+        arr.flags.writeable = False
+    return result, summarize_sharkfin(result)
+
+
+def summarize_sharkfin(result):
+    """鲨鱼鳍回测的汇总统计：触碰障碍比例、零收益比例与年化收益率分布"""
+    n = len(result.payoff)
+    if n == 0:
+        return {"windows": 0}
+    ann = result.annual_return
+    return {
+        "windows": n,
+        "hit_rate": float(result.hit.mean()),
+        "zero_return_rate": float((result.payoff <= 0).mean()),
+        "mean_annual_return": float(ann.mean()),
+        "annual_return_quantiles": dict(zip(QUANTILES, np.quantile(ann, QUANTILES).tolist())),
+        "max_annual_return": float(ann.max()),
+    }
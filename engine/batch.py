@@ -0,0 +1,178 @@
+"""
+无界面批量蒙特卡洛定价入口（夜间批处理、定价服务器等场景）。
+
+    python -m engine.batch jobs.json [--workers 32] [--out results.csv]
+
+jobs.json 为产品定义列表，比例均以小数表示，日期为 YYYY-MM-DD，例如：
+    [{"name": "中证1000雪球", "product": "snowball", "start_date": "2025-05-08",
+      "obs_dates": ["2025-08-08", ...], "obs_barriers": [1.0, ...], "obs_coupons": [0.1485, ...],
+      "knock_in_pct": 0.7, "vol": 0.22, "rate": 0.018, "n_paths": 200000, "seed": 1},
+     {"name": "凤凰", "product": "phoenix", "start_date": "2025-05-20",
+      "obs_dates": [...], "obs_barriers": [...],
+      "obs_dividend_dates": [...], "obs_dividend_rates": [0.0116, ...],
+      "knock_in_pct": 0.7, "dividend_barrier_pct": 0.7, "vol": 0.22},
+     {"name": "看涨鲨鱼鳍", "product": "sharkfin", "direction": "看涨鲨鱼鳍",
+      "strike_pct": 1.0, "barrier_pct": 1.1, "participation_rate": 1.0, "rebate_rate": 0.05,
+      "term_months": 12, "vol": 0.2}]
+未给出的参数取页面的默认值。鲨鱼鳍障碍每日收盘观察，只支持几何布朗运动（gbm）。观察日按交易日历编译（非交易日顺延），
+扩散时间按交易日 / TRADING_DAYS_PER_YEAR 计。
+"model": "bootstrap" 时改用历史区块自助法，需给出 "underlying"（如 "000852.SH"），
+可选 "mean_block"（平均块长，交易日），此时 vol 不再需要；
+"model": "qmc" 时改用扰动 Sobol + 布朗桥（拟蒙特卡洛）。
+"control_variate": true 时以敲入亏损腿的欧式看跌价差为控制变量（仅 gbm / qmc），
+结果的 variance_reduction 列为方差缩减倍数。
+"target_bp"（目标标准误，基点）/ "time_budget"（秒）给出时逐批运行、达到即停止，n_paths 为上限。
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from engine.bootstrap import MEAN_BLOCK, BootstrapModel, history_log_returns
+from engine.montecarlo import MEMORY_BUDGET_MB, price_phoenix_mc, price_snowball_mc
+from engine.products import PhoenixSpec, SharkfinSpec, SnowballSpec, TernarySnowballSpec
+from engine.qmc import SobolGBMModel
+from engine.sharkfin import price_sharkfin_mc
+from trading_calendar import get_calendar
+
+# 与页面一致的默认参数
+DEFAULTS = {
+    "snowball_type": "雪球",
+    "knock_in_pct": 0.7,
+    "knock_in_strike_pct": 1.0,
+    "participation_rate": 1.0,
+    "guaranteed_return": 0.01,
+    "max_loss_ratio": 1.0,
+    "daily_knock_in": True,
+    "dividend_barrier_pct": 0.7,
+    "rate": 0.0,
+    "div_yield": 0.0,
+    "n_paths": 100000,
+    "seed": None,
+    "dtype": "float64",
+    "model": "gbm",
+    "mean_block": MEAN_BLOCK,
+    "control_variate": False,
+    "target_bp": None,
+    "time_budget": None,
+}
+
+
+def job_spec(job):
+    """把以日期描述的产品定义转换为 engine.products 的产品条款对象"""
+    job = {**DEFAULTS, **job}
+    kind = job.get("product", "snowball")
+    common = {
+        "knock_in_pct": job["knock_in_pct"],
+        "daily_knock_in": job["daily_knock_in"],
+        "knock_in_strike_pct": job["knock_in_strike_pct"],
+        "participation_rate": job["participation_rate"],
+        "max_loss_ratio": job["max_loss_ratio"],
+    }
+    if kind == "snowball":
+        spec = TernarySnowballSpec if job["snowball_type"] == TernarySnowballSpec.kind else SnowballSpec
+        return spec(
+            job["start_date"], job["obs_dates"], job["obs_barriers"], job["obs_coupons"],
+            guaranteed_return=job["guaranteed_return"], dividend_rate=job.get("dividend_rate"), **common,
+        )
+    if kind == "phoenix":
+        return PhoenixSpec(
+            job["start_date"], job["obs_dates"], job["obs_barriers"],
+            job["obs_dividend_dates"], job["obs_dividend_rates"],
+            dividend_barrier_pct=job["dividend_barrier_pct"], **common,
+        )
+    if kind == "sharkfin":
+        return SharkfinSpec(
+            job["direction"], job["strike_pct"], job["barrier_pct"], job["participation_rate"],
+            job.get("rebate_rate", 0.0), job.get("term_months", 12),
+        )
+    raise ValueError(f"不支持的产品类型：{kind}")
+
+
+def compile_job(job, calendar):
+    """
+    把以日期描述的产品定义编译成定价函数的参数：交易日下标、扩散时间等（见 engine.products）。
+    返回 (产品类型, 关键字参数 dict)。
+    """
+    job = {**DEFAULTS, **job}
+    kind = job.get("product", "snowball")
+    product = job_spec(job).compile(calendar)
+    if kind == "sharkfin":
+        if job["model"] != "gbm":
+            raise ValueError(f"鲨鱼鳍不支持的路径模型：{job['model']}")
+        return kind, {
+            **product.args,
+            "vol": job["vol"],
+            "rate": job["rate"],
+            "div_yield": job["div_yield"],
+            "n_paths": int(job["n_paths"]),
+            "seed": job["seed"],
+            "dtype": np.dtype(job["dtype"]).type,
+        }
+    kwargs = {
+        **product.args,
+        "times": product.times,
+        "vol": job["vol"] if job["model"] != "bootstrap" else job.get("vol", 0.0),
+        "rate": job["rate"],
+        "div_yield": job["div_yield"],
+        "n_paths": int(job["n_paths"]),
+        "seed": job["seed"],
+        "dtype": np.dtype(job["dtype"]).type,
+        "control_variate": bool(job["control_variate"]),
+        "target_bp": job["target_bp"],
+        "time_budget": job["time_budget"],
+    }
+
+    if job["model"] == "bootstrap":
+        kwargs["model"] = BootstrapModel(history_log_returns(job["underlying"]), job["mean_block"])
+    elif job["model"] == "qmc":
+        key_idx = np.concatenate([product.ko_idx, product.div_idx])
+        kwargs["model"] = SobolGBMModel(job["vol"], job["rate"], job["div_yield"], key_idx)
+    elif job["model"] != "gbm":
+        raise ValueError(f"不支持的路径模型：{job['model']}")
+    return kind, kwargs
+
+
+def run_jobs(jobs, workers=1, memory_mb=MEMORY_BUDGET_MB):
+    """依次定价各产品（每个产品内部并行），返回结果 DataFrame；单个产品失败不影响其余产品"""
+    calendar = get_calendar()
+    pricers = {"snowball": price_snowball_mc, "phoenix": price_phoenix_mc, "sharkfin": price_sharkfin_mc}
+    rows = []
+    for i, job in enumerate(jobs):
+        name = job.get("name", f"job{i}")
+        try:
+            kind, kwargs = compile_job(job, calendar)
+            # 鲨鱼鳍定价在单进程内完成
+            options = {"memory_mb": memory_mb} if kind == "sharkfin" else {"memory_mb": memory_mb, "workers": workers}
+            result = pricers[kind](**kwargs, **options)
+        except Exception as e:
+            print(f"{name}: 定价失败：{e}", file=sys.stderr)
+            rows.append({"name": name, "product": job.get("product", "snowball"), "error": str(e)})
+            continue
+        fields = {k: v.item() if isinstance(v, np.ndarray) else v for k, v in result._asdict().items()}
+        rows.append({"name": name, "product": kind, **fields, "error": ""})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="雪球 / 凤凰 / 鲨鱼鳍产品批量蒙特卡洛定价")
+    parser.add_argument("jobs", help="产品定义 JSON 文件（列表）")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数，结果与进程数无关")
+    parser.add_argument("--memory-mb", type=float, default=MEMORY_BUDGET_MB, help="路径矩阵内存预算（MB）")
+    parser.add_argument("--out", help="结果 CSV 路径，缺省时输出到标准输出")
+    args = parser.parse_args(argv)
+
+    with open(args.jobs, encoding="utf-8") as f:
+        jobs = json.load(f)
+    results = run_jobs(jobs, args.workers, args.memory_mb)
+    if args.out:
+        results.to_csv(args.out, index=False, encoding="utf-8-sig")
+    else:
+        print(results.to_string(index=False))
+    return int((results["error"] != "").any())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
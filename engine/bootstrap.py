@@ -0,0 +1,107 @@
+"""
+历史区块自助法（stationary bootstrap，Politis & Romano）情景生成。
+
+从 *_daily.xlsx 的历史日对数收益率中按随机长度的区块重抽样，块长服从均值为
+mean_block 的几何分布，区块在历史序列末尾循环接回开头。一次向量化调用生成
+(路径数 × 交易日) 的路径，保留收益率的短期相关与波动聚集，且从不补零。
+所得为历史（真实世界）测度下的情景分布，不做风险中性调整。
+"""
+import numpy as np
+
+from price_store import get_index, to_day
+
+# 默认平均块长（交易日）
+MEAN_BLOCK = 20
+# 历史回放补足尾部时的随机数种子（页面重跑时路径不变）
+REPLAY_SEED = 2025
+
+
+def history_log_returns(code, start=None, end=None):
+    """
+    标的在 [start, end] 内的历史日对数收益率（不含序列首日的 0）。
+    """
+    index = get_index(code)
+    lo = 1 if start is None else max(1, int(np.searchsorted(index.dates, to_day(start), side="left")))
+    hi = len(index) if end is None else int(np.searchsorted(index.dates, to_day(end), side="right"))
+    returns = np.asarray(index.log_ret[lo:hi], dtype=np.float64)
+    if len(returns) == 0:
+        raise ValueError(f"{code} 在所选区间内没有历史收益率")
+    return returns
+
+
+def stationary_bootstrap_indices(rng, n_paths, n_steps, n_history, mean_block=MEAN_BLOCK):
+    """
+    生成平稳自助法的抽样下标，形状 (n_paths, n_steps)，取值 [0, n_history)。
+    每一步以概率 1/mean_block 开始新区块（起点均匀抽取），否则沿历史序列顺延一天。
+    """
+    if n_steps == 0:
+        return np.empty((n_paths, 0), dtype=np.int64)
+    steps = np.arange(n_steps)
+    # 每步两个均匀数（是否开新区块、新区块起点），按路径连续排列：
+    # 随机数流按路径顺序消耗，分块生成与一次生成的结果一致
+    u = rng.random((n_paths, n_steps, 2))
+    new_block = u[..., 0] < 1.0 / max(mean_block, 1.0)
+    new_block[:, 0] = True
+    starts = np.minimum((u[..., 1] * n_history).astype(np.int64), n_history - 1)
+    del u
+    # 每一步所属区块的开始位置：最近一次 new_block 为 True 的步
+    block_pos = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+    idx = np.take_along_axis(starts, block_pos, axis=1)
+    idx += steps - block_pos
+    idx %= n_history
+    return idx
+
+
+def bootstrap_log_paths(rng, log_returns, n_paths, n_days, mean_block=MEAN_BLOCK, dtype=np.float64):
+    """
+    由历史日对数收益率重抽样生成对数相对价格 log(S_t / S_0)，形状 (n_paths, n_days)，第 0 列为 0。
+    """
+    log_returns = np.asarray(log_returns, dtype=dtype)
+    idx = stationary_bootstrap_indices(rng, n_paths, n_days - 1, len(log_returns), mean_block)
+    log_paths = np.empty((n_paths, n_days), dtype=dtype)
+    log_paths[:, 0] = 0.0
+    np.cumsum(log_returns[idx], axis=1, out=log_paths[:, 1:])
+    return log_paths
+
+
+def bootstrap_paths(log_returns, n_paths, n_days, start_price=1.0, mean_block=MEAN_BLOCK, seed=None):
+    """一次生成 n_paths 条价格路径，形状 (n_paths, n_days)，第 0 天为 start_price"""
+    rng = np.random.default_rng(seed)
+    return start_price * np.exp(bootstrap_log_paths(rng, log_returns, n_paths, n_days, mean_block))
+
+
+def extend_returns(rets, n_steps, log_returns, mean_block=MEAN_BLOCK, seed=REPLAY_SEED):
+    """
+    单条历史回放的日收益率（简单收益率）截断或补足到 n_steps 个：
+    历史不足时尾部由 log_returns 的平稳自助法抽样补足，从不补零。
+    返回 (rets, 补足的天数)。
+    """
+    rets = np.asarray(rets, dtype=np.float64)[:n_steps]
+    missing = n_steps - len(rets)
+    if missing <= 0:
+        return rets, 0
+    log_returns = np.asarray(log_returns, dtype=np.float64)
+    idx = stationary_bootstrap_indices(np.random.default_rng(seed), 1, missing, len(log_returns), mean_block)[0]
+    return np.concatenate([rets, np.expm1(log_returns[idx])]), missing
+
+
+class BootstrapModel:
+    """
+    蒙特卡洛引擎的历史区块自助法路径模型（与 engine.montecarlo.GBMModel 接口相同）。
+    每个交易日抽取一个历史日收益率，与 times 的间隔无关。
+    """
+    __slots__ = ("log_returns", "mean_block")
+    # 抽样所需的均匀数、区块起点、区块位置与下标数组
+    extra_bytes_per_day = 40
+
+    def __init__(self, log_returns, mean_block=MEAN_BLOCK):
+        log_returns = np.array(log_returns, dtype=np.float64)
+        log_returns.flags.writeable = False
+        self.log_returns = log_returns
+        self.mean_block = mean_block
+
+    def log_paths(self, rng, n_paths, times, dtype=np.float64):
+        return bootstrap_log_paths(rng, self.log_returns, n_paths, len(times), self.mean_block, dtype)
+
+    def sampler(self, rng, times, dtype=np.float64):
+        return lambda n_paths: self.log_paths(rng, n_paths, times, dtype)
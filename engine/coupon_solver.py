@@ -0,0 +1,143 @@
+"""
+公允票息求解（雪球敲出票息 / 凤凰派息率）。
+
+路径只模拟一次：缓存每条路径的敲出时点、敲入状态、期末价格与存续期（PathCache）。
+给定路径时收益对票息是仿射的（票息按同一倍数 k 缩放）：
+    收益(k) = 收益(0) + k × [收益(1) - 收益(0)]
+因此使产品按面值（或给定目标价）定价的 k 有闭式解；更换目标价、票息结构时
+只需在缓存上重新计算，不必重新模拟。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from engine.montecarlo import (
+    MEMORY_BUDGET_MB, GBMModel, batch_plan, chunk_size_for, path_life,
+    phoenix_path_cashflows, phoenix_path_outcome, phoenix_product,
+    snowball_path_outcome, snowball_path_payoff, snowball_product,
+)
+
+# 缓存的模拟结果：kind 为产品类型（"snowball" / "phoenix"），product 为产品参数字典；
+# outcome 为逐路径事件（SnowballOutcome / PhoenixOutcome，final_price 为相对期初价）；
+# life 为存续年数（本金偿还时点）；times / rate 为扩散时间与贴现利率
+PathCache = namedtuple("PathCache", ["kind", "product", "outcome", "life", "times", "rate"])
+
+# 求解结果：scale 为相对原票息的缩放倍数；rates 为公允票息（雪球为各观察日敲出票息，
+# 凤凰为各期派息率）；dividend_rate 为雪球的红利票息（凤凰为 None）；
+# std_error 为 scale 的标准误（delta 方法）；target 为目标收益现值（名义本金 = 1）
+FairCoupon = namedtuple(
+    "FairCoupon", ["scale", "rates", "dividend_rate", "std_error", "target", "n_paths"]
+)
+
+# 产品类型 -> 路径事件评估函数
+EVALUATORS = {
+    "snowball": snowball_path_outcome,
+    "phoenix": phoenix_path_outcome,
+}
+
+
+def simulate_paths(
+    kind, product, times, model, rate=0.0, n_paths=100000, seed=None,
+    memory_mb=MEMORY_BUDGET_MB, dtype=np.float64
+):
+    """
+    分块模拟路径并只保留逐路径事件，返回 PathCache。
+    批次划分与随机数流同 engine.montecarlo.run_mc：相同种子下缓存上的价格与 run_mc 一致。
+    """
+    times = np.asarray(times, dtype=np.float64)
+    evaluate = EVALUATORS[kind]
+    sizes, seeds = batch_plan(model, n_paths, seed)
+    chunk_size = min(chunk_size_for(len(times), memory_mb, dtype, model.extra_bytes_per_day), max(sizes))
+    parts = []
+    for n, seq in zip(sizes, seeds):
+        draw = model.sampler(np.random.default_rng(seq), times, dtype)
+        for start in range(0, n, chunk_size):
+            parts.append(evaluate(draw(min(chunk_size, n - start)), product))
+    outcome = type(parts[0])(*(np.concatenate(field) for field in zip(*parts)))
+    return PathCache(kind, product, outcome, path_life(outcome, times), times, rate)
+
+
+def simulate_snowball(
+    ko_idx, ko_barriers, ko_obs, obs_coupons, knock_in_pct, daily_knock_in,
+    snowball_type, knock_in_strike_pct, participation_rate, guaranteed_return,
+    max_loss_ratio, dividend_rate, term_in_years,
+    times, vol, rate=0.0, div_yield=0.0, n_paths=100000, seed=None,
+    memory_mb=MEMORY_BUDGET_MB, dtype=np.float64, model=None
+):
+    """雪球路径缓存，参数同 engine.montecarlo.price_snowball_mc"""
+    product = snowball_product(
+        ko_idx, ko_barriers, ko_obs, obs_coupons, knock_in_pct, daily_knock_in,
+        snowball_type, knock_in_strike_pct, participation_rate, guaranteed_return,
+        max_loss_ratio, dividend_rate, term_in_years,
+    )
+    if model is None:
+        model = GBMModel(vol, rate, div_yield)
+    return simulate_paths("snowball", product, times, model, rate, n_paths, seed, memory_mb, dtype)
+
+
+def simulate_phoenix(
+    ko_idx, ko_barriers, ko_obs, knock_in_pct, daily_knock_in,
+    div_idx, dividend_barrier_pct, obs_dividend_rates,
+    knock_in_strike_pct, participation_rate, max_loss_ratio,
+    times, vol, rate=0.0, div_yield=0.0, n_paths=100000, seed=None,
+    memory_mb=MEMORY_BUDGET_MB, dtype=np.float64, model=None
+):
+    """凤凰路径缓存，参数同 engine.montecarlo.price_phoenix_mc"""
+    product = phoenix_product(
+        ko_idx, ko_barriers, ko_obs, knock_in_pct, daily_knock_in,
+        div_idx, dividend_barrier_pct, obs_dividend_rates,
+        knock_in_strike_pct, participation_rate, max_loss_ratio,
+    )
+    if model is None:
+        model = GBMModel(vol, rate, div_yield)
+    return simulate_paths("phoenix", product, times, model, rate, n_paths, seed, memory_mb, dtype)
+
+
+def path_values(cache, scale=1.0, scale_dividend=True):
+    """
+    票息按 scale 缩放后每条路径的收益现值（名义本金 = 1，不含本金）。
+    scale_dividend: 雪球的红利票息是否随敲出票息一起缩放（页面“红利票息来源 = 同敲出票息”）
+    """
+    product = cache.product
+    if cache.kind == "snowball":
+        dividend_rate = product["dividend_rate"] * (scale if scale_dividend else 1.0)
+        payoff = snowball_path_payoff(
+            cache.outcome, product, scale * product["obs_coupons"], dividend_rate
+        )
+        return payoff * np.exp(-cache.rate * cache.life)
+    coupon_pv, loss_pv = phoenix_path_cashflows(
+        cache.outcome, cache.times, cache.rate, product, scale * product["obs_dividend_rates"]
+    )
+    return coupon_pv - loss_pv
+
+
+def solve_fair_coupon(cache, target_price=None, scale_dividend=True):
+    """
+    求使收益现值等于目标的票息缩放倍数（闭式解），返回 FairCoupon。
+    target_price: 收益现值目标（名义本金 = 1，不含本金），如 -0.01 表示发行方保留 1% 的利润；
+                  缺省按面值：本金与收益的现值之和 = 名义本金，即收益现值 = 1 - 本金偿还的贴现因子
+    """
+    base = path_values(cache, 0.0, scale_dividend)
+    slope = path_values(cache, 1.0, scale_dividend) - base
+    mean_slope = float(slope.mean())
+    if mean_slope <= 0:
+        raise ValueError("原票息全为 0 或从未支付，无法按比例求解公允票息")
+    if target_price is None:
+        target = 1.0 - np.exp(-cache.rate * cache.life)
+    else:
+        target = np.full(len(base), float(target_price))
+
+    scale = float((target - base).mean() / mean_slope)
+    # delta 方法：scale 的误差来自残差均值的抽样误差（按独立路径估计）
+    residual = base + scale * slope - target
+    n_paths = len(base)
+    std_error = float(residual.std(ddof=1) / np.sqrt(n_paths) / mean_slope) if n_paths > 1 else float("nan")
+
+    product = cache.product
+    if cache.kind == "snowball":
+        rates = scale * product["obs_coupons"]
+        dividend_rate = product["dividend_rate"] * scale if scale_dividend else product["dividend_rate"]
+    else:
+        rates = scale * product["obs_dividend_rates"]
+        dividend_rate = None
+    return FairCoupon(scale, rates, dividend_rate, std_error, float(target.mean()), n_paths)
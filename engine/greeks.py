@@ -0,0 +1,200 @@
+"""
+雪球 / 凤凰持仓的希腊字母曲面（标的价格 × 估值日），共同随机数（CRN）重定价。
+
+一组标准布朗运动路径按 (路径数, 交易日, 种子) 缓存，页面重复运行时直接复用；
+所有扰动（标的价格 ±、波动率 ±、估值日 +1）都在这组路径上重定价，差分中的抽样噪声大部分抵消。
+
+对给定的波动率与估值日，路径只生成一次并压缩成逐路径摘要（观察日对数价格、滚动最低价、期末价格）。
+标的价格扰动等价于对数价格整体平移 s，敲入/敲出/派息判断化为摘要与 s 的比较，
+逐期事件的概率由排序后的经验分布函数得到，整条价格轴（含 ± 扰动）一次求值。
+规则与 engine.snowball / engine.phoenix 一致：估值日当天不观察，之后的观察日照常判断，
+估值日时产品视为尚未敲入、未敲出。
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from engine.montecarlo import log_level
+
+# 默认模拟路径数
+GREEKS_PATHS = 20000
+# 标的价格的相对扰动、波动率的绝对扰动
+SPOT_BUMP = 0.01
+VOL_BUMP = 0.01
+
+# 希腊字母曲面，除 spots / days 外均为 (估值日数, 价格数) 数组，以名义本金 = 1 计：
+# spots: 标的价格（期初价的倍数）；days: 估值日（距起始日的交易日数）
+# value: 收益现值（贴现到估值日）；delta / gamma: 对 S/S0 的一阶 / 二阶导数；
+# vega: 波动率每变动 1（100%）的价值变化；theta: 每过一个交易日的价值变化
+GreeksSurface = namedtuple(
+    "GreeksSurface", ["spots", "days", "value", "delta", "gamma", "vega", "theta"]
+)
+
+# 逐路径摘要（估值日起的剩余路径，对数价格相对估值日价格）：
+# day: 估值日；ko_gap: (路径, 剩余敲出观察日) 的 敲出障碍 - 对数价格，平移 s >= ko_gap 即敲出；
+# ko_pos: 剩余敲出观察日在 product["ko_idx"] 中的位置；low: 第 1 天起的最低对数价格；
+# last: 到期对数价格；div_gap / div_low: 剩余派息观察日的 派息障碍 - 对数价格 与当日滚动最低价；
+# div_pos: 剩余派息观察日在 product["div_idx"] 中的位置
+PathSummary = namedtuple(
+    "PathSummary", ["day", "ko_gap", "ko_pos", "low", "last", "div_gap", "div_low", "div_pos"]
+)
+
+
+@lru_cache(maxsize=2)
+def _brownian(n_paths, times, seed):
+    dt = np.diff(np.asarray(times, dtype=np.float64))
+    rng = np.random.default_rng(seed)
+    w = np.empty((n_paths, len(times)), dtype=np.float32)
+    w[:, 0] = 0.0
+    steps = rng.standard_normal((n_paths, len(dt)), dtype=np.float32)
+    steps *= np.sqrt(dt).astype(np.float32)
+    np.cumsum(steps, axis=1, out=w[:, 1:])
+    w.flags.writeable = False
+    return w
+
+
+def brownian_paths(n_paths, times, seed=None):
+    """
+    标准布朗运动路径 W(times)，形状 (n_paths, len(times))，float32，只读。
+    按 (路径数, times, 种子) 缓存；seed 为 None 时每次重新生成、不缓存。
+    """
+    times = tuple(float(t) for t in times)
+    if seed is None:
+        return _brownian.__wrapped__(int(n_paths), times, None)
+    return _brownian(int(n_paths), times, int(seed))
+
+
+def path_summary(product, times, brownian, vol, rate, div_yield, day=0):
+    """
+    第 day 个交易日估值时的逐路径摘要（风险中性 GBM，复用同一组布朗路径），返回 PathSummary。
+    product: engine.montecarlo.snowball_product / phoenix_product 的产品参数字典
+    """
+    times = np.asarray(times, dtype=np.float64)
+    elapsed = times[day:] - times[day]
+    drift = ((rate - div_yield - 0.5 * vol * vol) * elapsed).astype(np.float32)
+    log_paths = brownian[:, day:] - brownian[:, day:day + 1]
+    log_paths *= np.float32(vol)
+    log_paths += drift
+
+    ko_pos = np.flatnonzero(product["ko_idx"] > day)
+    ko_levels = log_level(product["ko_barriers"][ko_pos]).astype(np.float32)
+    ko_gap = ko_levels - log_paths[:, product["ko_idx"][ko_pos] - day]
+
+    div_idx = product.get("div_idx")
+    if div_idx is None:
+        div_pos = np.empty(0, dtype=np.int64)
+    else:
+        div_pos = np.flatnonzero((div_idx > day) & (div_idx < len(times)))
+    div_day = div_idx[div_pos] - day if len(div_pos) else div_pos
+    div_gap = np.float32(log_level(product.get("dividend_barrier_pct", 0.0))) - log_paths[:, div_day]
+
+    # 第 1 天起的滚动最低价只需在派息观察日与到期日取值：按派息日分段求最小值再累积
+    n_left = log_paths.shape[1]
+    if n_left > 1:
+        bounds = np.unique(np.concatenate([[1], div_day + 1]))
+        bounds = bounds[bounds < n_left]
+        segment_low = np.minimum.accumulate(np.minimum.reduceat(log_paths, bounds, axis=1), axis=1)
+        low = segment_low[:, -1]
+        div_low = segment_low[:, np.searchsorted(bounds, div_day, side="right") - 1]
+    else:
+        low = np.full(len(log_paths), np.inf, dtype=np.float32)
+        div_low = np.empty((len(log_paths), 0), dtype=np.float32)
+    return PathSummary(day, ko_gap, ko_pos, low, log_paths[:, -1], div_gap, div_low, div_pos)
+
+
+def _ecdf(x, shifts):
+    """逐列经验分布函数：P(x[:, j] <= s)，形状 (len(shifts), x 的列数)"""
+    counts = np.empty((len(shifts), x.shape[1]))
+    for j, column in enumerate(np.sort(x, axis=0).T):
+        counts[:, j] = np.searchsorted(column, shifts, side="right")
+    return counts / len(x)
+
+
+def summary_values(summary, product, times, rate, shifts):
+    """
+    标的价格平移 shifts（对数，相对期初价）后的收益现值（贴现到估值日，名义本金 = 1），
+    形状 (len(shifts),)。
+    敲出与派息为逐期的区间事件 L <= s < A（L、A 为逐路径阈值），其概率由经验分布函数之差得到：
+    P(L <= s < A) = P(L <= s) - P(max(L, A) <= s)；敲入亏损依赖期末价格，按 (价格, 路径) 直接计算。
+    """
+    times = np.asarray(times, dtype=np.float64)
+    s = np.asarray(shifts, dtype=np.float32)
+    now = times[summary.day]
+    maturity = np.exp(-rate * (times[-1] - now))
+    ko_idx = product["ko_idx"][summary.ko_pos]
+
+    # 此前各期 ko_gap 的最小值（第 0 列为尚无观察日的 +inf）；第 m 个剩余观察日首次敲出 ⇔ ko_gap[m] <= s < prior[m]
+    gap = summary.ko_gap
+    prior = np.full((len(gap), gap.shape[1] + 1), np.inf, dtype=np.float32)
+    np.minimum.accumulate(gap, axis=1, out=prior[:, 1:])
+    first_ko = _ecdf(gap, s) - _ecdf(np.maximum(gap, prior[:, :-1]), s)
+    alive = s[:, None] < prior[None, :, -1]
+
+    knock_in_level = np.float32(log_level(product["knock_in_pct"]))
+    knocked_in = (summary.low if product["daily_knock_in"] else summary.last)[None] + s[:, None] < knock_in_level
+    final_price = np.exp(summary.last[None].astype(np.float64) + s[:, None].astype(np.float64))
+    loss = np.minimum(np.maximum(0.0, product["knock_in_strike_pct"] - final_price), product["max_loss_ratio"])
+    loss *= product["participation_rate"]
+
+    if "div_idx" not in product:
+        amounts = product["obs_coupons"][product["ko_obs"][summary.ko_pos]] * (ko_idx + 1) / 365
+        ko_pv = first_ko @ (amounts * np.exp(-rate * (times[ko_idx] - now)))
+        if product["snowball_type"] == "雪球":
+            ki_payoff = -loss
+        else:
+            ki_payoff = product["guaranteed_return"]
+        hold = product["dividend_rate"] * product["term_in_years"]
+        held = np.where(knocked_in, ki_payoff, hold) * alive
+        return ko_pv + held.mean(axis=1) * maturity
+
+    # 第 q 期派息 ⇔ 派息日（含）之前未敲出、未敲入（每日观察时），且当日不低于派息障碍
+    div_day = product["div_idx"][summary.div_pos]
+    upper = prior[:, np.searchsorted(ko_idx, div_day, side="right")]
+    lower = summary.div_gap
+    if product["daily_knock_in"]:
+        lower = np.maximum(lower, knock_in_level - summary.div_low)
+    paid = _ecdf(lower, s) - _ecdf(np.maximum(lower, upper), s)
+    rates = product["obs_dividend_rates"][summary.div_pos] * np.exp(-rate * (times[div_day] - now))
+    return paid @ rates - (loss * (knocked_in & alive)).mean(axis=1) * maturity
+
+
+def greeks_surface(
+    product, times, vol, rate=0.0, div_yield=0.0, spots=None, days=None,
+    n_paths=GREEKS_PATHS, seed=None, spot_bump=SPOT_BUMP, vol_bump=VOL_BUMP
+):
+    """
+    标的价格 × 估值日的价值与希腊字母曲面（共同随机数），返回 GreeksSurface。
+    product: engine.montecarlo.snowball_product / phoenix_product 的产品参数字典
+    times: 各交易日距起始日的年数；spots: 标的价格（期初价的倍数），缺省 0.6 ~ 1.2
+    days: 估值日（交易日下标，须 < N-1），缺省在存续期内均匀取 9 个
+    每个估值日模拟摘要 4 次（基准、波动率 ±、次日），价格轴上的扰动不再模拟。
+    """
+    times = np.asarray(times, dtype=np.float64)
+    last = len(times) - 1
+    spots = np.linspace(0.6, 1.2, 25) if spots is None else np.asarray(spots, dtype=np.float64)
+    if days is None:
+        days = np.unique(np.linspace(0, last - 1, 9).astype(np.int64))
+    days = np.asarray(days, dtype=np.int64)
+    if np.any((days < 0) | (days >= last)):
+        raise ValueError("估值日须在产品起始日与到期前一日之间")
+    brownian = brownian_paths(n_paths, times, seed)
+
+    def values(sigma, day, shifts):
+        summary = path_summary(product, times, brownian, sigma, rate, div_yield, day)
+        return summary_values(summary, product, times, rate, shifts)
+
+    log_spots = np.log(spots)
+    bumped = np.concatenate([log_spots + np.log1p(-spot_bump), log_spots, log_spots + np.log1p(spot_bump)])
+    vol_down = max(vol - vol_bump, 1e-6)
+    n = len(spots)
+    value, delta, gamma, vega, theta = (np.empty((len(days), n)) for _ in range(5))
+    for row, day in enumerate(days):
+        down, mid, up = np.split(values(vol, day, bumped), 3)
+        value[row] = mid
+        delta[row] = (up - down) / (2 * spot_bump * spots)
+        gamma[row] = (up - 2 * mid + down) / (spot_bump * spots) ** 2
+        vol_up_value = values(vol + vol_bump, day, log_spots)
+        vega[row] = (vol_up_value - values(vol_down, day, log_spots)) / (vol + vol_bump - vol_down)
+        theta[row] = values(vol, day + 1, log_spots) - mid
+    return GreeksSurface(spots, days, value, delta, gamma, vega, theta)
@@ -0,0 +1,604 @@
+"""
+蒙特卡洛定价。
+
+几何布朗运动（波动率、无风险利率、分红率可配置）按块生成 (路径数 × 交易日) 的
+对数价格矩阵，交给 engine.snowball 的向量化内核判断敲入/敲出并结算收益。
+敲入/敲出只做大小比较，对数变换不改变比较结果，因此内核直接在对数价格上运行，
+只对期末价格取一次指数，省去整块矩阵的 exp。
+收益与页面结算规则一致，以名义本金为 1、期初价格为 1 计。
+
+内存：每块路径数由内存预算决定，收益与统计量按块在线累积（Welford），
+峰值内存与总路径数无关。统计量固定按 STATS_BLOCK 条路径为一组依次合并，
+块大小取 STATS_BLOCK 的整数倍，因此同一种子下分块与不分块的结果逐位一致。
+
+并行：路径按固定的 BATCH_PATHS 分批，每批使用 SeedSequence.spawn 派生的独立随机数流，
+各批可分发到进程池，部分统计量按批次顺序合并。批次划分与进程数无关，
+因此同一种子下任意进程数（含单进程）的结果逐位一致。
+"""
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.special import ndtr
+
+from engine.phoenix import evaluate_phoenix, phoenix_cashflows
+from engine.snowball import evaluate_snowball, snowball_payoff
+
+# 默认内存预算（MB）
+MEMORY_BUDGET_MB = 256
+# 统计量合并的最小分组（路径数）；块大小总是它的整数倍
+STATS_BLOCK = 1024
+# 每批路径数（独立随机数流与并行任务的单位），为 STATS_BLOCK 的整数倍
+BATCH_PATHS = 32 * STATS_BLOCK
+# 自适应运行中，重复（随机化 QMC）模型至少完成的批数，批数过少时按批均值估计的标准误不可靠
+MIN_REPLICATIONS = 4
+# 自适应运行的首轮：先跑 ADAPTIVE_BATCHES 个小批再检查标准误，宽松的目标无需等满一轮 BATCH_PATHS 批
+ADAPTIVE_BATCH_PATHS = 2 * STATS_BLOCK
+ADAPTIVE_BATCHES = 8
+
+# 定价结果：price 为收益（不含本金）按无风险利率贴现到起始日的期望值，std_error 为其标准误；
+# ko_prob / ki_prob 为敲出概率、未敲出且敲入的概率；expected_life 为期望存续年数；
+# variance_reduction 为控制变量法的方差缩减倍数（未使用时为 1）
+MCResult = namedtuple(
+    "MCResult",
+    ["price", "std_error", "ko_prob", "ki_prob", "expected_life", "n_paths", "variance_reduction"],
+    defaults=(1.0,),
+)
+
+
+class RunningStats:
+    """
+    在线均值/方差（Welford，按组合并采用 Chan 的并行公式）。
+    update 按 STATS_BLOCK 分组依次合并，分组方式只取决于路径在全体中的位置。
+    """
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def merge(self, count, mean, m2):
+        """合并一组样本的 (样本数, 均值, 离差平方和)"""
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        for start in range(0, len(values), STATS_BLOCK):
+            block = values[start:start + STATS_BLOCK]
+            mean = float(block.mean())
+            self.merge(len(block), mean, float(np.square(block - mean).sum()))
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+    @property
+    def std_error(self):
+        return float(np.sqrt(self.variance / self.count)) if self.count > 1 else float("nan")
+
+
+class RunningCovariance:
+    """
+    成对样本 (x, y) 的在线均值/离差平方和/协离差和，分组与合并方式同 RunningStats。
+    用于控制变量法：x 为控制变量，y 为收益。
+    """
+    __slots__ = ("count", "mean_x", "mean_y", "m2x", "m2y", "cxy")
+
+    def __init__(self):
+        self.count = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m2x = self.m2y = self.cxy = 0.0
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        weight = self.count * other.count / total
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        self.mean_x += dx * other.count / total
+        self.mean_y += dy * other.count / total
+        self.m2x += other.m2x + dx * dx * weight
+        self.m2y += other.m2y + dy * dy * weight
+        self.cxy += other.cxy + dx * dy * weight
+        self.count = total
+
+    def update(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        for start in range(0, len(x), STATS_BLOCK):
+            block = RunningCovariance()
+            bx, by = x[start:start + STATS_BLOCK], y[start:start + STATS_BLOCK]
+            block.count = len(bx)
+            block.mean_x, block.mean_y = float(bx.mean()), float(by.mean())
+            dx, dy = bx - block.mean_x, by - block.mean_y
+            block.m2x, block.m2y, block.cxy = float(dx @ dx), float(dy @ dy), float(dx @ dy)
+            self.merge(block)
+
+    @property
+    def beta(self):
+        """最优控制系数 Cov(x, y) / Var(x)"""
+        return self.cxy / self.m2x if self.m2x > 0 else 0.0
+
+    @property
+    def residual_m2(self):
+        """y - beta * x 的离差平方和"""
+        return max(self.m2y - self.beta * self.cxy, 0.0)
+
+
+def chunk_size_for(n_days, memory_mb=MEMORY_BUDGET_MB, dtype=np.float64, extra_bytes_per_day=0):
+    """
+    按内存预算确定每块路径数（STATS_BLOCK 的整数倍，至少一组）。
+    每条路径约占 3 个 (交易日) 长度的浮点数组（正态增量、对数价格、滚动最低价）和 1 个布尔数组，
+    路径模型的额外工作区由 extra_bytes_per_day 给出。
+    """
+    bytes_per_path = n_days * (3 * np.dtype(dtype).itemsize + 1 + extra_bytes_per_day)
+    blocks = int(memory_mb * 2**20 // (bytes_per_path * STATS_BLOCK))
+    return max(1, blocks) * STATS_BLOCK
+
+
+def gbm_log_paths(rng, n_paths, times, vol, rate, div_yield, dtype=np.float64):
+    """
+    生成风险中性 GBM 下的对数相对价格 log(S_t / S_0)，形状 (n_paths, len(times))，第 0 列为 0。
+    times: 各交易日距起始日的年数，times[0] = 0
+    dtype: float64 或 float32（正态数按该精度生成，随机数序列随精度不同而不同）
+    """
+    dt = np.diff(np.asarray(times, dtype=np.float64))
+    drift = ((rate - div_yield - 0.5 * vol * vol) * dt).astype(dtype)
+    scale = (vol * np.sqrt(dt)).astype(dtype)
+    steps = rng.standard_normal((n_paths, len(dt)), dtype=dtype)
+    steps *= scale
+    steps += drift
+    log_paths = np.empty((n_paths, len(dt) + 1), dtype=dtype)
+    log_paths[:, 0] = 0.0
+    np.cumsum(steps, axis=1, out=log_paths[:, 1:])
+    return log_paths
+
+
+class GBMModel:
+    """风险中性几何布朗运动路径模型"""
+    __slots__ = ("vol", "rate", "div_yield")
+    # 除正态增量外不需要额外工作区
+    extra_bytes_per_day = 0
+
+    def __init__(self, vol, rate=0.0, div_yield=0.0):
+        self.vol = vol
+        self.rate = rate
+        self.div_yield = div_yield
+
+    def log_paths(self, rng, n_paths, times, dtype=np.float64):
+        return gbm_log_paths(rng, n_paths, times, self.vol, self.rate, self.div_yield, dtype)
+
+    def sampler(self, rng, times, dtype=np.float64):
+        """返回按块取路径的函数 n_paths -> log_paths，一批路径内依次调用"""
+        return lambda n_paths: self.log_paths(rng, n_paths, times, dtype)
+
+
+def put_spread_payoff(relative_price, knock_in_strike_pct, max_loss_ratio, participation_rate):
+    """
+    敲入亏损腿对应的欧式看跌价差收益（期初价 = 1）：
+    参与率 × min(max(0, 敲入执行价 - 期末价), 最大亏损)
+    = 参与率 × [Put(敲入执行价) - Put(敲入执行价 - 最大亏损)]
+    """
+    raw = np.maximum(0.0, knock_in_strike_pct - relative_price)
+    return np.minimum(raw, max_loss_ratio) * participation_rate
+
+
+def put_spread_value(model, maturity, rate, knock_in_strike_pct, max_loss_ratio, participation_rate):
+    """
+    put_spread_payoff 在 GBM 模型下的解析现值（Black-Scholes，期初价 = 1）。
+    model: GBMModel（用其 vol / rate / div_yield 扩散）；rate: 贴现利率；maturity: 到期年数
+    """
+    forward = np.exp((model.rate - model.div_yield) * maturity)
+    sd = model.vol * np.sqrt(maturity)
+
+    def forward_put(strike):
+        if strike <= 0:
+            return 0.0
+        if sd <= 0:
+            return max(strike - forward, 0.0)
+        d1 = (np.log(forward / strike) + 0.5 * sd * sd) / sd
+        return strike * ndtr(-(d1 - sd)) - forward * ndtr(-d1)
+
+    spread = forward_put(knock_in_strike_pct) - forward_put(knock_in_strike_pct - max_loss_ratio)
+    return float(participation_rate * spread * np.exp(-rate * maturity))
+
+
+def log_level(level):
+    """障碍点位取对数；点位为 0 时为 -inf（永不触发）"""
+    with np.errstate(divide="ignore"):
+        return np.log(np.asarray(level, dtype=np.float64))
+
+
+def _control(log_paths, times, rate, product):
+    """每条路径到期价对应的看跌价差收益，贴现到起始日"""
+    final = np.exp(log_paths[:, -1].astype(np.float64))
+    payoff = put_spread_payoff(
+        final, product["knock_in_strike_pct"], product["max_loss_ratio"], product["participation_rate"]
+    )
+    return payoff * np.exp(-rate * times[-1])
+
+
+def snowball_path_outcome(log_paths, product):
+    """对数价格路径上的雪球事件，final_price 还原为相对期初价的价格（float64）"""
+    outcome = evaluate_snowball(
+        log_paths, product["ko_idx"], log_level(product["ko_barriers"]), product["ko_obs"],
+        log_level(product["knock_in_pct"]), product["daily_knock_in"],
+    )
+    return outcome._replace(final_price=np.exp(outcome.final_price.astype(np.float64)))
+
+
+def snowball_path_payoff(outcome, product, obs_coupons=None, dividend_rate=None):
+    """
+    按雪球规则计算每条路径的收益（名义本金 = 1，未贴现）。
+    obs_coupons / dividend_rate: 缺省取 product 中的值，公允票息求解时替换
+    """
+    return snowball_payoff(
+        outcome, product["snowball_type"], 1.0, 1.0,
+        product["obs_coupons"] if obs_coupons is None else obs_coupons,
+        product["knock_in_strike_pct"], product["participation_rate"],
+        product["guaranteed_return"], product["max_loss_ratio"],
+        product["dividend_rate"] if dividend_rate is None else dividend_rate,
+        product["term_in_years"],
+    )
+
+
+def path_life(outcome, times):
+    """存续年数：敲出时在敲出日结算，否则在到期日结算"""
+    knocked_out = outcome.knock_out_idx >= 0
+    return np.where(knocked_out, times[np.maximum(outcome.knock_out_idx, 0)], times[-1])
+
+
+def settle_snowball_paths(log_paths, times, rate, product):
+    """
+    按雪球规则结算一块对数价格路径。
+    rate: 贴现利率；product: snowball_product 的产品参数字典
+    返回 (贴现收益, 是否敲出, 是否敲入, 存续年数, 控制变量)，均为长度 = 路径数 的数组；
+    控制变量为到期日贴现的敲入亏损腿看跌价差收益（与是否敲入/敲出无关）。
+    """
+    outcome = snowball_path_outcome(log_paths, product)
+    payoff = snowball_path_payoff(outcome, product)
+    knocked_out = outcome.knock_out_idx >= 0
+    knocked_in = ~knocked_out & (outcome.knock_in_idx >= 0)
+    life = path_life(outcome, times)
+    control = _control(log_paths, times, rate, product)
+    return payoff * np.exp(-rate * life), knocked_out, knocked_in, life, control
+
+
+def phoenix_path_outcome(log_paths, product):
+    """对数价格路径上的凤凰事件与逐期派息，final_price 还原为相对期初价的价格（float64）"""
+    outcome = evaluate_phoenix(
+        log_paths, product["ko_idx"], log_level(product["ko_barriers"]), product["ko_obs"],
+        log_level(product["knock_in_pct"]), product["div_idx"],
+        log_level(product["dividend_barrier_pct"]), product["daily_knock_in"],
+    )
+    return outcome._replace(final_price=np.exp(outcome.final_price.astype(np.float64)))
+
+
+def phoenix_path_cashflows(outcome, times, rate, product, obs_dividend_rates=None):
+    """
+    凤凰每条路径的 (派息现值, 本金亏损现值)（名义本金 = 1）：各期派息在派息观察日贴现，
+    本金亏损在到期日贴现。obs_dividend_rates: 缺省取 product 中的值，公允派息率求解时替换
+    """
+    rates = product["obs_dividend_rates"] if obs_dividend_rates is None else obs_dividend_rates
+    pay_times = times[np.clip(product["div_idx"], 0, len(times) - 1)]
+    coupon_pv, loss = phoenix_cashflows(
+        outcome, 1.0, 1.0, np.asarray(rates, dtype=np.float64) * np.exp(-rate * pay_times),
+        product["knock_in_strike_pct"], product["participation_rate"], product["max_loss_ratio"],
+    )
+    return coupon_pv, loss * np.exp(-rate * times[-1])
+
+
+def settle_phoenix_paths(log_paths, times, rate, product):
+    """
+    按凤凰规则结算一块对数价格路径。
+    product: phoenix_product 的产品参数字典
+    参数与返回值同 settle_snowball_paths。
+    """
+    outcome = phoenix_path_outcome(log_paths, product)
+    coupon_pv, loss_pv = phoenix_path_cashflows(outcome, times, rate, product)
+    knocked_out = outcome.knock_out_idx >= 0
+    knocked_in = ~knocked_out & (outcome.knock_in_idx >= 0)
+    life = path_life(outcome, times)
+    control = _control(log_paths, times, rate, product)
+    return coupon_pv - loss_pv, knocked_out, knocked_in, life, control
+
+
+# 产品类型 -> 路径结算函数
+SETTLERS = {
+    "snowball": settle_snowball_paths,
+    "phoenix": settle_phoenix_paths,
+}
+
+
+def batch_plan(model, n_paths, seed=None, adaptive=False):
+    """
+    批次划分与各批的独立随机数流：返回 (各批路径数, 各批 SeedSequence)。
+    模型定义 batch_sizes(n_paths) 时按其划分，否则每批 BATCH_PATHS 条；
+    adaptive 为 True 时前 ADAPTIVE_BATCHES 批为 ADAPTIVE_BATCH_PATHS 条的小批。
+    划分只取决于模型与路径数，与进程数无关。
+    """
+    if hasattr(model, "batch_sizes"):
+        sizes = model.batch_sizes(n_paths)
+    else:
+        sizes = []
+        if adaptive:
+            small = min(n_paths, ADAPTIVE_BATCHES * ADAPTIVE_BATCH_PATHS)
+            sizes = [min(ADAPTIVE_BATCH_PATHS, small - s) for s in range(0, small, ADAPTIVE_BATCH_PATHS)]
+        done = sum(sizes)
+        sizes += [min(BATCH_PATHS, n_paths - s) for s in range(done, n_paths, BATCH_PATHS)]
+    return sizes, np.random.SeedSequence(seed).spawn(len(sizes))
+
+
+def _run_batch(
+    kind, product, times, model, rate, n_paths, seed_seq, chunk_size, dtype, control_variate=False
+):
+    """
+    用一条独立随机数流模拟一批路径（进程池任务，须可 pickle）。
+    返回 (收益统计, 存续期统计, 敲出数, 敲入数, 控制变量与收益的联合统计)；
+    control_variate 为 False 时最后一项为 None。
+    """
+    settle = SETTLERS[kind]
+    draw = model.sampler(np.random.default_rng(seed_seq), times, dtype)
+    pv_stats, life_stats = RunningStats(), RunningStats()
+    cv_stats = RunningCovariance() if control_variate else None
+    n_ko = n_ki = 0
+    for start in range(0, n_paths, chunk_size):
+        pv, ko, ki, life, control = settle(draw(min(chunk_size, n_paths - start)), times, rate, product)
+        pv_stats.update(pv)
+        life_stats.update(life)
+        if cv_stats is not None:
+            cv_stats.update(control, pv)
+        n_ko += int(ko.sum())
+        n_ki += int(ki.sum())
+    return pv_stats, life_stats, n_ko, n_ki, cv_stats
+
+
+def run_mc(
+    kind, product, times, model, rate=0.0, n_paths=100000, seed=None,
+    memory_mb=MEMORY_BUDGET_MB, dtype=np.float64, chunk_size=None, workers=1,
+    control_variate=False, target_bp=None, time_budget=None
+):
+    """
+    通用蒙特卡洛驱动。
+    kind: SETTLERS 中的产品类型；product: 对应的产品参数字典（数组已编译好）
+    model: 路径模型（GBMModel、engine.bootstrap.BootstrapModel、engine.qmc.SobolGBMModel 等）；
+           rate: 贴现利率。模型可定义 batch_sizes(n_paths) 自定批次划分；
+           replicated 为 True 时各批为独立随机化的重复，标准误按批均值估计（随机化拟蒙特卡洛）
+    workers: 进程数，1 为当前进程内串行；内存预算由各进程均分
+    control_variate: 以到期日欧式看跌价差（敲入亏损腿的近似，有解析解）为控制变量，
+                     控制系数由全体路径估计；仅适用于 GBM 类模型
+    target_bp / time_budget: 目标标准误（名义本金的基点）与时间预算（秒）。给出其一即逐批运行，
+                     标准误达到目标、或下一轮预计超出时间预算时停止，n_paths 为路径数上限；
+                     返回的 std_error / n_paths 为实际达到的标准误与路径数
+    返回 MCResult。
+    """
+    if control_variate and not isinstance(model, GBMModel):
+        raise ValueError("控制变量法需要 GBM 类路径模型（看跌价差解析价依赖风险中性 GBM）")
+    if n_paths < 1:
+        raise ValueError(f"模拟路径数须为正：{n_paths}")
+    times = np.asarray(times, dtype=np.float64)
+    adaptive = target_bp is not None or time_budget is not None
+    sizes, seeds = batch_plan(model, n_paths, seed, adaptive)
+    workers = max(1, min(int(workers), len(sizes), os.cpu_count() or 1))
+    if chunk_size is None:
+        chunk_size = chunk_size_for(len(times), memory_mb / workers, dtype, model.extra_bytes_per_day)
+    else:
+        chunk_size = -(-int(chunk_size) // STATS_BLOCK) * STATS_BLOCK
+    chunk_size = min(chunk_size, max(sizes))
+
+    tasks = [
+        (kind, product, times, model, rate, n, seq, chunk_size, dtype, control_variate)
+        for n, seq in zip(sizes, seeds)
+    ]
+    if not adaptive:
+        if workers == 1:
+            parts = [_run_batch(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(_run_batch, *zip(*tasks)))
+        return _summarize(parts, product, times, model, rate, control_variate)
+
+    # 自适应：首轮为开头的小批，之后每轮 workers 批，轮后检查标准误与耗时；
+    # 批次划分与进程数无关，同一种子下停在同一批时结果相同
+    target = None if target_bp is None else target_bp / 1e4
+    min_batches = MIN_REPLICATIONS if getattr(model, "replicated", False) else 1
+    n_small = 0 if hasattr(model, "batch_sizes") else min(ADAPTIVE_BATCHES, len(sizes))
+    rounds = [tasks[:n_small]] if n_small else []
+    rounds += [tasks[first:first + workers] for first in range(n_small, len(tasks), workers)]
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    t0 = time.perf_counter()
+    parts = []
+    try:
+        for k, round_tasks in enumerate(rounds):
+            if pool is None:
+                parts.extend(_run_batch(*task) for task in round_tasks)
+            else:
+                parts.extend(pool.map(_run_batch, *zip(*round_tasks)))
+            result = _summarize(parts, product, times, model, rate, control_variate)
+            if target is not None and len(parts) >= min_batches and result.std_error <= target:
+                break
+            # 按已完成路径的平均耗时估计，下一轮会超出时间预算则停止
+            if time_budget is not None and k + 1 < len(rounds):
+                next_paths = sum(task[5] for task in rounds[k + 1])
+                elapsed = time.perf_counter() - t0
+                if elapsed * (result.n_paths + next_paths) / result.n_paths > time_budget:
+                    break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return result
+
+
+def _summarize(parts, product, times, model, rate, control_variate):
+    """按批次顺序合并各批统计量（与进程数无关），返回 MCResult"""
+    pv_stats, life_stats = RunningStats(), RunningStats()
+    cv_stats = RunningCovariance()
+    n_ko = n_ki = 0
+    for pv, life, ko, ki, cv in parts:
+        pv_stats.merge(pv.count, pv.mean, pv.m2)
+        life_stats.merge(life.count, life.mean, life.m2)
+        if cv is not None:
+            cv_stats.merge(cv)
+        n_ko += ko
+        n_ki += ki
+
+    replicated = getattr(model, "replicated", False)
+    batch_means = np.array([pv.mean for pv, _, _, _, _ in parts])
+    if replicated:
+        std_error = _batch_std_error(batch_means)
+    else:
+        std_error = pv_stats.std_error
+
+    price = pv_stats.mean
+    variance_reduction = 1.0
+    if control_variate:
+        control_mean = put_spread_value(
+            model, times[-1], rate, product["knock_in_strike_pct"],
+            product["max_loss_ratio"], product["participation_rate"],
+        )
+        beta = cv_stats.beta
+        price = cv_stats.mean_y - beta * (cv_stats.mean_x - control_mean)
+        if replicated:
+            adjusted = np.array([cv.mean_y - beta * (cv.mean_x - control_mean) for *_, cv in parts])
+            cv_error = _batch_std_error(adjusted)
+        else:
+            n = cv_stats.count
+            cv_error = float(np.sqrt(cv_stats.residual_m2 / (n - 1) / n)) if n > 1 else float("nan")
+        variance_reduction = (std_error / cv_error) ** 2 if cv_error > 0 else float("inf")
+        std_error = cv_error
+
+    n_paths = pv_stats.count
+    return MCResult(
+        price=price,
+        std_error=std_error,
+        ko_prob=n_ko / n_paths,
+        ki_prob=n_ki / n_paths,
+        expected_life=life_stats.mean,
+        n_paths=n_paths,
+        variance_reduction=variance_reduction,
+    )
+
+
+def _batch_std_error(batch_means):
+    """各批（独立随机化重复）均值的标准误"""
+    if len(batch_means) < 2:
+        return float("nan")
+    return float(batch_means.std(ddof=1) / np.sqrt(len(batch_means)))
+
+
+def snowball_product(
+    ko_idx, ko_barriers, ko_obs, obs_coupons, knock_in_pct, daily_knock_in,
+    snowball_type, knock_in_strike_pct, participation_rate, guaranteed_return,
+    max_loss_ratio, dividend_rate, term_in_years
+):
+    """雪球产品参数字典（数组已编译好），参数同 price_snowball_mc"""
+    return {
+        "ko_idx": np.asarray(ko_idx, dtype=np.int64),
+        "ko_barriers": np.asarray(ko_barriers, dtype=np.float64),
+        "ko_obs": np.asarray(ko_obs, dtype=np.int64),
+        "obs_coupons": np.asarray(obs_coupons, dtype=np.float64),
+        "knock_in_pct": knock_in_pct,
+        "daily_knock_in": daily_knock_in,
+        "snowball_type": snowball_type,
+        "knock_in_strike_pct": knock_in_strike_pct,
+        "participation_rate": participation_rate,
+        "guaranteed_return": guaranteed_return,
+        "max_loss_ratio": max_loss_ratio,
+        "dividend_rate": dividend_rate,
+        "term_in_years": term_in_years,
+    }
+
+
+def phoenix_product(
+    ko_idx, ko_barriers, ko_obs, knock_in_pct, daily_knock_in,
+    div_idx, dividend_barrier_pct, obs_dividend_rates,
+    knock_in_strike_pct, participation_rate, max_loss_ratio
+):
+    """凤凰产品参数字典（数组已编译好），参数同 price_phoenix_mc"""
+    return {
+        "ko_idx": np.asarray(ko_idx, dtype=np.int64),
+        "ko_barriers": np.asarray(ko_barriers, dtype=np.float64),
+        "ko_obs": np.asarray(ko_obs, dtype=np.int64),
+        "knock_in_pct": knock_in_pct,
+        "daily_knock_in": daily_knock_in,
+        "div_idx": np.asarray(div_idx, dtype=np.int64),
+        "dividend_barrier_pct": dividend_barrier_pct,
+        "obs_dividend_rates": np.asarray(obs_dividend_rates, dtype=np.float64),
+        "knock_in_strike_pct": knock_in_strike_pct,
+        "participation_rate": participation_rate,
+        "max_loss_ratio": max_loss_ratio,
+    }
+
+
+def price_snowball_mc(
+    ko_idx, ko_barriers, ko_obs, obs_coupons, knock_in_pct, daily_knock_in,
+    snowball_type, knock_in_strike_pct, participation_rate, guaranteed_return,
+    max_loss_ratio, dividend_rate, term_in_years,
+    times, vol, rate=0.0, div_yield=0.0, n_paths=100000, seed=None,
+    memory_mb=MEMORY_BUDGET_MB, dtype=np.float64, chunk_size=None, workers=1, model=None,
+    control_variate=False, target_bp=None, time_budget=None
+):
+    """
+    雪球产品蒙特卡洛定价。
+    ko_idx / ko_barriers / ko_obs: 敲出观察日的交易日下标、障碍（期初价百分比）、观察日原始序号
+    times: 长度 N 的数组，第 j 个交易日距起始日的年数（用于扩散与贴现），N 即产品交易日数
+    vol / rate / div_yield: 年化波动率、无风险利率、分红率（连续复利）
+    memory_mb: 路径矩阵的内存预算；dtype: 路径精度（float64 / float32）
+    chunk_size: 直接指定每块路径数（须为 STATS_BLOCK 的整数倍，否则向上取整），默认按内存预算计算
+    workers: 并行进程数，结果与进程数无关
+    model: 路径模型，缺省为 GBMModel(vol, rate, div_yield)；rate 始终用于贴现
+    control_variate: 以敲入亏损腿的欧式看跌价差为控制变量（见 run_mc），
+                     结果的 variance_reduction 为本次达到的方差缩减倍数
+    target_bp / time_budget: 目标标准误（基点）与时间预算（秒），给出时 n_paths 为上限、
+                     达到目标即停止（见 run_mc）
+    其余参数与 engine.snowball.snowball_payoff 相同。
+    返回 MCResult。
+    """
+    product = snowball_product(
+        ko_idx, ko_barriers, ko_obs, obs_coupons, knock_in_pct, daily_knock_in,
+        snowball_type, knock_in_strike_pct, participation_rate, guaranteed_return,
+        max_loss_ratio, dividend_rate, term_in_years,
+    )
+    if model is None:
+        model = GBMModel(vol, rate, div_yield)
+    return run_mc(
+        "snowball", product, times, model, rate, n_paths, seed,
+        memory_mb, dtype, chunk_size, workers, control_variate, target_bp, time_budget,
+    )
+
+
+def price_phoenix_mc(
+    ko_idx, ko_barriers, ko_obs, knock_in_pct, daily_knock_in,
+    div_idx, dividend_barrier_pct, obs_dividend_rates,
+    knock_in_strike_pct, participation_rate, max_loss_ratio,
+    times, vol, rate=0.0, div_yield=0.0, n_paths=100000, seed=None,
+    memory_mb=MEMORY_BUDGET_MB, dtype=np.float64, chunk_size=None, workers=1, model=None,
+    control_variate=False, target_bp=None, time_budget=None
+):
+    """
+    凤凰产品蒙特卡洛定价，price 为派息现值减本金亏损现值。
+    div_idx: 每期派息观察日的交易日下标；dividend_barrier_pct: 派息障碍（期初价百分比）
+    其余参数同 price_snowball_mc 与 engine.phoenix.phoenix_cashflows。
+    返回 MCResult。
+    """
+    product = phoenix_product(
+        ko_idx, ko_barriers, ko_obs, knock_in_pct, daily_knock_in,
+        div_idx, dividend_barrier_pct, obs_dividend_rates,
+        knock_in_strike_pct, participation_rate, max_loss_ratio,
+    )
+    if model is None:
+        model = GBMModel(vol, rate, div_yield)
+    return run_mc(
+        "phoenix", product, times, model, rate, n_paths, seed,
+        memory_mb, dtype, chunk_size, workers, control_variate, target_bp, time_budget,
+    )
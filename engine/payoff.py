@@ -0,0 +1,107 @@
+"""
+雪球 / 凤凰产品的理论收益曲线（期末价格 -> 理论年化收益），按价格数组整体计算。
+
+与页面图1的口径一致：只看期末相对价格所在区域，不考虑路径。
+区域判断与收益由 np.select 一次完成，所有参数均可为数组并按 NumPy 规则广播，
+因此同一函数既可画 500 个点的曲线，也可在 (参数, 期末价格) 二维网格上画热力图。
+收益以年化比例表示（如 0.10 表示 10%）。
+凤凰的派息汇总量（逐期累计派息率）按派息日程预先计算一次，
+路径相关版本据此按敲入前实际派息的期数计入派息。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# 雪球区域编号与名称（snowball_regions 的返回值即为下标）
+SNOWBALL_REGIONS = ("敲入区", "无事件区", "敲出区")
+# 凤凰区域编号与名称（phoenix_regions 的返回值即为下标）
+PHOENIX_REGIONS = ("敲入区 (亏损)", "无事件区 (无收益)", "无事件区 (派息)", "敲出区 (派息)")
+
+# 凤凰派息日程的汇总量：cum_rates[k] 为前 k 期派息率之和（cum_rates[0] = 0，长度 = 期数 + 1），
+# total_rate 为全部派息率之和
+PhoenixCoupons = namedtuple("PhoenixCoupons", ["cum_rates", "total_rate"])
+
+
+def knock_in_loss(relative_price, knock_in_strike_pct, participation_rate, max_loss_ratio):
+    """敲入亏损比例：min(max(0, 敲入执行价 - 期末价/期初价), 最大亏损) × 参与率"""
+    raw_loss = np.maximum(0.0, knock_in_strike_pct - np.asarray(relative_price, dtype=np.float64))
+    return np.minimum(raw_loss, max_loss_ratio) * participation_rate
+
+
+def snowball_regions(relative_price, knock_in_pct, ko_barrier_pct):
+    """期末相对价格所在区域：0 敲入区（<= 敲入障碍）、1 无事件区、2 敲出区（>= 敲出障碍）"""
+    relative_price = np.asarray(relative_price, dtype=np.float64)
+    return np.select(
+        [relative_price >= ko_barrier_pct, relative_price > knock_in_pct], [2, 1], 0
+    )
+
+
+def snowball_theoretical_payoff(
+    relative_price, snowball_type, knock_in_pct, knock_in_strike_pct, participation_rate,
+    guaranteed_return, max_loss_ratio, ko_barrier_pct, ko_coupon, dividend_rate, term_in_years
+):
+    """
+    雪球 / 三元雪球的理论年化收益。
+    relative_price: 期末价格 / 期初价格（数组）
+    ko_barrier_pct / ko_coupon: 最后一个观察日的敲出障碍与敲出票息（年化）
+    敲出区为敲出票息，无事件区为红利票息；敲入区雪球为按期限年化的亏损，三元雪球为敲入收益率。
+    """
+    relative_price = np.asarray(relative_price, dtype=np.float64)
+    if snowball_type == "雪球":
+        loss = knock_in_loss(relative_price, knock_in_strike_pct, participation_rate, max_loss_ratio)
+        knock_in_payoff = -loss / term_in_years if term_in_years > 0 else -loss
+    else:
+        knock_in_payoff = guaranteed_return
+    return np.select(
+        [relative_price >= ko_barrier_pct, relative_price > knock_in_pct],
+        [ko_coupon, dividend_rate],
+        knock_in_payoff,
+    )
+
+
+def phoenix_coupons(obs_dividend_rates):
+    """由各期派息率预先计算派息汇总量（每个派息日程只需计算一次），返回 PhoenixCoupons"""
+    rates = np.ravel(np.asarray(obs_dividend_rates, dtype=np.float64))
+    cum_rates = np.concatenate([[0.0], np.cumsum(rates)])
+    return PhoenixCoupons(cum_rates, float(cum_rates[-1]))
+
+
+def phoenix_regions(relative_price, knock_in_pct, dividend_barrier_pct, ko_barrier_pct):
+    """
+    期末相对价格所在区域：0 敲入区（<= 敲入障碍）、1 无事件未派息（< 派息障碍）、
+    2 无事件派息、3 敲出区（>= 敲出障碍）
+    """
+    relative_price = np.asarray(relative_price, dtype=np.float64)
+    return np.select(
+        [
+            relative_price >= ko_barrier_pct,
+            relative_price <= knock_in_pct,
+            relative_price >= dividend_barrier_pct,
+        ],
+        [3, 0, 2],
+        1,
+    )
+
+
+def phoenix_payoff(
+    relative_price, coupons, knock_in_pct, knock_in_strike_pct, participation_rate, max_loss_ratio,
+    dividend_barrier_pct, ko_barrier_pct, term_in_years, paid_periods=None, scale=1.0
+):
+    """
+    凤凰产品的理论年化收益与区域编号，一次求值，返回 (年化收益, 区域编号)。
+    coupons: phoenix_coupons 的派息汇总量；scale: 派息率的缩放倍数（可为数组）
+    paid_periods: 敲入前已派息的期数（可为数组）。None 时敲入区不计派息（全有或全无的近似）；
+                  给出时敲入区收益为 前 paid_periods 期派息之和 - 本金亏损（路径相关口径）
+    敲出区与无事件派息区为全部派息，无事件未派息区为 0；总额按产品期限年化。
+    """
+    region = phoenix_regions(relative_price, knock_in_pct, dividend_barrier_pct, ko_barrier_pct)
+    loss = knock_in_loss(relative_price, knock_in_strike_pct, participation_rate, max_loss_ratio)
+    if paid_periods is None:
+        knock_in_total = -loss
+    else:
+        paid = np.clip(np.asarray(paid_periods, dtype=np.int64), 0, len(coupons.cum_rates) - 1)
+        knock_in_total = coupons.cum_rates[paid] * scale - loss
+    all_paid = coupons.total_rate * scale
+    total = np.choose(region, [knock_in_total, 0.0, all_paid, all_paid])
+    payoff = total / term_in_years if term_in_years > 0 else np.zeros_like(total)
+    return payoff, region
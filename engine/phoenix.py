@@ -0,0 +1,75 @@
+"""
+凤凰结构产品路径估值内核。
+
+在 engine.snowball 的敲入/敲出判断之上增加逐期派息记录，单条或批量路径一次性估值。
+派息规则与页面一致：
+  * 派息观察日收盘价 >= 派息障碍点位即派息，否则记为未派息；
+  * 敲出当天先判断敲出、产品结束，该日不再记录派息；
+  * 每日观察敲入：敲入当天及之后不再记录派息；到期观察敲入不影响期间派息；
+  * 第 0 天（产品起始日）不做任何观察。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from engine.snowball import evaluate_snowball
+
+# 路径估值结果；未发生的事件下标记为 -1
+# knock_out_idx / ko_obs / knock_in_idx / final_price: 同 engine.snowball.SnowballOutcome
+# coupon_observed / coupon_paid: (..., 派息期数) 布尔数组，该期是否被观察、是否派息
+PhoenixOutcome = namedtuple(
+    "PhoenixOutcome",
+    ["knock_out_idx", "ko_obs", "knock_in_idx", "final_price", "coupon_observed", "coupon_paid"],
+)
+
+
+def evaluate_phoenix(
+    prices, ko_idx, ko_levels, ko_obs, knock_in_level, div_idx, dividend_level,
+    daily_knock_in=True
+):
+    """
+    评估价格路径上的敲入/敲出事件与逐期派息。
+    prices: (..., N) 价格路径，第 0 天为起始日
+    ko_idx / ko_levels / ko_obs: engine.snowball.compile_knock_out 编译出的敲出日程及障碍点位
+    div_idx: 每期派息观察日的交易日下标（按派息期顺序，可含超出 [1, N) 的下标，视为不观察）
+    dividend_level: 派息障碍点位
+    返回 PhoenixOutcome。
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    n_days = prices.shape[-1]
+    base = evaluate_snowball(prices, ko_idx, ko_levels, ko_obs, knock_in_level, daily_knock_in)
+
+    div_idx = np.asarray(div_idx, dtype=np.int64)
+    in_window = (div_idx > 0) & (div_idx < n_days)
+    day = np.where(in_window, div_idx, 0)
+    ko_at = base.knock_out_idx[..., None]
+    ki_at = base.knock_in_idx[..., None]
+
+    # 该期是否被观察：在产品结束之前（敲出日当天不观察），每日观察时还须在敲入日之前
+    observed = in_window & ((ko_at < 0) | (day < ko_at))
+    if daily_knock_in:
+        observed &= (ki_at < 0) | (day < ki_at)
+    paid = observed & (prices[..., day] >= dividend_level)
+    return PhoenixOutcome(
+        base.knock_out_idx, base.ko_obs, base.knock_in_idx, base.final_price, observed, paid
+    )
+
+
+def phoenix_cashflows(
+    outcome, start_price, notional_principal, obs_dividend_rates,
+    knock_in_strike_pct, participation_rate, max_loss_ratio
+):
+    """
+    按页面的结算规则拆分每条路径的现金流（与名义本金同单位）。
+    派息收入：已派息各期的 名义本金 × 当期派息率 之和
+    本金亏损：未敲出且敲入时 min(max(0, 敲入执行价 - 期末价/期初价), 最大亏损) × 名义本金 × 参与率
+    返回 (派息收入, 本金亏损)，总收益 = 派息收入 - 本金亏损。
+    """
+    rates = np.asarray(obs_dividend_rates, dtype=np.float64)
+    coupon_income = notional_principal * (outcome.coupon_paid @ rates)
+
+    knocked_in = (outcome.knock_out_idx < 0) & (outcome.knock_in_idx >= 0)
+    raw_loss = np.maximum(0.0, knock_in_strike_pct - outcome.final_price / start_price)
+    loss = np.minimum(raw_loss, max_loss_ratio) * notional_principal * participation_rate
+    principal_loss = np.where(knocked_in, loss, 0.0)
+    return coupon_income, principal_loss
@@ -0,0 +1,302 @@
+"""
+产品条款对象：雪球、三元雪球、凤凰、鲨鱼鳍。
+
+条款对象只保存用户给出的条款（日期、障碍、票息等，比例均以小数表示），创建后不可修改，
+相等性与哈希由全部条款决定；digest 为条款的稳定摘要（SHA-1，与进程、运行次数无关），
+可作为缓存键、批处理结果的产品标识。
+
+compile(calendar) 按交易日历把条款编译一次，得到 CompiledProduct：观察日交易日下标、
+障碍、票息、派息率等连续只读数组，以及定价引擎的产品关键字参数 args：
+雪球 / 凤凰的 args 即 engine.montecarlo.snowball_product / phoenix_product 的参数，
+与 times 一起可直接传给 price_*_mc、price_*_pde、simulate_* 等；鲨鱼鳍的 args 为
+engine.sharkfin 的产品参数，可直接传给 price_sharkfin_mc、sharkfin_value / sharkfin_greeks
+与 engine.backtest.backtest_sharkfin。
+编译结果按 (条款, 日历) 缓存，同一产品重复定价不再解析日期或查表；鲨鱼鳍不依赖交易日历，编译时不加载行情数据。
+"""
+import hashlib
+from collections import namedtuple
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+
+from engine.sharkfin import CALL, PUT
+from engine.snowball import compile_knock_out
+from price_store import TRADING_DAYS_PER_YEAR
+from trading_calendar import get_calendar, to_days
+
+# 编译结果，数组均为连续只读数组：
+# digest: 条款摘要；dates: 产品交易日（datetime64[D]，鲨鱼鳍为 None）；
+# times: 各交易日距起始日的年数（按 TRADING_DAYS_PER_YEAR，扩散时间）；
+# day_years: 各交易日距起始日的自然年数（/365，回测计算存续期）；term_in_years: 产品期限（自然年）；
+# ko_idx / ko_obs / ko_barriers: 敲出（鲨鱼鳍为障碍）观察日下标、其在原始列表中的序号、对应障碍；
+# obs_coupons: 各观察日的敲出票息（雪球，按原始序号）；div_idx / dividend_rates: 派息观察日下标与派息率（凤凰）；
+# args: 定价引擎的产品关键字参数（只读映射，不含 times 与模型参数）
+CompiledProduct = namedtuple(
+    "CompiledProduct",
+    ["digest", "dates", "times", "day_years", "term_in_years",
+     "ko_idx", "ko_obs", "ko_barriers", "obs_coupons", "div_idx", "dividend_rates", "args"],
+)
+
+
+def _frozen(values, dtype=np.float64):
+    arr = np.ascontiguousarray(values, dtype=dtype)
+    arr.flags.writeable = False
+    return arr
+
+
+def _canonical(value):
+    """条款取值的规范文本：浮点数用 repr（精确往返），日期用 ISO 格式"""
+    if isinstance(value, tuple):
+        return "(" + ",".join(_canonical(v) for v in value) + ")"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class ProductSpec:
+    """
+    产品条款基类：子类以 __slots__ 声明条款字段（fields），创建后不可修改。
+    日期统一为 datetime64[D] 的 ISO 字符串，列表统一为元组，数值统一为 float / bool。
+    """
+    __slots__ = ("_digest",)
+    fields = ()
+    kind = ""
+    # 编译是否依赖交易日历；不依赖时 compile 不加载行情数据
+    uses_calendar = True
+
+    def __setattr__(self, name, value):
+        raise AttributeError("产品条款创建后不可修改，请用 replace() 生成新条款")
+
+    def _set(self, **values):
+        for name in self.fields:
+            object.__setattr__(self, name, values[name])
+        text = self.kind + "|" + "|".join(f"{name}={_canonical(getattr(self, name))}" for name in self.fields)
+        object.__setattr__(self, "_digest", hashlib.sha1(text.encode("utf-8")).hexdigest())
+
+    @property
+    def digest(self):
+        """条款的稳定摘要（40 位十六进制）"""
+        return self._digest
+
+    def __hash__(self):
+        return int(self._digest[:16], 16)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._digest == other._digest
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{n}={getattr(self, n)!r}' for n in self.fields)})"
+
+    def __reduce__(self):
+        return _rebuild, (type(self), self.to_dict())
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.fields}
+
+    def replace(self, **changes):
+        """修改部分条款后的新条款对象"""
+        return type(self)(**{**self.to_dict(), **changes})
+
+    def compile(self, calendar=None):
+        """按交易日历（缺省为 get_calendar()）编译，返回 CompiledProduct（按条款与日历缓存）"""
+        if not self.uses_calendar:
+            return _compile(self, None)
+        return _compile(self, get_calendar() if calendar is None else calendar)
+
+
+def _rebuild(cls, values):
+    return cls(**values)
+
+
+def _dates(values):
+    return tuple(str(d) for d in to_days(list(values)))
+
+
+def _floats(values):
+    return tuple(float(v) for v in values)
+
+
+def _schedule(calendar, start_date, obs_dates, obs_barriers):
+    """观察日编译成产品交易日区间内的下标；返回 (dates, times, day_years, term, ko_idx, ko_obs, ko_barriers)"""
+    lo, hi = calendar.window(start_date, obs_dates[-1])
+    dates = calendar.dates[lo:hi]
+    ko_idx, ko_obs = compile_knock_out(calendar.index_of(list(obs_dates)) - lo, hi - lo)
+    start = np.datetime64(start_date, "D")
+    day_years = (dates - start).astype(np.int64) / 365.0
+    term = (np.datetime64(obs_dates[-1], "D") - start).astype(np.int64) / 365.0
+    return (
+        dates, _frozen(np.arange(hi - lo) / TRADING_DAYS_PER_YEAR), _frozen(day_years), float(term),
+        _frozen(ko_idx, np.int64), _frozen(ko_obs, np.int64), _frozen(np.asarray(obs_barriers)[ko_obs]),
+    )
+
+
+class SnowballSpec(ProductSpec):
+    """雪球条款；obs_dates / obs_barriers / obs_coupons 一一对应，dividend_rate 缺省同末期敲出票息"""
+    __slots__ = (
+        "start_date", "obs_dates", "obs_barriers", "obs_coupons", "knock_in_pct", "daily_knock_in",
+        "knock_in_strike_pct", "participation_rate", "guaranteed_return", "max_loss_ratio", "dividend_rate",
+    )
+    fields = __slots__
+    kind = "雪球"
+
+    def __init__(
+        self, start_date, obs_dates, obs_barriers, obs_coupons, knock_in_pct=0.7, daily_knock_in=True,
+        knock_in_strike_pct=1.0, participation_rate=1.0, guaranteed_return=0.0, max_loss_ratio=1.0,
+        dividend_rate=None
+    ):
+        obs_dates, obs_barriers, obs_coupons = _dates(obs_dates), _floats(obs_barriers), _floats(obs_coupons)
+        if not obs_dates:
+            raise ValueError("至少需要一个敲出观察日")
+        if not (len(obs_dates) == len(obs_barriers) == len(obs_coupons)):
+            raise ValueError("观察日、障碍价、票息 列表长度必须一致")
+        self._set(
+            start_date=_dates([start_date])[0], obs_dates=obs_dates, obs_barriers=obs_barriers,
+            obs_coupons=obs_coupons, knock_in_pct=float(knock_in_pct), daily_knock_in=bool(daily_knock_in),
+            knock_in_strike_pct=float(knock_in_strike_pct), participation_rate=float(participation_rate),
+            guaranteed_return=float(guaranteed_return), max_loss_ratio=float(max_loss_ratio),
+            dividend_rate=float(obs_coupons[-1] if dividend_rate is None else dividend_rate),
+        )
+
+    def _compile(self, calendar):
+        dates, times, day_years, term, ko_idx, ko_obs, ko_barriers = _schedule(
+            calendar, self.start_date, self.obs_dates, self.obs_barriers
+        )
+        obs_coupons = _frozen(self.obs_coupons)
+        args = {
+            "ko_idx": ko_idx, "ko_barriers": ko_barriers, "ko_obs": ko_obs, "obs_coupons": obs_coupons,
+            "knock_in_pct": self.knock_in_pct, "daily_knock_in": self.daily_knock_in,
+            "snowball_type": self.kind, "knock_in_strike_pct": self.knock_in_strike_pct,
+            "participation_rate": self.participation_rate, "guaranteed_return": self.guaranteed_return,
+            "max_loss_ratio": self.max_loss_ratio, "dividend_rate": self.dividend_rate,
+            "term_in_years": term,
+        }
+        empty = _frozen([], np.int64)
+        return CompiledProduct(
+            self.digest, dates, times, day_years, term, ko_idx, ko_obs, ko_barriers, obs_coupons,
+            empty, _frozen([]), MappingProxyType(args),
+        )
+
+
+class TernarySnowballSpec(SnowballSpec):
+    """
+    三元雪球条款：敲入后获得 guaranteed_return（年化），不承担本金亏损。
+    参数同 SnowballSpec；敲入亏损条款（knock_in_strike_pct / participation_rate / max_loss_ratio）
+    对三元雪球不起作用，接受但不计入条款，取值不同的两个三元雪球条款相等
+    """
+    __slots__ = ()
+    kind = "三元雪球"
+
+    def __init__(
+        self, start_date, obs_dates, obs_barriers, obs_coupons, knock_in_pct=0.7, daily_knock_in=True,
+        knock_in_strike_pct=None, participation_rate=None, guaranteed_return=0.01, max_loss_ratio=None,
+        dividend_rate=None
+    ):
+        super().__init__(
+            start_date, obs_dates, obs_barriers, obs_coupons, knock_in_pct, daily_knock_in,
+            guaranteed_return=guaranteed_return, dividend_rate=dividend_rate,
+        )
+
+
+class PhoenixSpec(ProductSpec):
+    """凤凰条款；obs_dates / obs_barriers 一一对应，div_dates / dividend_rates 一一对应"""
+    __slots__ = (
+        "start_date", "obs_dates", "obs_barriers", "div_dates", "dividend_rates", "dividend_barrier_pct",
+        "knock_in_pct", "daily_knock_in", "knock_in_strike_pct", "participation_rate", "max_loss_ratio",
+    )
+    fields = __slots__
+    kind = "凤凰"
+
+    def __init__(
+        self, start_date, obs_dates, obs_barriers, div_dates, dividend_rates, dividend_barrier_pct=0.7,
+        knock_in_pct=0.7, daily_knock_in=True, knock_in_strike_pct=1.0, participation_rate=1.0,
+        max_loss_ratio=1.0
+    ):
+        obs_dates, obs_barriers = _dates(obs_dates), _floats(obs_barriers)
+        div_dates, dividend_rates = _dates(div_dates), _floats(dividend_rates)
+        if not obs_dates:
+            raise ValueError("至少需要一个敲出观察日")
+        if len(obs_dates) != len(obs_barriers):
+            raise ValueError("敲出观察日与敲出障碍价列表长度不一致")
+        if len(div_dates) != len(dividend_rates):
+            raise ValueError("派息观察日与派息率列表长度不一致")
+        self._set(
+            start_date=_dates([start_date])[0], obs_dates=obs_dates, obs_barriers=obs_barriers,
+            div_dates=div_dates, dividend_rates=dividend_rates, dividend_barrier_pct=float(dividend_barrier_pct),
+            knock_in_pct=float(knock_in_pct), daily_knock_in=bool(daily_knock_in),
+            knock_in_strike_pct=float(knock_in_strike_pct), participation_rate=float(participation_rate),
+            max_loss_ratio=float(max_loss_ratio),
+        )
+
+    def _compile(self, calendar):
+        dates, times, day_years, term, ko_idx, ko_obs, ko_barriers = _schedule(
+            calendar, self.start_date, self.obs_dates, self.obs_barriers
+        )
+        lo = calendar.index_of(self.start_date)
+        # 派息观察日可超出产品区间（各引擎视为不观察），保留原始顺序与期数
+        div_idx = _frozen(np.atleast_1d(calendar.index_of(list(self.div_dates))) - lo if self.div_dates else [], np.int64)
+        dividend_rates = _frozen(self.dividend_rates)
+        args = {
+            "ko_idx": ko_idx, "ko_barriers": ko_barriers, "ko_obs": ko_obs,
+            "knock_in_pct": self.knock_in_pct, "daily_knock_in": self.daily_knock_in,
+            "div_idx": div_idx, "dividend_barrier_pct": self.dividend_barrier_pct,
+            "obs_dividend_rates": dividend_rates, "knock_in_strike_pct": self.knock_in_strike_pct,
+            "participation_rate": self.participation_rate, "max_loss_ratio": self.max_loss_ratio,
+        }
+        return CompiledProduct(
+            self.digest, dates, times, day_years, term, ko_idx, ko_obs, ko_barriers, _frozen([]),
+            div_idx, dividend_rates, MappingProxyType(args),
+        )
+
+
+class SharkfinSpec(ProductSpec):
+    """
+    鲨鱼鳍条款（期初价 = 1）：direction 为 engine.sharkfin.CALL / PUT，
+    障碍每日收盘观察，期限 term_months 个月按 TRADING_DAYS_PER_YEAR 折算交易日
+    （与 price_sharkfin_mc、backtest_sharkfin 的缺省交易日数一致，args 中不含 n_days）。
+    编译不依赖交易日历，compile 忽略 calendar 参数
+    """
+    __slots__ = ("direction", "strike_pct", "barrier_pct", "participation_rate", "rebate_rate", "term_months")
+    fields = __slots__
+    kind = "鲨鱼鳍"
+    uses_calendar = False
+
+    def __init__(self, direction, strike_pct, barrier_pct, participation_rate=1.0, rebate_rate=0.0, term_months=12):
+        if direction not in (CALL, PUT):
+            raise ValueError(f"不支持的鲨鱼鳍方向：{direction}")
+        if (barrier_pct - strike_pct) * (1 if direction == CALL else -1) <= 0:
+            raise ValueError("看涨鲨鱼鳍要求 障碍价格 > 执行价格，看跌鲨鱼鳍要求 障碍价格 < 执行价格")
+        self._set(
+            direction=direction, strike_pct=float(strike_pct), barrier_pct=float(barrier_pct),
+            participation_rate=float(participation_rate), rebate_rate=float(rebate_rate),
+            term_months=int(term_months),
+        )
+
+    @property
+    def term_years(self):
+        return self.term_months / 12
+
+    def _compile(self, calendar):
+        term = self.term_years
+        n_days = int(round(term * TRADING_DAYS_PER_YEAR)) + 1
+        times = _frozen(np.arange(n_days) * (term / max(n_days - 1, 1)))
+        ko_idx = _frozen(np.arange(1, n_days), np.int64)
+        args = {
+            "direction": self.direction, "strike": self.strike_pct, "barrier": self.barrier_pct,
+            "participation": self.participation_rate, "rebate_rate": self.rebate_rate,
+            "term_years": term,
+        }
+        return CompiledProduct(
+            self.digest, None, times, times, term, ko_idx, _frozen(np.arange(n_days - 1), np.int64),
+            _frozen(np.full(n_days - 1, self.barrier_pct)), _frozen([]), _frozen([], np.int64), _frozen([]),
+            MappingProxyType(args),
+        )
+
+
+# 产品类型名称 -> 条款类
+SPECS = {spec.kind: spec for spec in (SnowballSpec, TernarySnowballSpec, PhoenixSpec, SharkfinSpec)}
+
+
+@lru_cache(maxsize=128)
+def _compile(spec, calendar):
+    return spec._compile(calendar)
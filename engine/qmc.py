@@ -0,0 +1,159 @@
+"""
+拟蒙特卡洛（QMC）路径生成：扰动 Sobol 序列 + 布朗桥。
+
+布朗桥先生成到期日，再按二分顺序生成敲出/派息观察日，最后填充其余交易日，
+使 Sobol 序列前几维（均匀性最好的维度）决定对收益影响最大的观察日价格。
+每批为一次独立扰动（随机化 QMC），各批点数之和恰为所需路径数；标准误由各批均值估计。
+与 engine.montecarlo.GBMModel 接口相同，可直接用于 run_mc / price_*_mc。
+"""
+import bisect
+import time
+import warnings
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+from engine.montecarlo import MIN_REPLICATIONS, GBMModel
+
+# 随机化重复次数（批数），用于估计标准误
+REPLICATIONS = 16
+# 路径数较少时每批的目标最少点数（批数随之减少，但不少于 MIN_REPLICATIONS）
+MIN_BATCH_POINTS = 256
+
+
+def bridge_order(n_days, key_idx=()):
+    """
+    布朗桥的生成顺序（交易日下标 1..n_days-1 的排列）：
+    到期日 -> 关键日（观察日，按二分顺序）-> 其余交易日（按区间二分，逐层展开）。
+    """
+    last = n_days - 1
+    keys = sorted({int(k) for k in key_idx if 0 < k < last})
+    order = [last]
+
+    # 关键日：在 [0, 到期日] 的关键日列表上逐层二分
+    anchors = [0] + keys + [last]
+    queue = deque([(0, len(anchors) - 1)])
+    while queue:
+        lo, hi = queue.popleft()
+        if hi - lo < 2:
+            continue
+        mid = (lo + hi) // 2
+        order.append(anchors[mid])
+        queue.extend([(lo, mid), (mid, hi)])
+
+    # 其余交易日：在相邻关键日之间逐层二分
+    queue = deque(zip(anchors[:-1], anchors[1:]))
+    while queue:
+        lo, hi = queue.popleft()
+        if hi - lo < 2:
+            continue
+        mid = (lo + hi) // 2
+        order.append(mid)
+        queue.extend([(lo, mid), (mid, hi)])
+    return np.array(order, dtype=np.int64)
+
+
+def bridge_weights(times, order):
+    """
+    预先计算布朗桥各步的系数：W[j] = wl * W[l] + wr * W[r] + sd * z。
+    l / r 为生成 j 时已知的左右最近点（左侧至少为第 0 天，W = 0；右侧没有时 wr = 0）。
+    返回 (left, right, wl, wr, sd) 数组，与 order 一一对应。
+    """
+    times = np.asarray(times, dtype=np.float64)
+    known = [0]
+    left, right, wl, wr, sd = [], [], [], [], []
+    for j in order:
+        pos = bisect.bisect_left(known, j)
+        l = known[pos - 1]
+        r = known[pos] if pos < len(known) else None
+        if r is None:
+            left.append(l); right.append(0); wl.append(1.0); wr.append(0.0)
+            sd.append(np.sqrt(times[j] - times[l]))
+        else:
+            span = times[r] - times[l]
+            left.append(l); right.append(r)
+            wl.append((times[r] - times[j]) / span); wr.append((times[j] - times[l]) / span)
+            sd.append(np.sqrt((times[j] - times[l]) * (times[r] - times[j]) / span))
+        known.insert(pos, int(j))
+    return (np.array(left), np.array(right), np.array(wl), np.array(wr), np.array(sd))
+
+
+def bridge_paths(z, order, weights):
+    """
+    由标准正态 z (n_paths, n_days-1)（第 k 列对应 order[k]）构造标准布朗运动 W，
+    返回形状 (n_days, n_paths)（按交易日排列，逐行写入更快）。
+    """
+    left, right, wl, wr, sd = weights
+    n_paths, n_steps = z.shape
+    w = np.zeros((n_steps + 1, n_paths))
+    zt = np.ascontiguousarray(z.T)
+    for k, j in enumerate(order):
+        w[j] = wl[k] * w[left[k]] + wr[k] * w[right[k]] + sd[k] * zt[k]
+    return w
+
+
+class SobolGBMModel(GBMModel):
+    """
+    风险中性 GBM 的随机化拟蒙特卡洛路径模型。
+    key_idx: 需优先生成的交易日下标（敲出观察日、派息观察日等）
+    """
+    __slots__ = ("key_idx",)
+    # Sobol 点、正态数与布朗桥的额外工作区
+    extra_bytes_per_day = 24
+    # 各批为独立扰动的重复，标准误按批均值估计
+    replicated = True
+
+    def __init__(self, vol, rate=0.0, div_yield=0.0, key_idx=()):
+        super().__init__(vol, rate, div_yield)
+        self.key_idx = tuple(int(k) for k in np.ravel(key_idx))
+
+    def batch_sizes(self, n_paths):
+        """
+        REPLICATIONS 批（路径数较少时减少批数，使每批尽量不少于 MIN_BATCH_POINTS 点），
+        n_paths 均分到各批，总路径数恰为 n_paths；每批点数不必是 2 的幂
+        """
+        n_paths = int(n_paths)
+        n_batches = min(n_paths, max(MIN_REPLICATIONS, min(REPLICATIONS, n_paths // MIN_BATCH_POINTS)))
+        per_batch, extra = divmod(n_paths, n_batches)
+        return [per_batch + (k < extra) for k in range(n_batches)]
+
+    def sampler(self, rng, times, dtype=np.float64):
+        times = np.asarray(times, dtype=np.float64)
+        order = bridge_order(len(times), self.key_idx)
+        weights = bridge_weights(times, order)
+        sobol = qmc.Sobol(len(times) - 1, scramble=True, rng=rng)
+        drift = (self.rate - self.div_yield - 0.5 * self.vol * self.vol) * times
+
+        def draw(n_paths):
+            # 同一批内连续取点，分块与一次取点得到同一组 Sobol 点；
+            # 点数不是 2 的幂时 scipy 会提示均衡性，随机化重复下估计仍无偏，忽略即可
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                u = sobol.random(n_paths)
+            z = ndtri(u, out=u)
+            w = bridge_paths(z, order, weights)
+            log_paths = (drift[:, None] + self.vol * w).T
+            return np.ascontiguousarray(log_paths, dtype=dtype)
+        return draw
+
+
+def convergence_report(price, models, path_counts=(4096, 16384, 65536), seed=None):
+    """
+    各路径模型的标准误随路径数的变化。
+    price: 定价函数 (model, n_paths, seed) -> MCResult，如对 price_snowball_mc 的包装
+    models: {名称: 路径模型}
+    返回 DataFrame：模型、路径数、价格、标准误、耗时（秒）。
+    """
+    rows = []
+    for name, model in models.items():
+        for n in path_counts:
+            t0 = time.perf_counter()
+            result = price(model, int(n), seed)
+            rows.append({
+                "模型": name, "路径数": result.n_paths, "价格": result.price,
+                "标准误": result.std_error, "耗时 (秒)": time.perf_counter() - t0,
+            })
+    return pd.DataFrame(rows)
@@ -0,0 +1,162 @@
+"""
+观察日程：文本解析、按规则生成观察日、阶梯敲出障碍。
+
+页面上的日期 / 百分比列表（逗号、分号或换行分隔）整体一次解析，
+非法项按 第几项（第几行第几列）报告，不会被静默跳过。
+按月 / 按季的观察日由产品开始日按月平移得到，锁定期内不观察，
+落在非交易日时按交易日历调整（顺延 / 提前 / 修正顺延）。
+结果均为只读 NumPy 数组（日期为 datetime64[D]，比例为小数），按输入缓存，
+可直接传给 engine.products 的条款对象。
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# 列表项分隔符：英文 / 中文逗号、分号与空白
+_TOKEN = re.compile(r"[^,，;；\s]+")
+# 报告非法项时最多列出的个数
+MAX_REPORTED = 5
+# 观察频率 -> 间隔月数
+FREQUENCIES = {"每月": 1, "每两月": 2, "每季": 3, "每半年": 6, "每年": 12}
+# 非交易日调整方式：顺延、提前、修正顺延（顺延跨月时改为提前）
+ROLLS = {"顺延": "following", "提前": "preceding", "修正顺延": "modified_following"}
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+def tokenize(text):
+    """拆分列表文本，返回 (各项文本, 各项的 (行, 列))，行列从 1 开始"""
+    tokens, positions = [], []
+    line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+    for m in _TOKEN.finditer(text):
+        line = np.searchsorted(line_starts, m.start(), side="right")
+        tokens.append(m.group())
+        positions.append((int(line), m.start() - line_starts[line - 1] + 1))
+    return tokens, positions
+
+
+def _invalid(kind, tokens, positions, bad):
+    bad = np.flatnonzero(bad)
+    items = "；".join(
+        f"第 {k + 1} 项（第 {positions[k][0]} 行第 {positions[k][1]} 列）“{tokens[k]}”"
+        for k in bad[:MAX_REPORTED]
+    )
+    more = f" 等 {len(bad)} 项" if len(bad) > MAX_REPORTED else ""
+    return ValueError(f"无法解析的{kind}：{items}{more}")
+
+
+@lru_cache(maxsize=64)
+def parse_dates(text):
+    """
+    解析日期列表文本（YYYY-MM-DD、YYYY/MM/DD、YYYY.MM.DD、YYYYMMDD 或 YYYY年MM月DD日，月日可不补零），
+    返回只读 datetime64[D] 数组；存在非法项时抛出 ValueError 并给出位置。
+    """
+    tokens, positions = tokenize(text)
+    normalized = pd.Series(tokens, dtype=object).str.replace(r"[/.年月]", "-", regex=True).str.rstrip("日")
+    parsed = pd.to_datetime(normalized, format="%Y-%m-%d", errors="coerce")
+    compact = parsed.isna()
+    if compact.any():
+        parsed[compact] = pd.to_datetime(normalized[compact], format="%Y%m%d", errors="coerce")
+    bad = parsed.isna().values
+    if bad.any():
+        raise _invalid("日期", tokens, positions, bad)
+    return _readonly(parsed.values.astype("datetime64[D]"))
+
+
+@lru_cache(maxsize=64)
+def parse_percents(text):
+    """解析百分比列表文本（如 “100%, 99.5” ，% 可省略），返回只读小数数组；非法项抛出 ValueError 并给出位置"""
+    tokens, positions = tokenize(text)
+    values = pd.to_numeric(pd.Series(tokens, dtype=object).str.rstrip("%"), errors="coerce").values
+    bad = ~np.isfinite(values.astype(np.float64))
+    if bad.any():
+        raise _invalid("百分比", tokens, positions, bad)
+    return _readonly(values.astype(np.float64) / 100.0)
+
+
+def format_dates(dates):
+    """日期数组 -> 页面文本（YYYY/MM/DD，每行 5 个）"""
+    text = [str(d).replace("-", "/") for d in np.asarray(dates, dtype="datetime64[D]")]
+    return "\n".join(",".join(text[i:i + 5]) for i in range(0, len(text), 5))
+
+
+def format_percents(values, decimals=2):
+    """小数数组 -> 页面文本（百分比，每行 1 个）"""
+    return "\n".join(f"{v * 100:.{decimals}f}%" for v in np.ravel(values))
+
+
+def add_months(start, months):
+    """
+    start 之后 months（整数数组）个月的同日日期，目标月没有该日时取月末，返回 datetime64[D] 数组
+    """
+    start = np.datetime64(pd.Timestamp(start).date(), "D")
+    month = start.astype("datetime64[M]")
+    day = (start - month.astype("datetime64[D]")).astype(np.int64)
+    target = month + np.asarray(months, dtype=np.int64)
+    month_end = (target + 1).astype("datetime64[D]") - 1
+    return np.minimum(target.astype("datetime64[D]") + day, month_end)
+
+
+def roll_dates(calendar, dates, roll="following"):
+    """
+    非交易日按交易日历调整：following 顺延、preceding 提前、
+    modified_following 顺延后跨月则改为提前。返回 datetime64[D] 数组
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    if roll == "modified_following":
+        rolled = calendar.dates[calendar.index_of(dates, "following")]
+        crossed = rolled.astype("datetime64[M]") != dates.astype("datetime64[M]")
+        if crossed.any():
+            rolled[crossed] = calendar.dates[calendar.index_of(dates[crossed], "preceding")]
+        return rolled
+    if roll not in ("following", "preceding"):
+        raise ValueError(f"不支持的非交易日调整方式：{roll}")
+    return calendar.dates[calendar.index_of(dates, roll)]
+
+
+def observation_schedule(calendar, start_date, term_months, every_months=1, lockout_months=0, roll="following"):
+    """
+    按月平移生成观察日：产品开始日之后第 every_months、2×every_months、…、term_months 个月的同日，
+    早于第 lockout_months 个月的观察日不观察（锁定期），再按 roll 调整到交易日。
+    返回只读 datetime64[D] 数组（按 (日历, 参数) 缓存）。
+    """
+    return _observation_schedule(
+        calendar, str(pd.Timestamp(start_date).date()), int(term_months), int(every_months),
+        int(lockout_months), roll,
+    )
+
+
+@lru_cache(maxsize=64)
+def _observation_schedule(calendar, start_date, term_months, every_months, lockout_months, roll):
+    if every_months <= 0 or term_months < every_months:
+        raise ValueError("观察间隔须为正，且不超过产品期限")
+    months = np.arange(every_months, term_months + 1, every_months)
+    months = months[months >= lockout_months]
+    if not len(months):
+        raise ValueError("锁定期覆盖了全部观察日")
+    dates = roll_dates(calendar, add_months(start_date, months), roll)
+    if np.any(np.diff(dates) <= np.timedelta64(0, "D")):
+        raise ValueError("调整到交易日后观察日重复，请检查观察频率与调整方式")
+    return _readonly(dates)
+
+
+def step_down_barriers(n, initial=1.0, step=0.005, floor=0.0, every=1):
+    """
+    阶梯敲出障碍：首期 initial，之后每 every 期下调 step，不低于 floor，
+    例如 step_down_barriers(22) 为 100%、99.5%、…、89.5%。返回只读小数数组
+    """
+    return _step_down_barriers(int(n), float(initial), float(step), float(floor), int(every))
+
+
+@lru_cache(maxsize=64)
+def _step_down_barriers(n, initial, step, floor, every):
+    if every <= 0:
+        raise ValueError("障碍下调间隔须为正")
+    # 取整到 1e-10，消除浮点误差（如 0.895 而非 0.8949999…）
+    levels = np.round(initial - step * (np.arange(n) // every), 10)
+    return _readonly(np.maximum(levels, floor))
@@ -0,0 +1,226 @@
+"""
+鲨鱼鳍（单边敲出 + 到期固定回报）定价。
+
+收益以名义本金 = 1、期初价格 = 1 计，不含本金，到期支付：
+  * 看涨鲨鱼鳍：存续期内价格曾 >= 障碍价则获得 固定年化回报 × 期限，否则 参与率 × max(期末价 - 执行价, 0)
+  * 看跌鲨鱼鳍：存续期内价格曾 <= 障碍价则获得 固定年化回报 × 期限，否则 参与率 × max(执行价 - 期末价, 0)
+
+解析定价：连续观察障碍下的敲出期权（Reiner–Rubinstein）加上按触碰概率计的到期回报，
+所有参数均可为数组并按 NumPy 规则广播，执行价 × 障碍 × 参与率的网格一次求值；
+离散观察（如每日收盘）用 Broadie–Glasserman–Kou 障碍平移近似。希腊字母由解析价格的中心差分得到。
+
+离散观察的蒙特卡洛：每条路径只压缩成 (观察日极值, 期末价格) 两个数，
+各参数组合在同一组路径上按块向量化估值（共同随机数，组合间的比较不受抽样噪声影响）。
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy.special import ndtr
+
+from engine.montecarlo import MEMORY_BUDGET_MB, GBMModel, chunk_size_for
+
+CALL = "看涨鲨鱼鳍"
+PUT = "看跌鲨鱼鳍"
+# Broadie–Glasserman–Kou 离散观察修正系数 -ζ(1/2)/sqrt(2π)
+BGK_BETA = 0.5825971579390107
+# 差分步长：标的价格的相对扰动、波动率的绝对扰动、一个交易日
+SPOT_BUMP = 0.01
+VOL_BUMP = 0.01
+DAY = 1.0 / 252
+# 每块参与计算的 (参数组合 × 路径) 元素数上限
+COMBO_BLOCK = 1 << 22
+
+# 解析定价结果（数组，形状为参数广播后的形状）：price 为收益现值；
+# delta / gamma 为对 S/S0 的一阶 / 二阶导数；vega 为波动率每变动 1（100%）的价值变化；
+# theta 为每过一个交易日的价值变化；hit_prob 为风险中性下触碰障碍的概率
+SharkfinGreeks = namedtuple(
+    "SharkfinGreeks", ["price", "delta", "gamma", "vega", "theta", "hit_prob"]
+)
+
+# 蒙特卡洛结果（数组，形状为参数广播后的形状）：price 为收益现值，std_error 为其标准误，
+# hit_prob 为触碰障碍的比例
+SharkfinMCResult = namedtuple("SharkfinMCResult", ["price", "std_error", "hit_prob", "n_paths"])
+
+
+def _sign(direction):
+    """看涨为 1（向上障碍），看跌为 -1（向下障碍）"""
+    if direction == CALL:
+        return 1.0
+    if direction == PUT:
+        return -1.0
+    raise ValueError(f"不支持的鲨鱼鳍方向：{direction}")
+
+
+def discrete_barrier(direction, barrier, vol, monitoring_dt):
+    """
+    离散观察障碍的连续观察等价障碍（Broadie–Glasserman–Kou）：
+    向上障碍上移、向下障碍下移 exp(β σ sqrt(Δt))；monitoring_dt 为观察间隔（年），0 为连续观察
+    """
+    return barrier * np.exp(_sign(direction) * BGK_BETA * vol * np.sqrt(monitoring_dt))
+
+
+def _no_hit(eta, spot, barrier, sd, mu, x2, y2):
+    """存续期内未触碰障碍的风险中性概率；eta = -1 为向上障碍，1 为向下障碍"""
+    return ndtr(eta * (x2 - sd)) - (barrier / spot) ** (2 * mu) * ndtr(eta * (y2 - sd))
+
+
+def sharkfin_value(
+    direction, strike, barrier, participation, rebate_rate, term_years,
+    vol, rate=0.0, div_yield=0.0, spot=1.0, maturity=None, monitoring_dt=0.0
+):
+    """
+    连续观察障碍下的鲨鱼鳍解析价格，返回 (收益现值, 触碰概率)。
+    strike / barrier: 执行价、障碍价（期初价倍数）；participation: 参与率；
+    rebate_rate: 越过障碍的固定年化回报，到期支付 rebate_rate × term_years；
+    spot: 当前价格（期初价倍数）；maturity: 剩余年数，缺省为 term_years；
+    monitoring_dt > 0 时按离散观察（间隔 monitoring_dt 年）平移障碍。
+    参数均可为数组并按 NumPy 规则广播。
+    """
+    sign = _sign(direction)
+    phi, eta = sign, -sign
+    maturity = term_years if maturity is None else maturity
+    strike, barrier, participation, rebate_rate, term_years, vol, spot, maturity = np.broadcast_arrays(
+        *(np.asarray(v, dtype=np.float64) for v in
+          (strike, barrier, participation, rebate_rate, term_years, vol, spot, maturity))
+    )
+    barrier = discrete_barrier(direction, barrier, vol, monitoring_dt)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        sd = vol * np.sqrt(maturity)
+        mu = (rate - div_yield - 0.5 * vol * vol) / (vol * vol)
+        carry = spot * np.exp(-div_yield * maturity)
+        discount = np.exp(-rate * maturity)
+        x1 = np.log(spot / strike) / sd + (1 + mu) * sd
+        x2 = np.log(spot / barrier) / sd + (1 + mu) * sd
+        y1 = np.log(barrier * barrier / (spot * strike)) / sd + (1 + mu) * sd
+        y2 = np.log(barrier / spot) / sd + (1 + mu) * sd
+        ratio = barrier / spot
+
+        def leg(x, reflected):
+            if reflected:
+                return (phi * carry * ratio ** (2 * (mu + 1)) * ndtr(eta * x)
+                        - phi * strike * discount * ratio ** (2 * mu) * ndtr(eta * (x - sd)))
+            return phi * carry * ndtr(phi * x) - phi * strike * discount * ndtr(phi * (x - sd))
+
+        knock_out = leg(x1, False) - leg(x2, False) + leg(y1, True) - leg(y2, True)
+        hit = 1.0 - _no_hit(eta, spot, barrier, sd, mu, x2, y2)
+
+    # 执行价在障碍之外（期权在触碰前不可能实值）或已越过障碍时敲出腿为 0
+    knocked = sign * (spot - barrier) >= 0
+    knock_out = np.where(knocked | (sign * (barrier - strike) <= 0), 0.0, np.maximum(knock_out, 0.0))
+    hit = np.where(knocked, 1.0, np.clip(hit, 0.0, 1.0))
+    # 到期（剩余期限为 0）时按内在价值
+    expired = maturity <= 0
+    if np.any(expired):
+        intrinsic = np.maximum(phi * (spot - strike), 0.0)
+        knock_out = np.where(expired, np.where(knocked, 0.0, intrinsic), knock_out)
+        hit = np.where(expired, knocked.astype(np.float64), hit)
+    price = participation * knock_out + rebate_rate * term_years * discount * hit
+    return price, hit
+
+
+def sharkfin_greeks(
+    direction, strike, barrier, participation, rebate_rate, term_years,
+    vol, rate=0.0, div_yield=0.0, spot=1.0, maturity=None, monitoring_dt=0.0,
+    spot_bump=SPOT_BUMP, vol_bump=VOL_BUMP
+):
+    """
+    解析价格与希腊字母（中心差分，参数同 sharkfin_value，均可为数组），返回 SharkfinGreeks。
+    整个参数网格的 6 次估值均为一次向量化调用。
+    """
+    maturity = term_years if maturity is None else maturity
+
+    def value(s=spot, sigma=vol, t=maturity):
+        return sharkfin_value(
+            direction, strike, barrier, participation, rebate_rate, term_years,
+            sigma, rate, div_yield, s, t, monitoring_dt,
+        )
+
+    spot = np.asarray(spot, dtype=np.float64)
+    vol = np.asarray(vol, dtype=np.float64)
+    price, hit = value()
+    up, _ = value(s=spot * (1 + spot_bump))
+    down, _ = value(s=spot * (1 - spot_bump))
+    vol_down = np.maximum(vol - vol_bump, 1e-6)
+    vega = (value(sigma=vol + vol_bump)[0] - value(sigma=vol_down)[0]) / (vol + vol_bump - vol_down)
+    theta = value(t=np.maximum(np.asarray(maturity) - DAY, 0.0))[0] - price
+    h = spot_bump * spot
+    return SharkfinGreeks(
+        price, (up - down) / (2 * h), (up - 2 * price + down) / (h * h), vega, theta, hit
+    )
+
+
+def sharkfin_payoff(direction, extreme, final, strike, barrier, participation, rebate_rate, term_years):
+    """
+    给定路径极值与期末价格（期初价倍数）的到期收益，参数均可为数组并广播。
+    extreme: 看涨为观察日最高价，看跌为观察日最低价
+    返回 (收益, 是否触碰障碍)。
+    """
+    sign = _sign(direction)
+    hit = sign * (np.asarray(extreme) - barrier) >= 0
+    vanilla = participation * np.maximum(sign * (np.asarray(final) - strike), 0.0)
+    return np.where(hit, rebate_rate * term_years, vanilla), hit
+
+
+def path_extremes(log_paths, direction, obs_idx=None):
+    """
+    对数价格路径 (路径数, 交易日) -> (观察日极值, 期末价格)，均为期初价倍数。
+    obs_idx: 障碍观察日下标，缺省为第 1 天起的每个交易日（第 0 天不观察）
+    """
+    observed = log_paths[:, 1:] if obs_idx is None else log_paths[:, np.asarray(obs_idx, dtype=np.int64)]
+    extreme = observed.max(axis=1) if _sign(direction) > 0 else observed.min(axis=1)
+    return np.exp(extreme.astype(np.float64)), np.exp(log_paths[:, -1].astype(np.float64))
+
+
+def evaluate_combos(direction, extreme, final, strike, barrier, participation, rebate_rate, term_years, discount=1.0):
+    """
+    在同一组路径（extreme / final）上评估所有参数组合（参数按 NumPy 规则广播），
+    按块计算以限制 (组合 × 路径) 的内存。返回 (均值, 标准误, 触碰比例)，形状为参数广播后的形状。
+    """
+    params = np.broadcast_arrays(
+        *(np.asarray(v, dtype=np.float64) for v in (strike, barrier, participation, rebate_rate, term_years))
+    )
+    shape = params[0].shape
+    flat = [p.ravel() for p in params]
+    n_combos, n_paths = len(flat[0]), len(final)
+    mean, std_error, hit_prob = (np.empty(n_combos) for _ in range(3))
+    block = max(1, COMBO_BLOCK // max(n_paths, 1))
+    for lo in range(0, n_combos, block):
+        k, b, p, r, t = (f[lo:lo + block, None] for f in flat)
+        payoff, hit = sharkfin_payoff(direction, extreme[None], final[None], k, b, p, r, t)
+        payoff *= discount
+        mean[lo:lo + block] = payoff.mean(axis=1)
+        std_error[lo:lo + block] = payoff.std(axis=1, ddof=1) / np.sqrt(n_paths) if n_paths > 1 else np.nan
+        hit_prob[lo:lo + block] = hit.mean(axis=1)
+    return mean.reshape(shape), std_error.reshape(shape), hit_prob.reshape(shape)
+
+
+def price_sharkfin_mc(
+    direction, strike, barrier, participation, rebate_rate, term_years,
+    vol, rate=0.0, div_yield=0.0, n_days=None, obs_idx=None, n_paths=100000, seed=None,
+    memory_mb=MEMORY_BUDGET_MB, dtype=np.float64
+):
+    """
+    离散观察障碍的蒙特卡洛定价（风险中性 GBM），返回 SharkfinMCResult。
+    term_years: 产品期限（年，标量）；n_days: 产品交易日数（含第 0 天），缺省按 term_years × 252 取整 + 1；
+    obs_idx: 障碍观察日下标，缺省为每个交易日；执行价 / 障碍 / 参与率 / 回报均可为数组，
+    所有组合共用同一组路径，路径只模拟一次。
+    """
+    _sign(direction)
+    horizon = float(term_years)
+    n_days = int(round(horizon / DAY)) + 1 if n_days is None else int(n_days)
+    times = np.arange(n_days) * (horizon / max(n_days - 1, 1))
+    model = GBMModel(vol, rate, div_yield)
+    rng = np.random.default_rng(seed)
+    chunk_size = chunk_size_for(n_days, memory_mb, dtype)
+    extremes, finals = [], []
+    for start in range(0, n_paths, chunk_size):
+        extreme, final = path_extremes(model.log_paths(rng, min(chunk_size, n_paths - start), times, dtype), direction, obs_idx)
+        extremes.append(extreme)
+        finals.append(final)
+    extreme, final = np.concatenate(extremes), np.concatenate(finals)
+    price, std_error, hit_prob = evaluate_combos(
+        direction, extreme, final, strike, barrier, participation, rebate_rate, term_years,
+        np.exp(-rate * horizon),
+    )
+    return SharkfinMCResult(price, std_error, hit_prob, n_paths)
@@ -0,0 +1,118 @@
+"""
+雪球产品路径估值内核。
+
+输入价格路径（单条 (N,) 或批量 (..., N)）和编译好的敲出日程，
+用累乘、minimum.accumulate 和首次命中掩码一次性得到敲入/敲出下标与收益，
+没有逐日的 Python 循环。页面与批量计算共用同一套规则：
+  * 第 0 天为产品起始日，不做任何观察；
+  * 每日观察敲入：收盘价 < 敲入点位即敲入，同一天先判断敲入再判断敲出；
+  * 到期观察敲入：未敲出且最后一天收盘价 < 敲入点位；
+  * 敲出：观察日收盘价 >= 当期敲出障碍点位，敲出后产品结束。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# 路径估值结果，字段形状均为 prices.shape[:-1]；未发生的事件下标记为 -1
+# knock_out_idx: 敲出发生的交易日下标；ko_obs: 敲出对应的观察日序号（原始列表中的位置）
+# knock_in_idx:  敲入发生的交易日下标；final_price: 产品结束日（敲出日或最后一天）的价格
+SnowballOutcome = namedtuple(
+    "SnowballOutcome", ["knock_out_idx", "ko_obs", "knock_in_idx", "final_price"]
+)
+
+
+def price_path(start_price, rets):
+    """
+    由日收益率生成价格路径，第 0 天为 start_price，长度比 rets 多 1。
+    按 p[j] = p[j-1] * (1 + r[j-1]) 逐项累乘，与逐日循环的舍入完全一致。
+    rets 可以是 (N-1,) 或 (..., N-1)。
+    """
+    rets = np.asarray(rets, dtype=np.float64)
+    head = np.full(rets.shape[:-1] + (1,), float(start_price))
+    return np.cumprod(np.concatenate([head, 1.0 + rets], axis=-1), axis=-1)
+
+
+def first_true(mask, axis=-1):
+    """沿 axis 返回第一个 True 的位置，全为 False 时返回 -1"""
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape[axis] == 0:
+        return np.full(np.delete(mask.shape, axis), -1, dtype=np.int64)
+    idx = np.argmax(mask, axis=axis)
+    return np.where(np.take_along_axis(mask, np.expand_dims(idx, axis), axis).squeeze(axis), idx, -1)
+
+
+def compile_knock_out(obs_day_idx, n_days):
+    """
+    把观察日的交易日下标编译成估值用的日程。
+    只保留落在 (0, n_days) 内的观察日（第 0 天不观察），按时间排序。
+    返回 (ko_idx, ko_obs)：观察日下标与其在原始列表中的序号。
+    """
+    obs_day_idx = np.asarray(obs_day_idx, dtype=np.int64)
+    ko_obs = np.flatnonzero((obs_day_idx > 0) & (obs_day_idx < n_days))
+    ko_obs = ko_obs[np.argsort(obs_day_idx[ko_obs], kind="stable")]
+    return obs_day_idx[ko_obs], ko_obs
+
+
+def evaluate_snowball(prices, ko_idx, ko_levels, ko_obs, knock_in_level, daily_knock_in=True):
+    """
+    评估价格路径上的敲入/敲出事件。
+    prices: (..., N) 价格路径，第 0 天为起始日；float32 路径按 float32 比较
+    ko_idx / ko_levels / ko_obs: compile_knock_out 编译出的观察日下标、对应障碍点位及原始序号
+    knock_in_level: 敲入点位；daily_knock_in: True 为每日观察，False 为到期观察
+    返回 SnowballOutcome。
+    """
+    prices = np.asarray(prices)
+    if prices.dtype != np.float32: # float32 路径按原精度比较，避免整块升精度拷贝
+        prices = prices.astype(np.float64, copy=False)
+    n_days = prices.shape[-1]
+    ko_idx = np.asarray(ko_idx, dtype=np.int64)
+    ko_obs = np.asarray(ko_obs, dtype=np.int64)
+    knock_in_level = prices.dtype.type(knock_in_level)
+
+    # 敲出：观察日价格与障碍逐一比较，取第一个命中的观察日
+    k = first_true(prices[..., ko_idx] >= np.asarray(ko_levels, dtype=prices.dtype))
+    knocked_out = k >= 0
+    knock_out_idx = np.where(knocked_out, ko_idx[np.maximum(k, 0)] if len(ko_idx) else -1, -1)
+    ko_obs_hit = np.where(knocked_out, ko_obs[np.maximum(k, 0)] if len(ko_obs) else -1, -1)
+    end_idx = np.where(knocked_out, knock_out_idx, n_days - 1)
+
+    # 敲入
+    if daily_knock_in:
+        # 第 1 天起的滚动最低价单调不增，仍高于敲入点位的天数即为首次敲入的位置
+        running_min = np.minimum.accumulate(prices[..., 1:], axis=-1)
+        first_below = (running_min >= knock_in_level).sum(axis=-1) + 1
+        knock_in_idx = np.where((first_below < n_days) & (first_below <= end_idx), first_below, -1)
+    else:
+        knock_in_idx = np.where(~knocked_out & (prices[..., -1] < knock_in_level), n_days - 1, -1)
+
+    final_price = np.take_along_axis(prices, np.expand_dims(end_idx, -1), -1).squeeze(-1)
+    return SnowballOutcome(knock_out_idx, ko_obs_hit, knock_in_idx, final_price)
+
+
+def snowball_payoff(
+    outcome, snowball_type, start_price, notional_principal,
+    obs_coupons, knock_in_strike_pct, participation_rate,
+    guaranteed_return, max_loss_ratio, dividend_rate, term_in_years
+):
+    """
+    按页面的结算规则计算每条路径的收益金额（与名义本金同单位）。
+    敲出：名义本金 × 当期敲出票息 × 存续交易日 / 365
+    敲入（雪球）：-min(max(0, 敲入执行价 - 期末价/期初价), 最大亏损) × 名义本金 × 参与率
+    敲入（三元雪球）：名义本金 × 敲入收益率
+    未敲入未敲出：名义本金 × 红利票息 × 产品期限（年）
+    """
+    coupons = np.asarray(obs_coupons, dtype=np.float64)
+    knocked_out = outcome.knock_out_idx >= 0
+    knocked_in = ~knocked_out & (outcome.knock_in_idx >= 0)
+
+    ko_coupon = coupons[np.maximum(outcome.ko_obs, 0)] if len(coupons) else 0.0
+    ko_payoff = notional_principal * ko_coupon * (outcome.knock_out_idx + 1) / 365
+
+    if snowball_type == "雪球":
+        raw_loss = np.maximum(0.0, knock_in_strike_pct - outcome.final_price / start_price)
+        ki_payoff = -np.minimum(raw_loss, max_loss_ratio) * notional_principal * participation_rate
+    else:
+        ki_payoff = np.full(np.shape(knocked_in), guaranteed_return * notional_principal)
+
+    hold_payoff = notional_principal * dividend_rate * term_in_years
+    return np.select([knocked_out, knocked_in], [ko_payoff, ki_payoff], hold_payoff)
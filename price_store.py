@@ -0,0 +1,565 @@
+"""
+行情数据列式存储。
+
+把 {code}_daily.xlsx 转换成每个标的一组 NumPy 列文件（date/close 及派生的
+ret/log_ret/vol），读取时以内存映射方式打开，不再每次用 openpyxl 解析整个工作簿。
+源文件的修改时间、大小和哈希记录在 meta.json 中，源文件变化后自动更新：
+能确认只是在末尾追加了新行时只导入新增行（见 ingest），否则全量重建。
+
+进程内每个标的只加载一份 PriceIndex，所有会话、所有日期区间共享，
+区间查询用 searchsorted 二分定位并返回视图，不复制数据。
+多个标的需要重建时，用有界进程池并发解析源文件。
+
+命令行：python price_store.py ingest [代码 ...] [--full]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 数据目录与 api.py 一致：项目根目录
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+# 列式存储目录，每个标的一个子目录
+STORE_PATH = os.path.join(BASE_PATH, ".price_store")
+# 存储格式版本，格式变化时递增以强制重建
+STORE_VERSION = 2
+# 并发重建存储时的最大进程数
+MAX_LOAD_WORKERS = 4
+# 存储的列：日期、收盘价、简单收益率、对数收益率、滚动年化波动率
+COLUMNS = ("date", "close", "ret", "log_ret", "vol")
+# 滚动波动率窗口（交易日）及年化天数
+ROLLING_WINDOW = 20
+TRADING_DAYS_PER_YEAR = 252
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+# Excel 日期序列号的零点（1900 日期系统）
+_EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+
+_build_lock = threading.Lock()
+_index_lock = threading.Lock()
+# 进程级索引缓存：code -> PriceIndex
+_INDEXES = {}
+
+
+def source_path(code):
+    """标的代码（如 "000852.SH"）对应的 xlsx 源文件路径"""
+    base = code.split('.')[0]
+    return os.path.join(BASE_PATH, f"{base}_daily.xlsx")
+
+
+def store_dir(code):
+    """标的代码对应的列式存储目录"""
+    return os.path.join(STORE_PATH, code.split('.')[0])
+
+
+def available_codes():
+    """数据目录下所有 *_daily.xlsx 对应的标的代码（不带交易所后缀）"""
+    paths = glob.glob(os.path.join(BASE_PATH, "*_daily.xlsx"))
+    return sorted(os.path.basename(p)[:-len("_daily.xlsx")] for p in paths)
+
+
+def _file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _source_stat(path):
+    st_ = os.stat(path)
+    return {"mtime_ns": st_.st_mtime_ns, "size": st_.st_size}
+
+
+def read_meta(code):
+    """读取存储元数据，不存在或损坏时返回 None"""
+    try:
+        with open(os.path.join(store_dir(code), "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(code, meta):
+    path = os.path.join(store_dir(code), "meta.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def _save_column(code, name, arr):
+    # 先写临时文件再原子替换，避免读者看到写了一半的文件
+    path = os.path.join(store_dir(code), f"{name}.npy")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _append_column(code, name, values):
+    """
+    在 .npy 文件末尾原地追加数据并改写头部中的 shape。
+    np.save 写出的头部预留了 shape 增长的空间；放不下时返回 False，由调用方全量重建。
+    先写数据再改头部，中途失败时文件仍按旧长度可读。
+    """
+    path = os.path.join(store_dir(code), f"{name}.npy")
+    with open(path, "r+b") as f:
+        major, _ = np.lib.format.read_magic(f)
+        if major == 1:
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            len_size = 2
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            len_size = 4
+        data_start = f.tell()
+        if fortran or len(shape) != 1:
+            return False
+
+        header = repr({
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": False,
+            "shape": (shape[0] + len(values),),
+        })
+        header_start = np.lib.format.MAGIC_LEN + len_size
+        space = data_start - header_start
+        if len(header) + 1 > space:
+            return False
+
+        f.seek(data_start + shape[0] * dtype.itemsize)
+        f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        f.truncate()
+        f.flush()
+        f.seek(header_start)
+        f.write((header.ljust(space - 1) + "\n").encode("latin1"))
+    return True
+
+
+def compute_returns(close):
+    """由收盘价计算 (简单收益率, 对数收益率)，首日及缺失价格处记为 0"""
+    ret = np.zeros(len(close))
+    log_ret = np.zeros(len(close))
+    if len(close) > 1:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = close[1:] / close[:-1]
+            ret[1:] = ratio - 1.0
+            log_ret[1:] = np.log(ratio)
+    ret[~np.isfinite(ret)] = 0.0
+    log_ret[~np.isfinite(log_ret)] = 0.0
+    return ret, log_ret
+
+
+def rolling_vol(log_ret, window=ROLLING_WINDOW):
+    """滚动年化波动率：窗口内对数收益率的样本标准差 × sqrt(252)，不足一个窗口处为 NaN"""
+    vol = np.full(len(log_ret), np.nan)
+    if len(log_ret) >= window:
+        vol[window - 1:] = sliding_window_view(log_ret, window).std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR)
+    return vol
+
+
+def derive_columns(close):
+    """由收盘价计算派生列 ret / log_ret / vol"""
+    ret, log_ret = compute_returns(close)
+    return {"ret": ret, "log_ret": log_ret, "vol": rolling_vol(log_ret)}
+
+
+def read_source(code):
+    """解析 xlsx 源文件，返回按日期升序、日期唯一的 (dates, close) 数组"""
+    df = pd.read_excel(source_path(code), usecols=['date', 'close'], engine="openpyxl")
+    dates = pd.to_datetime(df['date']).values.astype("datetime64[D]")
+    close = pd.to_numeric(df['close'], errors="coerce").to_numpy(dtype=np.float64)
+    valid = ~np.isnat(dates)
+    dates, close = dates[valid], close[valid]
+    order = np.argsort(dates, kind="stable")
+    dates, close = dates[order], close[order]
+    # 同一日期出现多行时保留最后一行
+    keep = np.ones(len(dates), dtype=bool)
+    keep[:-1] = dates[1:] != dates[:-1]
+    return dates[keep], close[keep]
+
+
+def _sheet_xml(src):
+    """读取工作簿第一个工作表（与 pd.read_excel 默认一致）的原始 XML"""
+    with zipfile.ZipFile(src) as zf:
+        workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+        sheet = workbook.find(f"{{{_NS_MAIN}}}sheets/{{{_NS_MAIN}}}sheet")
+        rid = sheet.get(f"{{{_NS_REL}}}id")
+        rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+        target = next(r.get("Target") for r in rels if r.get("Id") == rid)
+        path = target.lstrip("/") if target.startswith("/") else "xl/" + target
+        return zf.read(path)
+
+
+def _read_sheet_rows(xml, first_row, date_col, close_col):
+    """
+    解析工作表 XML 中第 first_row 行及之后的数据行，返回 [(行号, 日期, 收盘价), ...]。
+    直接定位到该行的字节位置，只解析尾部片段；格式不符合预期时返回 None。
+    """
+    pos = xml.find(b'<row r="%d"' % first_row)
+    end = xml.rfind(b"</sheetData>")
+    if pos < 0 or end < pos:
+        return None
+    fragment = (f'<sheetData xmlns="{_NS_MAIN}">'.encode() + xml[pos:end] + b"</sheetData>")
+
+    rows = []
+    for row in ET.fromstring(fragment):
+        date, close = None, np.nan
+        for cell in row:
+            col = cell.get("r", "").rstrip("0123456789")
+            value = cell.find(f"{{{_NS_MAIN}}}v")
+            if value is None or value.text is None:
+                continue
+            numeric = cell.get("t") in (None, "n")
+            if col == date_col:
+                # 只处理以序列号存储的日期，文本日期交给全量解析
+                if not numeric:
+                    return None
+                date = _EXCEL_EPOCH + int(np.floor(float(value.text)))
+            elif col == close_col and numeric:
+                close = float(value.text)
+        if date is not None:
+            rows.append((int(row.get("r")), date, close))
+    return rows
+
+
+def _source_layout(src, last_date, last_close):
+    """
+    记录增量导入需要的源文件布局：date/close 所在列，以及最后一个数据行（衔接行）。
+    文件不是按日期升序追加的、或无法定位时返回空 dict，此后该文件只做全量重建。
+    """
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(src, read_only=True)
+        try:
+            header = next(wb.worksheets[0].iter_rows(min_row=1, max_row=1))
+            cols = {cell.value: cell.column_letter for cell in header if getattr(cell, "value", None)}
+        finally:
+            wb.close()
+        if "date" not in cols or "close" not in cols:
+            return {}
+
+        xml = _sheet_xml(src)
+        pos = xml.rfind(b'<row r="')
+        if pos < 0:
+            return {}
+        last_row = int(xml[pos + 8:xml.index(b'"', pos + 8)])
+        rows = _read_sheet_rows(xml, last_row, cols["date"], cols["close"])
+    except (OSError, KeyError, ValueError, StopIteration, ET.ParseError, zipfile.BadZipFile):
+        return {}
+
+    if not rows or rows[-1][1] != last_date or not _same_price(rows[-1][2], last_close):
+        return {}
+    return {
+        "date_col": cols["date"],
+        "close_col": cols["close"],
+        "anchor_row": rows[-1][0],
+        "anchor_date": str(last_date),
+        "anchor_close": float(last_close),
+    }
+
+
+def _same_price(a, b):
+    return (np.isnan(a) and np.isnan(b)) or a == b
+
+
+def build_store(code):
+    """全量解析源文件并重写列式存储"""
+    src = source_path(code)
+    meta = dict(_source_stat(src), sha1=_file_digest(src))
+    dates, close = read_source(code)
+    columns = dict(date=dates, close=close, **derive_columns(close))
+    os.makedirs(store_dir(code), exist_ok=True)
+    for name in COLUMNS:
+        _save_column(code, name, columns[name])
+    meta.update(version=STORE_VERSION, rows=int(len(dates)))
+    if len(dates):
+        meta.update(_source_layout(src, dates[-1], close[-1]))
+    _write_meta(code, meta)
+    return meta
+
+
+def _open_columns(code):
+    d = store_dir(code)
+    return {name: np.load(os.path.join(d, f"{name}.npy"), mmap_mode="r") for name in COLUMNS}
+
+
+def _append_tail(code, meta, src):
+    """
+    只解析衔接行之后新增的行，增量计算派生列并追加到存储，返回新增行数。
+    衔接行对不上（历史被改动）、没有新行或新行日期不递增时返回 None。
+    """
+    if "anchor_row" not in meta:
+        return None
+    rows = _read_sheet_rows(_sheet_xml(src), meta["anchor_row"], meta["date_col"], meta["close_col"])
+    if not rows or rows[0][0] != meta["anchor_row"]:
+        return None
+    if str(rows[0][1]) != meta["anchor_date"] or not _same_price(rows[0][2], meta["anchor_close"]):
+        return None
+    new_rows = rows[1:]
+    if not new_rows:
+        return None
+
+    dates = np.array([r[1] for r in new_rows], dtype="datetime64[D]")
+    close = np.array([r[2] for r in new_rows], dtype=np.float64)
+    if dates[0] <= np.datetime64(meta["anchor_date"]) or np.any(np.diff(dates) <= np.timedelta64(0, "D")):
+        return None
+
+    stored = _open_columns(code)
+    n = len(stored["date"])
+    if n != meta["rows"]:
+        return None
+    # 收益率只需要上一交易日的收盘价，滚动波动率只需要最近 window-1 个对数收益率
+    ret, log_ret = compute_returns(np.concatenate([stored["close"][-1:], close]))
+    ret, log_ret = ret[1:], log_ret[1:]
+    prev_log = np.asarray(stored["log_ret"][max(0, n - ROLLING_WINDOW + 1):])
+    vol = rolling_vol(np.concatenate([prev_log, log_ret]))[len(prev_log):]
+    del stored
+
+    new_columns = {"date": dates, "close": close, "ret": ret, "log_ret": log_ret, "vol": vol}
+    for name in COLUMNS:
+        if not _append_column(code, name, new_columns[name]):
+            return None
+
+    meta.update(
+        rows=n + len(dates),
+        anchor_row=new_rows[-1][0],
+        anchor_date=str(dates[-1]),
+        anchor_close=float(close[-1]),
+    )
+    return len(dates)
+
+
+def ingest(code, full=False):
+    """
+    把源文件新增的尾部行导入列式存储，返回 (meta, 新增行数)。
+    只解析上次导入位置之后的行，收益率和滚动波动率也只对新增行计算，代价与新增行数成正比
+    （xlsx 是压缩的 XML，解压和定位仍需扫描整个文件，但不再逐行解析历史数据）。
+    首次导入、格式版本变化、衔接行对不上、没有新行或日期不递增时退化为全量重建，新增行数记为 -1。
+    """
+    src = source_path(code)
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"文件不存在：{src}")
+
+    with _build_lock:
+        stat = _source_stat(src)
+        meta = read_meta(code)
+        if not full and _is_fresh(meta, stat):
+            return meta, 0
+        if full or not meta or meta.get("version") != STORE_VERSION:
+            return build_store(code), -1
+
+        digest = _file_digest(src)
+        if meta.get("sha1") == digest:
+            meta.update(stat)
+            _write_meta(code, meta)
+            return meta, 0
+
+        try:
+            appended = _append_tail(code, meta, src)
+        except (OSError, KeyError, ValueError, ET.ParseError, zipfile.BadZipFile):
+            appended = None
+        if appended is None:
+            return build_store(code), -1
+        meta.update(stat, sha1=digest)
+        _write_meta(code, meta)
+        return meta, appended
+
+
+def _is_fresh(meta, stat):
+    return bool(meta) and meta.get("version") == STORE_VERSION and all(meta.get(k) == v for k, v in stat.items())
+
+
+def is_fresh(code):
+    """只比较修改时间和大小，判断存储是否无需更新；源文件不存在时抛出 FileNotFoundError"""
+    src = source_path(code)
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"文件不存在：{src}")
+    return _is_fresh(read_meta(code), _source_stat(src))
+
+
+def ensure_store(code):
+    """
+    确保列式存储与源文件一致，返回元数据。
+    先比较修改时间和大小；两者变化但哈希不变（例如仅被 touch）时只刷新元数据，
+    内容变化时优先增量导入新增行。
+    """
+    src = source_path(code)
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"文件不存在：{src}")
+
+    meta = read_meta(code)
+    if _is_fresh(meta, _source_stat(src)):
+        return meta
+    return ingest(code)[0]
+
+
+def load_store(code):
+    """返回各列的内存映射数组 {name: ndarray}，date 为升序 datetime64[D]"""
+    meta = ensure_store(code)
+    try:
+        columns = _open_columns(code)
+        if all(len(arr) == meta["rows"] for arr in columns.values()):
+            return columns
+    except (OSError, ValueError):
+        pass
+    # 列文件缺失或长度不一致（例如上次追加被中断），全量重建
+    with _build_lock:
+        build_store(code)
+    return _open_columns(code)
+
+
+def to_day(value):
+    """把字符串/date/Timestamp/datetime64 统一转换为 datetime64[D]"""
+    if isinstance(value, np.datetime64):
+        return value.astype("datetime64[D]")
+    return np.datetime64(pd.Timestamp(value).date(), "D")
+
+
+# 区间切片结果：各字段均为索引数据的只读视图
+# ret / log_ret 为相对前一交易日的收益率，整段历史的第一天记为 0
+# vol 为截至当日的 20 日滚动年化波动率，历史前 19 天为 NaN
+PriceSeries = namedtuple("PriceSeries", ["dates", "close", "ret", "log_ret", "vol"])
+
+
+class PriceIndex:
+    """
+    单个标的的只读价格索引。
+    dates: 升序 datetime64[D]；close: float64 收盘价；
+    ret / log_ret / vol: 存储中的简单/对数日收益率及滚动波动率。
+    各列直接使用存储文件的只读内存映射（不复制到进程内存），切片返回视图；
+    多个进程（含进程池中的工作进程）共享操作系统的页缓存。
+    """
+    __slots__ = ("code", "dates", "close", "ret", "log_ret", "vol", "version")
+
+    def __init__(self, code, columns, version):
+        # 以普通 ndarray 视图持有映射，切片与运算结果不再是 np.memmap
+        arrays = {name: columns[name].view(np.ndarray) for name in COLUMNS}
+        self.code = code
+        self.dates = arrays["date"]
+        self.close = arrays["close"]
+        self.ret = arrays["ret"]
+        self.log_ret = arrays["log_ret"]
+        self.vol = arrays["vol"]
+        self.version = version
+
+    def __len__(self):
+        return len(self.dates)
+
+    def locate(self, start=None, end=None):
+        """返回闭区间 [start, end] 对应的下标范围 (lo, hi)，hi 为开区间"""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, to_day(start), side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, to_day(end), side="right"))
+        return lo, max(lo, hi)
+
+    def slice(self, start=None, end=None):
+        """返回区间内 (dates, close) 的视图"""
+        lo, hi = self.locate(start, end)
+        return self.dates[lo:hi], self.close[lo:hi]
+
+    def series(self, start=None, end=None):
+        """返回区间内日期、价格、收益率及波动率的视图"""
+        lo, hi = self.locate(start, end)
+        return PriceSeries(self.dates[lo:hi], self.close[lo:hi], self.ret[lo:hi],
+                           self.log_ret[lo:hi], self.vol[lo:hi])
+
+
+def _meta_version(meta):
+    return (meta.get("sha1"), meta.get("rows"))
+
+
+def get_index(code):
+    """
+    获取标的的进程级价格索引；首次调用时从列式存储加载，
+    之后只有源文件内容变化时才重新加载。
+    """
+    meta = ensure_store(code)
+    version = _meta_version(meta)
+    idx = _INDEXES.get(code)
+    if idx is not None and idx.version == version:
+        return idx
+
+    with _index_lock:
+        idx = _INDEXES.get(code)
+        if idx is None or idx.version != version:
+            idx = PriceIndex(code, load_store(code), version)
+            _INDEXES[code] = idx
+        return idx
+
+
+def load_indexes(codes, max_workers=MAX_LOAD_WORKERS):
+    """
+    并发加载多个标的的价格索引。
+    需要重建的存储（xlsx 解析受 GIL 限制）交给最多 max_workers 个进程并行处理，
+    单个标的失败不影响其他标的。
+    返回 (indexes, errors)：{code: PriceIndex} 与 {code: Exception}。
+    """
+    codes = list(dict.fromkeys(codes))
+    indexes, errors = {}, {}
+
+    stale = []
+    for code in codes:
+        try:
+            if not is_fresh(code):
+                stale.append(code)
+        except Exception as e:
+            errors[code] = e
+
+    # 只有一个标的需要重建或只有单核时直接在当前进程处理，省去进程池启动开销
+    workers = min(max_workers, len(stale), os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(ensure_store, code): code for code in stale}
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except Exception as e:
+                    errors[futures[fut]] = e
+
+    for code in codes:
+        if code in errors:
+            continue
+        try:
+            indexes[code] = get_index(code)
+        except Exception as e:
+            errors[code] = e
+    return indexes, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="行情数据列式存储维护")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_ingest = sub.add_parser("ingest", help="导入 *_daily.xlsx 新增的行（每日收盘后运行）")
+    p_ingest.add_argument("codes", nargs="*", help="标的代码，缺省时处理数据目录下全部 *_daily.xlsx")
+    p_ingest.add_argument("--full", action="store_true", help="忽略已有存储，全量重建")
+    args = parser.parse_args(argv)
+
+    status = 0
+    for code in args.codes or available_codes():
+        try:
+            meta, added = ingest(code, full=args.full)
+        except Exception as e:
+            print(f"{code}: 导入失败：{e}", file=sys.stderr)
+            status = 1
+            continue
+        if added < 0:
+            print(f"{code}: 全量重建，共 {meta['rows']} 行")
+        else:
+            print(f"{code}: 新增 {added} 行，共 {meta['rows']} 行")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
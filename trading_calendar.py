@@ -0,0 +1,135 @@
+"""
+交易日历。
+
+由各 *_daily.xlsx 中出现过的交易日取并集构建；历史数据之后的未来日期按
+工作日扣除交易所休市日（HOLIDAYS，可追加）推算。
+日期与整数下标一一对应，观察日等日程编译成下标数组后，模拟循环只做整数运算。
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from price_store import available_codes, load_indexes
+
+# 沪深交易所休市安排中落在工作日的日期，用于推算历史数据之后的交易日；
+# 历史区间内以实际行情日期为准。新年度安排公布后在此补充，或通过 extra_holidays 传入。
+HOLIDAYS = (
+    # 2025
+    "2025-01-01",
+    "2025-01-28", "2025-01-29", "2025-01-30", "2025-01-31", "2025-02-03", "2025-02-04",
+    "2025-04-04",
+    "2025-05-01", "2025-05-02", "2025-05-05",
+    "2025-06-02",
+    "2025-10-01", "2025-10-02", "2025-10-03", "2025-10-06", "2025-10-07", "2025-10-08",
+    # 2026
+    "2026-01-01", "2026-01-02",
+    "2026-02-16", "2026-02-17", "2026-02-18", "2026-02-19", "2026-02-20", "2026-02-23",
+    "2026-04-06",
+    "2026-05-01", "2026-05-04", "2026-05-05",
+    "2026-06-19",
+    "2026-09-25",
+    "2026-10-01", "2026-10-02", "2026-10-05", "2026-10-06", "2026-10-07",
+)
+# 历史数据之后向后推算的年数
+FUTURE_YEARS = 10
+
+_calendar_lock = threading.Lock()
+# 进程级日历缓存：extra_holidays -> (版本, TradingCalendar)
+_CALENDARS = {}
+
+
+def to_days(values):
+    """把日期序列（date/字符串/Timestamp/datetime64）统一转换为 datetime64[D] 数组"""
+    arr = np.asarray(values)
+    if arr.dtype.kind == "M":
+        return arr.astype("datetime64[D]")
+    return pd.DatetimeIndex(np.atleast_1d(arr)).values.astype("datetime64[D]").reshape(arr.shape)
+
+
+class TradingCalendar:
+    """
+    交易日历：升序、不重复的 datetime64[D] 交易日数组。
+    last_history_date 之前的日期来自行情数据，之后为推算日期。
+    """
+    __slots__ = ("dates", "last_history_date")
+
+    def __init__(self, dates, last_history_date):
+        dates = np.array(dates, dtype="datetime64[D]")
+        dates.flags.writeable = False
+        self.dates = dates
+        self.last_history_date = last_history_date
+
+    def __len__(self):
+        return len(self.dates)
+
+    def index_of(self, dates, roll="following"):
+        """
+        把日期（单个或序列）转换为交易日下标。
+        roll="following"：非交易日顺延到下一交易日；"preceding"：提前到上一交易日；
+        "exact"：遇到非交易日抛出 ValueError。超出日历范围时抛出 ValueError。
+        """
+        days = to_days(dates)
+        if roll == "preceding":
+            idx = np.searchsorted(self.dates, days, side="right") - 1
+        else:
+            idx = np.searchsorted(self.dates, days, side="left")
+        if np.any(idx < 0) or np.any(idx >= len(self.dates)):
+            raise ValueError("日期超出交易日历范围")
+        if roll == "exact" and np.any(self.dates[idx] != days):
+            raise ValueError("存在非交易日")
+        return int(idx) if np.ndim(idx) == 0 else idx
+
+    def is_trading_day(self, dates):
+        days = to_days(dates)
+        idx = np.clip(np.searchsorted(self.dates, days), 0, len(self.dates) - 1)
+        return self.dates[idx] == days
+
+    def window(self, start, end):
+        """
+        返回 [start, end] 对应的下标范围 (lo, hi)，hi 为开区间；
+        start/end 落在非交易日时均顺延到下一交易日。
+        """
+        lo = self.index_of(start)
+        hi = self.index_of(end) + 1
+        return lo, max(lo, hi)
+
+    def sessions(self, start, end):
+        """[start, end] 内的交易日（视图）"""
+        lo, hi = self.window(start, end)
+        return self.dates[lo:hi]
+
+
+def build_calendar(indexes, extra_holidays=()):
+    """由价格索引的日期并集加上推算的未来交易日构建日历"""
+    history = [idx.dates for idx in indexes.values() if len(idx)]
+    if not history:
+        raise ValueError("没有可用的行情数据，无法构建交易日历")
+    hist_dates = np.unique(np.concatenate(history))
+    last = hist_dates[-1]
+
+    holidays = to_days(list(HOLIDAYS) + list(extra_holidays))
+    future_end = last + np.timedelta64(366 * FUTURE_YEARS, "D")
+    future = np.arange(last + np.timedelta64(1, "D"), future_end, dtype="datetime64[D]")
+    future = future[np.is_busday(future, holidays=holidays)]
+    return TradingCalendar(np.concatenate([hist_dates, future]), last)
+
+
+def get_calendar(extra_holidays=()):
+    """
+    获取进程级交易日历；行情数据变化（如每日导入新行）后自动重建。
+    extra_holidays: 追加的未来休市日
+    """
+    key = tuple(str(d) for d in extra_holidays)
+    indexes, _ = load_indexes(available_codes())
+    version = tuple(sorted((code, idx.version) for code, idx in indexes.items()))
+    cached = _CALENDARS.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _calendar_lock:
+        cached = _CALENDARS.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, build_calendar(indexes, extra_holidays))
+            _CALENDARS[key] = cached
+        return cached[1]